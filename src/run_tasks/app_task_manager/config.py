@@ -7,12 +7,87 @@ __author__ = "ipetrash"
 import sys
 from typing import Any
 
-from run_tasks.config import CONFIG
+from run_tasks.config import CONFIG, CONFIG_NOTIFICATION
+from run_tasks.db import CompressionEnum
 
 CONFIG_MANAGER: dict[str, Any] = CONFIG["manager"]
 
 ENCODING: str = CONFIG_MANAGER["encoding"] or sys.getdefaultencoding()
 PATTERN_FILE_TASK_COMMAND: str = CONFIG_MANAGER["pattern_file_task_command"]
-STORAGE_PERIOD_OF_TASK_RUN_IN_DAYS: int = CONFIG_MANAGER["storage_period"][
+CONFIG_STORAGE_PERIOD: dict[str, Any] = CONFIG_MANAGER["storage_period"]
+STORAGE_PERIOD_OF_TASK_RUN_IN_DAYS: int | None = CONFIG_STORAGE_PERIOD[
     "task_run_in_days"
 ]
+# NOTE: Логи старше срока переносятся из базы в сжатые файлы, а после срока
+#       хранения архива удаляются. None - не переносить / не удалять
+STORAGE_PERIOD_OF_LOGS_IN_DAYS: int | None = CONFIG_STORAGE_PERIOD["logs_in_days"]
+STORAGE_PERIOD_OF_ARCHIVED_LOGS_IN_DAYS: int | None = CONFIG_STORAGE_PERIOD[
+    "archived_logs_in_days"
+]
+
+CONFIG_PURGE: dict[str, Any] = CONFIG_MANAGER["purge"]
+PURGE_RUN_BATCH_SIZE: int = CONFIG_PURGE["run_batch_size"]
+PURGE_LOG_BATCH_SIZE: int = CONFIG_PURGE["log_batch_size"]
+# NOTE: Сколько времени за один проход обслуживания (раз в минуту) можно
+#       тратить на удаление устаревших запусков
+PURGE_TIME_BUDGET_SECS: float = CONFIG_PURGE["time_budget_secs"]
+PURGE_INCREMENTAL_VACUUM_PAGES: int = CONFIG_PURGE["incremental_vacuum_pages"]
+PURGE_WAL_CHECKPOINT: bool = CONFIG_PURGE["wal_checkpoint"]
+
+CONFIG_LOG_WRITER: dict[str, Any] = CONFIG_MANAGER["log_writer"]
+LOG_WRITER_MAX_LINES: int = CONFIG_LOG_WRITER["max_lines"]
+LOG_WRITER_MAX_BYTES: int = CONFIG_LOG_WRITER["max_bytes"]
+LOG_WRITER_FLUSH_INTERVAL_SECS: float = CONFIG_LOG_WRITER["flush_interval_secs"]
+
+CONFIG_LOG_STORAGE: dict[str, Any] = CONFIG_MANAGER["log_storage"]
+# NOTE: "rows" - строка лога в отдельной записи, "chunks" - логи завершенных
+#       запусков упаковываются в сжатые чанки
+LOG_STORAGE_BACKEND: str = CONFIG_LOG_STORAGE["backend"]
+if LOG_STORAGE_BACKEND not in ("rows", "chunks"):
+    raise ValueError(f"Неизвестный вид хранения логов {LOG_STORAGE_BACKEND!r}")
+LOG_STORAGE_IS_CHUNKS: bool = LOG_STORAGE_BACKEND == "chunks"
+LOG_STORAGE_CHUNK_LINES: int = CONFIG_LOG_STORAGE["chunk_lines"]
+LOG_STORAGE_COMPRESSION: CompressionEnum = CompressionEnum(
+    CONFIG_LOG_STORAGE["compression"]
+)
+
+CONFIG_EXECUTOR: dict[str, Any] = CONFIG_MANAGER["executor"]
+# NOTE: "threads" - поток на каждую задачу, "pool" - запуски выполняются общим
+#       пулом из max_workers исполнителей
+EXECUTOR_MODE: str = CONFIG_EXECUTOR["mode"]
+if EXECUTOR_MODE not in ("threads", "pool"):
+    raise ValueError(f"Неизвестный режим исполнителя {EXECUTOR_MODE!r}")
+EXECUTOR_MAX_WORKERS: int = CONFIG_EXECUTOR["max_workers"]
+EXECUTOR_MAX_RUNS_PER_TASK: int = CONFIG_EXECUTOR["max_runs_per_task"]
+# NOTE: "threads" - потоки на каждый процесс и его вывод, "asyncio" - все процессы
+#       обслуживаются одним потоком с циклом событий
+EXECUTOR_PROCESS_SUPERVISOR: str = CONFIG_EXECUTOR["process_supervisor"]
+if EXECUTOR_PROCESS_SUPERVISOR not in ("threads", "asyncio"):
+    raise ValueError(
+        f"Неизвестный вид обслуживания процессов {EXECUTOR_PROCESS_SUPERVISOR!r}"
+    )
+# NOTE: Как часто выполняемый запуск проверяет в базе, не нужно ли остановиться
+EXECUTOR_STOP_CHECK_INTERVAL_SECS: float = CONFIG_EXECUTOR["stop_check_interval_secs"]
+
+CONFIG_NOTIFICATION_DISPATCHER: dict[str, Any] = CONFIG_NOTIFICATION["dispatcher"]
+NOTIFICATION_WORKERS_PER_KIND: int = CONFIG_NOTIFICATION_DISPATCHER["workers_per_kind"]
+NOTIFICATION_BATCH_SIZE: int = CONFIG_NOTIFICATION_DISPATCHER["batch_size"]
+NOTIFICATION_RETRY_BASE_DELAY_SECS: float = CONFIG_NOTIFICATION_DISPATCHER[
+    "retry_base_delay_secs"
+]
+NOTIFICATION_RETRY_MAX_DELAY_SECS: float = CONFIG_NOTIFICATION_DISPATCHER[
+    "retry_max_delay_secs"
+]
+# NOTE: Уведомления запусков задачи в течение окна после отправки предыдущего
+#       объединяются в одно сводное, 0 - не объединять
+NOTIFICATION_COALESCE_WINDOW_SECS: float = CONFIG_NOTIFICATION_DISPATCHER[
+    "coalesce_window_secs"
+]
+# NOTE: Писем подряд в одной сессии с почтовым сервером
+NOTIFICATION_EMAIL_BATCH_SIZE: int = CONFIG_NOTIFICATION["email"]["connection_pool"][
+    "batch_size"
+]
+# NOTE: Уведомлений телеграма подряд у одного отправителя или в одном запросе
+NOTIFICATION_TELEGRAM_BATCH_SIZE: int = CONFIG_NOTIFICATION["telegram"][
+    "connection_pool"
+]["batch_size"]
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Any, Self
+
+from playhouse.sqliteq import SqliteQueueDatabase
+
+from run_tasks.app_task_manager.common import log_manager as log
+from run_tasks.app_task_manager.config import (
+    LOG_WRITER_MAX_LINES,
+    LOG_WRITER_MAX_BYTES,
+    LOG_WRITER_FLUSH_INTERVAL_SECS,
+)
+from run_tasks.db import TaskRun, TaskRunLog, LogKindEnum
+from run_tasks.db_queue import GroupCommitQueueDatabase
+
+
+class TaskRunLogWriter:
+    """
+    Буферизированная запись логов запуска.
+    Строки накапливаются и записываются в базу одним запросом при достижении
+    лимита по количеству строк, по размеру или по прошествии интервала времени
+    """
+
+    def __init__(
+        self,
+        task_run: TaskRun,
+        max_lines: int = LOG_WRITER_MAX_LINES,
+        max_bytes: int = LOG_WRITER_MAX_BYTES,
+        flush_interval_secs: float = LOG_WRITER_FLUSH_INTERVAL_SECS,
+    ) -> None:
+        self.task_run = task_run
+
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.flush_interval_secs = flush_interval_secs
+
+        self._items: list[tuple[str, LogKindEnum, datetime]] = []
+        self._size: int = 0
+
+        # Защита буфера
+        self._lock = threading.Lock()
+
+        # Сохранение порядка записей между сбросами из разных потоков
+        self._flush_lock = threading.Lock()
+
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self.number_of_lines: int = 0
+        self.number_of_dropped_lines: int = 0
+        self.number_of_flushes: int = 0
+        self.last_flush_latency_secs: float = 0.0
+        self.max_flush_latency_secs: float = 0.0
+        self._total_flush_latency_secs: float = 0.0
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def start(self) -> None:
+        if self._thread:
+            return
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"{type(self).__name__}-{self.task_run.id}",
+            daemon=True,  # Thread dies with the program
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop_event.set()
+
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.flush_interval_secs):
+            try:
+                self.flush()
+            except Exception:
+                log.exception(f"Ошибка при записи логов запуска #{self.task_run.id}:")
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._items)
+
+    def write(self, text: str, kind: LogKindEnum, end: str = "\n") -> None:
+        text = text + end
+
+        with self._lock:
+            self._items.append((text, kind, datetime.now()))
+            self._size += len(text.encode("utf-8"))
+
+            need_flush = (
+                len(self._items) >= self.max_lines or self._size >= self.max_bytes
+            )
+
+        if need_flush:
+            self.flush()
+
+    def write_out(self, text: str, end: str = "\n") -> None:
+        self.write(text=text, kind=LogKindEnum.OUT, end=end)
+
+    def write_err(self, text: str, end: str = "\n") -> None:
+        self.write(text=text, kind=LogKindEnum.ERR, end=end)
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                items, self._items = self._items, []
+                self._size = 0
+
+            if not items:
+                return
+
+            # Логи вывода можно отбросить при заполненной очереди записи в базу
+            # (BackpressureEnum.DROP_TASK_OUTPUT)
+            database = TaskRunLog._meta.database
+            is_droppable: bool = isinstance(database, GroupCommitQueueDatabase) and all(
+                kind == LogKindEnum.OUT for _, kind, _ in items
+            )
+
+            start_time = time.perf_counter()
+            with (
+                database.droppable() if is_droppable else nullcontext()
+            ) as droppable_writes:
+                self.task_run.add_logs(items)
+            latency_secs = time.perf_counter() - start_time
+
+            if droppable_writes and droppable_writes.number_of_dropped:
+                # Отметка о пропуске не отбрасывается и ждет места в очереди
+                self.number_of_dropped_lines += len(items)
+                self.task_run.add_log_out(
+                    f"[Пропущено строк вывода: {len(items)}, "
+                    f"очередь записи в базу переполнена]"
+                )
+            else:
+                self.number_of_lines += len(items)
+
+            self.number_of_flushes += 1
+            self.last_flush_latency_secs = latency_secs
+            self.max_flush_latency_secs = max(self.max_flush_latency_secs, latency_secs)
+            self._total_flush_latency_secs += latency_secs
+
+    def get_stats(self) -> dict[str, Any]:
+        database = TaskRunLog._meta.database
+
+        return dict(
+            queue_depth=self.queue_depth,
+            db_queue_size=(
+                database.queue_size()
+                if isinstance(database, SqliteQueueDatabase)
+                else 0
+            ),
+            number_of_lines=self.number_of_lines,
+            number_of_dropped_lines=self.number_of_dropped_lines,
+            number_of_flushes=self.number_of_flushes,
+            last_flush_latency_secs=self.last_flush_latency_secs,
+            max_flush_latency_secs=self.max_flush_latency_secs,
+            avg_flush_latency_secs=(
+                self._total_flush_latency_secs / self.number_of_flushes
+                if self.number_of_flushes
+                else 0.0
+            ),
+        )
@@ -11,14 +11,15 @@ import traceback
 from datetime import datetime
 
 from run_tasks.app_task_manager.common import log_manager as log
-from run_tasks.app_task_manager.config import ENCODING
+from run_tasks.app_task_manager.config import ENCODING, EXECUTOR_MODE
 from run_tasks.app_task_manager.units.base_unit import BaseUnit
 from run_tasks.app_task_manager.units.executor_unit import ExecutorUnit
 from run_tasks.app_task_manager.units.maintenance_unit import MaintenanceUnit
+from run_tasks.app_task_manager.units.pool_executor_unit import PoolExecutorUnit
 from run_tasks.app_task_manager.units.scheduler_unit import SchedulerUnit
 from run_tasks.app_task_manager.units.notification_unit import NotificationUnit
 
-from run_tasks.db import TaskRun
+from run_tasks.db import TaskRun, validate_notification_templates
 
 
 def log_uncaught_exceptions(ex_cls, ex, tb) -> None:
@@ -38,13 +39,26 @@ sys.excepthook = log_uncaught_exceptions
 
 
 class TaskManager:
-    def __init__(self, encoding: str = ENCODING) -> None:
+    def __init__(
+        self,
+        encoding: str = ENCODING,
+        executor_mode: str = EXECUTOR_MODE,
+    ) -> None:
         self.encoding = encoding
 
+        # Ошибки в шаблонах уведомлений видны сразу, а не при первом уведомлении
+        validate_notification_templates()
+
+        self.executor_unit: ExecutorUnit | PoolExecutorUnit = (
+            PoolExecutorUnit(owner=self)
+            if executor_mode == "pool"
+            else ExecutorUnit(owner=self)
+        )
+
         self.units: list[BaseUnit] = [
             MaintenanceUnit(owner=self),
             SchedulerUnit(owner=self),
-            ExecutorUnit(owner=self),
+            self.executor_unit,
             NotificationUnit(owner=self),
         ]
 
@@ -55,14 +69,7 @@ class TaskManager:
         self._is_stopped: bool = False
 
     def get_current_task_runs(self) -> list[TaskRun]:
-        items = []
-        for unit in self.units:
-            if isinstance(unit, ExecutorUnit):
-                for thread in unit.tasks.values():
-                    if thread.current_task_run:
-                        items.append(thread.current_task_run)
-
-        return items
+        return self.executor_unit.get_current_task_runs()
 
     def start_all(self) -> None:
         if self._is_stopped:
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import operator
+import time
+from datetime import datetime, timedelta
+from functools import reduce
+from typing import Any
+
+from peewee import Expression, Field, fn
+
+from run_tasks.app_task_manager.common import log_manager as log
+from run_tasks.app_task_manager.config import (
+    STORAGE_PERIOD_OF_TASK_RUN_IN_DAYS,
+    STORAGE_PERIOD_OF_LOGS_IN_DAYS,
+    STORAGE_PERIOD_OF_ARCHIVED_LOGS_IN_DAYS,
+    PURGE_RUN_BATCH_SIZE,
+    PURGE_LOG_BATCH_SIZE,
+    PURGE_TIME_BUDGET_SECS,
+    PURGE_INCREMENTAL_VACUUM_PAGES,
+    PURGE_WAL_CHECKPOINT,
+)
+from run_tasks.db import (
+    Task,
+    TaskRun,
+    TaskRunLog,
+    TaskRunLogChunk,
+    Notification,
+    LogsStorageEnum,
+)
+
+
+class RetentionPurge:
+    """
+    Хранение запусков по уровням: логи в базе, затем логи в сжатых файлах,
+    затем только данные запуска, после чего запуск удаляется. Сроки задаются
+    в конфиге и могут быть переопределены у задачи.
+
+    Удаление выполняется пачками. Логи, чанки и уведомления удаляются
+    явно отдельными запросами ограниченного размера, а не каскадом, чтобы
+    одна запись в очереди базы не занимала ее надолго. Работа прерывается
+    по истечении бюджета времени и продолжается при следующем вызове
+    """
+
+    def __init__(
+        self,
+        task_run_in_days: int | None = STORAGE_PERIOD_OF_TASK_RUN_IN_DAYS,
+        logs_in_days: int | None = STORAGE_PERIOD_OF_LOGS_IN_DAYS,
+        archived_logs_in_days: int | None = STORAGE_PERIOD_OF_ARCHIVED_LOGS_IN_DAYS,
+        run_batch_size: int = PURGE_RUN_BATCH_SIZE,
+        log_batch_size: int = PURGE_LOG_BATCH_SIZE,
+        time_budget_secs: float = PURGE_TIME_BUDGET_SECS,
+        incremental_vacuum_pages: int = PURGE_INCREMENTAL_VACUUM_PAGES,
+        wal_checkpoint: bool = PURGE_WAL_CHECKPOINT,
+    ) -> None:
+        self.task_run_in_days = task_run_in_days
+        self.logs_in_days = logs_in_days
+        self.archived_logs_in_days = archived_logs_in_days
+
+        self.run_batch_size = run_batch_size
+        self.log_batch_size = log_batch_size
+        self.time_budget_secs = time_budget_secs
+        self.incremental_vacuum_pages = incremental_vacuum_pages
+        self.wal_checkpoint = wal_checkpoint
+
+        self.number_of_runs: int = 0
+        self.number_of_archived_runs: int = 0
+        self.number_of_deleted_archives: int = 0
+        self.number_of_logs: int = 0
+        self.number_of_log_chunks: int = 0
+        self.number_of_notifications: int = 0
+        self.number_of_batches: int = 0
+        self.number_of_remaining_runs: int = 0
+        self.last_purge_secs: float = 0.0
+        self.is_complete: bool = True
+
+        self._start_time: float = 0.0
+
+    def _is_time_over(self) -> bool:
+        return time.perf_counter() - self._start_time >= self.time_budget_secs
+
+    @staticmethod
+    def get_expired_runs_where(
+        field: Field,
+        default_days: int | None,
+        now: datetime,
+    ) -> Expression | None:
+        """
+        Функция возвращает условие на завершенные запуски, срок хранения которых
+        по полю задачи field (или default_days, если у задачи он не задан) истек.
+        Если срок нигде не задан, то возвращается None
+        """
+
+        task_ids_by_days: dict[int, list[int]] = dict()
+        for task in Task.select(Task.id, field).where(field.is_null(False)):
+            task_ids_by_days.setdefault(getattr(task, field.name), []).append(task.id)
+
+        date = fn.COALESCE(TaskRun.finish_date, TaskRun.create_date)
+        items: list[Expression] = [
+            TaskRun.task.in_(task_ids) & (date < now - timedelta(days=days))
+            for days, task_ids in task_ids_by_days.items()
+        ]
+
+        # Задачи без своего срока
+        if default_days is not None:
+            task_ids: list[int] = sum(task_ids_by_days.values(), [])
+            items.append(
+                TaskRun.task.not_in(task_ids)
+                & (date < now - timedelta(days=default_days))
+            )
+
+        if not items:
+            return None
+
+        return ~TaskRun.is_active & reduce(operator.or_, items)
+
+    def _get_runs(self, where: Expression) -> list[TaskRun]:
+        return list(
+            TaskRun.select(
+                TaskRun.id, TaskRun.task, TaskRun.status, TaskRun.logs_storage
+            )
+            .where(where)
+            .order_by(TaskRun.id)
+            .limit(self.run_batch_size)
+        )
+
+    def _delete_logs(self, run_ids: list[int]) -> bool:
+        """
+        Функция удаляет строки и чанки логов запусков. Строки логов могут быть
+        большими, поэтому удаляются частями. Возвращает False, если время вышло
+        раньше, чем были удалены все строки
+        """
+
+        while True:
+            number: int = (
+                TaskRunLog.delete()
+                .where(
+                    TaskRunLog.id.in_(
+                        TaskRunLog.select(TaskRunLog.id)
+                        .where(TaskRunLog.task_run.in_(run_ids))
+                        .limit(self.log_batch_size)
+                    )
+                )
+                .execute()
+            )
+            self.number_of_logs += number
+
+            if number < self.log_batch_size:
+                break
+
+            if self._is_time_over():
+                return False
+
+        self.number_of_log_chunks += (
+            TaskRunLogChunk.delete()
+            .where(TaskRunLogChunk.task_run.in_(run_ids))
+            .execute()
+        )
+        return True
+
+    def _delete_leftover_logs(self) -> bool:
+        """
+        Функция удаляет строки и чанки логов, оставшиеся в базе у запусков,
+        чьи логи уже в архиве (удаление было прервано по времени)
+        """
+
+        while True:
+            runs: list[TaskRun] = self._get_runs(
+                (TaskRun.logs_storage != LogsStorageEnum.DB)
+                & (
+                    TaskRun.id.in_(TaskRunLog.select(TaskRunLog.task_run))
+                    | TaskRun.id.in_(TaskRunLogChunk.select(TaskRunLogChunk.task_run))
+                )
+            )
+            if not runs:
+                return True
+
+            if not self._delete_logs([run.id for run in runs]) or self._is_time_over():
+                return False
+
+    def _archive_logs(self, now: datetime) -> bool:
+        if not self._delete_leftover_logs():
+            return False
+
+        where = self.get_expired_runs_where(
+            Task.logs_storage_days, self.logs_in_days, now
+        )
+        if where is None:
+            return True
+
+        while True:
+            runs: list[TaskRun] = self._get_runs(
+                where & (TaskRun.logs_storage == LogsStorageEnum.DB)
+            )
+            if not runs:
+                return True
+
+            for run in runs:
+                run.archive_logs()
+                self.number_of_archived_runs += 1
+
+            if not self._delete_logs([run.id for run in runs]) or self._is_time_over():
+                return False
+
+    def _delete_archives(self, now: datetime) -> bool:
+        where = self.get_expired_runs_where(
+            Task.archived_logs_storage_days, self.archived_logs_in_days, now
+        )
+        if where is None:
+            return True
+
+        while True:
+            runs: list[TaskRun] = self._get_runs(
+                where & (TaskRun.logs_storage == LogsStorageEnum.ARCHIVE)
+            )
+            if not runs:
+                return True
+
+            for run in runs:
+                run.delete_logs_archive()
+                self.number_of_deleted_archives += 1
+
+            if self._is_time_over():
+                return False
+
+    def _delete_runs(self, now: datetime) -> bool:
+        where = self.get_expired_runs_where(
+            Task.task_run_storage_days, self.task_run_in_days, now
+        )
+        if where is None:
+            return True
+
+        while True:
+            runs: list[TaskRun] = self._get_runs(where)
+            if not runs:
+                return True
+
+            run_ids: list[int] = [run.id for run in runs]
+
+            # Запуски, у которых остались логи, удалятся при следующем вызове
+            if not self._delete_logs(run_ids):
+                self.number_of_remaining_runs = TaskRun.select().where(where).count()
+                return False
+
+            self.number_of_notifications += (
+                Notification.delete()
+                .where(Notification.task_run.in_(run_ids))
+                .execute()
+            )
+            self.number_of_runs += (
+                TaskRun.delete().where(TaskRun.id.in_(run_ids)).execute()
+            )
+            self.number_of_batches += 1
+
+            for run in runs:
+                if run.logs_storage == LogsStorageEnum.ARCHIVE:
+                    run.get_logs_archive_path().unlink(missing_ok=True)
+
+            if self._is_time_over():
+                self.number_of_remaining_runs = TaskRun.select().where(where).count()
+                return False
+
+    def _vacuum(self) -> None:
+        database = TaskRun._meta.database
+
+        # NOTE: Работает только при auto_vacuum = INCREMENTAL, иначе ничего не делает
+        if self.incremental_vacuum_pages > 0:
+            database.execute_sql(
+                f"PRAGMA incremental_vacuum({int(self.incremental_vacuum_pages)})"
+            )
+
+        if self.wal_checkpoint:
+            database.execute_sql("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def purge(self, now: datetime | None = None) -> bool:
+        """
+        Функция переносит в архив и удаляет логи и запуски с истекшим сроком
+        хранения и возвращает True, если все такие запуски обработаны.
+        Хотя бы одна пачка обрабатывается при любом бюджете времени
+        """
+
+        if now is None:
+            now = datetime.now()
+
+        self._start_time = time.perf_counter()
+
+        number_of_logs: int = self.number_of_logs
+        number_of_runs: int = self.number_of_runs
+        self.number_of_remaining_runs = 0
+
+        self.is_complete = (
+            self._archive_logs(now)
+            and self._delete_archives(now)
+            and self._delete_runs(now)
+        )
+
+        if self.number_of_logs > number_of_logs or self.number_of_runs > number_of_runs:
+            self._vacuum()
+
+        self.last_purge_secs = time.perf_counter() - self._start_time
+
+        log.debug(f"Статистика хранения запусков: {self.get_stats()}")
+
+        return self.is_complete
+
+    def get_stats(self) -> dict[str, Any]:
+        return dict(
+            number_of_runs=self.number_of_runs,
+            number_of_archived_runs=self.number_of_archived_runs,
+            number_of_deleted_archives=self.number_of_deleted_archives,
+            number_of_logs=self.number_of_logs,
+            number_of_log_chunks=self.number_of_log_chunks,
+            number_of_notifications=self.number_of_notifications,
+            number_of_batches=self.number_of_batches,
+            number_of_remaining_runs=self.number_of_remaining_runs,
+            last_purge_secs=self.last_purge_secs,
+            is_complete=self.is_complete,
+        )
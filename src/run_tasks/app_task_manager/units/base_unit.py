@@ -41,6 +41,9 @@ class BaseUnit(Thread, ABC):
     def stop(self) -> None:
         self._is_stopped = True
 
+    def wait_next_process(self) -> None:
+        time.sleep(self._process_iter_delay_secs)
+
     def before_process(self) -> None:
         pass
 
@@ -55,6 +58,6 @@ class BaseUnit(Thread, ABC):
 
         while not self._is_stopped:
             self.process()
-            time.sleep(self._process_iter_delay_secs)
+            self.wait_next_process()
 
         self.log_info("Финиш")
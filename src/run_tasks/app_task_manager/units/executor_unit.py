@@ -9,7 +9,8 @@ from datetime import datetime, timedelta
 
 from run_tasks.app_task_manager.units.base_unit import BaseUnit
 from run_tasks.app_task_manager.utils import TaskThread
-from run_tasks.db import Task
+from run_tasks.db import Task, TaskRun, TaskRunStatusEnum
+from run_tasks.events import TASK_EVENTS
 
 
 class ExecutorUnit(BaseUnit):
@@ -32,14 +33,39 @@ class ExecutorUnit(BaseUnit):
 
         return task_thread
 
+    def get_current_task_runs(self) -> list[TaskRun]:
+        return [
+            thread.current_task_run
+            for thread in list(self.tasks.values())
+            if thread.current_task_run
+        ]
+
     def before_process(self) -> None:
         super().before_process()
 
         self.log_info("Запуск всех задач из базы")
 
+    def _notify_about_ready_runs(self) -> None:
+        # Запасная проверка для запусков, о которых потоки задач не были оповещены,
+        # например, созданных веб-приложением в другом процессе
+        for run in (
+            TaskRun.select(TaskRun.task)
+            .where(
+                TaskRun.status == TaskRunStatusEnum.PENDING,
+                TaskRun.scheduled_date.is_null(True)
+                | (TaskRun.scheduled_date <= datetime.now()),
+            )
+            .distinct()
+        ):
+            TASK_EVENTS.notify(run.task_id)
+
     def process(self) -> None:
+        names: set[str] = set()
+
         for task in Task.select().where(Task.is_enabled == True):
             name = task.name
+            names.add(name)
+
             if name not in self.tasks:
                 self.log_info(f"Запуск потока задачи #{task.id} {name!r}")
                 self._add(name=name).start()
@@ -49,6 +75,13 @@ class ExecutorUnit(BaseUnit):
                 self.log_info(f"Удаление потока задачи #{task.id} {name!r}")
                 self.tasks.pop(name)
 
+        # Потоки отключенных, удаленных или переименованных задач должны завершиться
+        for name, task_thread in self.tasks.items():
+            if name not in names:
+                task_thread.wake_up()
+
+        self._notify_about_ready_runs()
+
     def stop(self) -> None:
         super().stop()
 
@@ -6,16 +6,26 @@ __author__ = "ipetrash"
 
 from datetime import datetime, timedelta
 
-from peewee import fn
 from psutil import Process, NoSuchProcess, AccessDenied
 
-from run_tasks.app_task_manager.config import STORAGE_PERIOD_OF_TASK_RUN_IN_DAYS
+from run_tasks.app_task_manager.config import (
+    LOG_STORAGE_IS_CHUNKS,
+    LOG_STORAGE_CHUNK_LINES,
+    LOG_STORAGE_COMPRESSION,
+)
+from run_tasks.app_task_manager.retention import RetentionPurge
 from run_tasks.app_task_manager.utils import (
     get_prefix_file_name_command,
     kill_proc_tree,
 )
 from run_tasks.app_task_manager.units.base_unit import BaseUnit
-from run_tasks.db import TaskRun, TaskRunStatusEnum
+from run_tasks.db import (
+    db,
+    TaskRun,
+    TaskRunLog,
+    TaskRunStatusEnum,
+    LogsStorageEnum,
+)
 
 
 class MaintenanceUnit(BaseUnit):
@@ -24,6 +34,8 @@ class MaintenanceUnit(BaseUnit):
 
         self._process_iter_delay_secs = 60
 
+        self.retention_purge = RetentionPurge()
+
     def __processing_hanging_runs(self) -> None:
         # Текущие запущенные задачи в менеджере
         task_runs: list[TaskRun] = self.owner.get_current_task_runs()
@@ -77,20 +89,48 @@ class MaintenanceUnit(BaseUnit):
             run.set_status(status)
 
     def __removing_old_runs(self) -> None:
-        date = datetime.now() - timedelta(days=STORAGE_PERIOD_OF_TASK_RUN_IN_DAYS)
+        number_of_runs: int = self.retention_purge.number_of_runs
+        try:
+            is_complete: bool = self.retention_purge.purge()
+        except Exception as e:
+            self.log_exception("Ошибка при удалении устаревших запусков", e)
+            return
+
+        number: int = self.retention_purge.number_of_runs - number_of_runs
+        if number:
+            self.log_info(
+                f"Удалено устаревших запусков: {number}"
+                + (
+                    ""
+                    if is_complete
+                    else f", осталось: {self.retention_purge.number_of_remaining_runs}"
+                )
+            )
 
+    def __packing_logs(self) -> None:
+        # Упаковка логов завершенных запусков, которые не были упакованы
+        # исполнителем (например, из-за ошибки или смены вида хранения)
         for run in TaskRun.select().where(
             TaskRun.status.not_in(
                 [TaskRunStatusEnum.PENDING, TaskRunStatusEnum.RUNNING]
             ),
-            fn.COALESCE(TaskRun.finish_date, TaskRun.create_date) < date,
+            TaskRun.logs_storage == LogsStorageEnum.DB,
+            TaskRun.id.in_(TaskRunLog.select(TaskRunLog.task_run).distinct()),
         ):
             try:
-                self.log_info(f"Удаление запуска {run}")
-                run.delete_instance()
+                number = run.pack_logs(
+                    chunk_size=LOG_STORAGE_CHUNK_LINES,
+                    compression=LOG_STORAGE_COMPRESSION,
+                )
+                self.log_info(f"Упаковано строк логов запуска {run}: {number}")
             except Exception as e:
-                self.log_exception(f"Ошибка при удалении запуска {run}:", e)
+                self.log_exception(f"Ошибка при упаковке логов запуска {run}:", e)
 
     def process(self) -> None:
         self.__processing_hanging_runs()
         self.__removing_old_runs()
+
+        if LOG_STORAGE_IS_CHUNKS:
+            self.__packing_logs()
+
+        self.log_debug(f"Статистика записи в базу: {db.get_stats()}")
@@ -4,72 +4,435 @@
 __author__ = "ipetrash"
 
 
+import math
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any
 
+from peewee import fn
+
+from run_tasks.app_task_manager.config import (
+    NOTIFICATION_WORKERS_PER_KIND,
+    NOTIFICATION_BATCH_SIZE,
+    NOTIFICATION_RETRY_BASE_DELAY_SECS,
+    NOTIFICATION_RETRY_MAX_DELAY_SECS,
+    NOTIFICATION_COALESCE_WINDOW_SECS,
+    NOTIFICATION_EMAIL_BATCH_SIZE,
+    NOTIFICATION_TELEGRAM_BATCH_SIZE,
+)
 from run_tasks.app_task_manager.units.base_unit import BaseUnit
-from run_tasks.db import Notification, NotificationKindEnum
-from run_tasks.common import get_full_exception, send_email
-from run_tasks.config import CONFIG_NOTIFICATION
+from run_tasks.db import (
+    TaskRun,
+    Notification,
+    NotificationKindEnum,
+    render_notification,
+    render_notification_part,
+)
+from run_tasks.common import (
+    SmtpPool,
+    SmtpSession,
+    TelegramClient,
+    create_email,
+    get_full_exception,
+    send_email,
+)
+from run_tasks.config import CONFIG, CONFIG_NOTIFICATION, NOTIFICATION_LAZY_TEXT
+from run_tasks.third_party.add_notify_telegram import get_notify_data
 
-import run_tasks.third_party.add_notify_telegram
-from run_tasks.third_party.add_notify_telegram import add_notify
 
-# Установка адреса сервера, через который отправляются уведомления
-run_tasks.third_party.add_notify_telegram.URL = CONFIG_NOTIFICATION["telegram"][
-    "add_notify_url"
-]
+class NotificationUnit(BaseUnit):
+    """
+    Отправка уведомлений. У каждого вида уведомлений свой пул отправителей,
+    поэтому ошибки или медленная отправка в одном канале не задерживают
+    другие. Повторные попытки не ждут в потоке: после ошибки в уведомлении
+    сохраняется дата следующей попытки с экспоненциальной задержкой.
 
+    Уведомления запусков одной задачи и вида, появившиеся в течение окна
+    после отправки предыдущего, придерживаются до конца окна и отправляются
+    одним сводным уведомлением.
 
-class NotificationUnit(BaseUnit):
-    def __init__(self, owner: "TaskManager") -> None:
+    Письма отправляются пачками через пул соединений с почтовым сервером,
+    поэтому несколько писем уходят в одной сессии. Уведомления в телеграм
+    также отправляются пачками через общие keep-alive соединения, а если
+    сервер поддерживает, то пачка уходит одним запросом
+    """
+
+    def __init__(
+        self,
+        owner: "TaskManager",
+        workers_per_kind: int = NOTIFICATION_WORKERS_PER_KIND,
+        batch_size: int = NOTIFICATION_BATCH_SIZE,
+        retry_base_delay_secs: float = NOTIFICATION_RETRY_BASE_DELAY_SECS,
+        retry_max_delay_secs: float = NOTIFICATION_RETRY_MAX_DELAY_SECS,
+        coalesce_window_secs: float = NOTIFICATION_COALESCE_WINDOW_SECS,
+        email_batch_size: int = NOTIFICATION_EMAIL_BATCH_SIZE,
+        telegram_batch_size: int = NOTIFICATION_TELEGRAM_BATCH_SIZE,
+    ) -> None:
         super().__init__(owner)
 
         self._process_iter_delay_secs = 5
 
-    def process(self):
-        for notify in Notification.get_unsent():
-            if not CONFIG_NOTIFICATION["enabled"]:
-                self.log_warn("Отправка уведомления отключена")
-                time.sleep(60)  # Побольше задержка, чтобы не спамить в логах
+        self.workers_per_kind = workers_per_kind
+        self.batch_size = batch_size
+        self.retry_base_delay_secs = retry_base_delay_secs
+        self.retry_max_delay_secs = retry_max_delay_secs
+        self.coalesce_window_secs = coalesce_window_secs
+        self.email_batch_size = email_batch_size
+        self.telegram_batch_size = telegram_batch_size
+
+        # NOTE: Если соединений меньше, чем отправителей, то отправители
+        #       ждут свободное соединение
+        self.smtp_pool = SmtpPool()
+        self.telegram_client = TelegramClient(pool_size=self.workers_per_kind)
+
+        self._pools: dict[NotificationKindEnum, ThreadPoolExecutor] = {
+            kind: ThreadPoolExecutor(
+                max_workers=self.workers_per_kind,
+                thread_name_prefix=f"{type(self).__name__}-{kind.value}",
+            )
+            for kind in NotificationKindEnum
+        }
+
+        # Уведомления, отправленные в пулы, по виду
+        self._lock = threading.Lock()
+        self._in_progress: dict[NotificationKindEnum, set[int]] = {
+            kind: set() for kind in NotificationKindEnum
+        }
+        self._wake_event = threading.Event()
+
+    def get_retry_delay_secs(self, attempts: int) -> float:
+        return min(
+            self.retry_base_delay_secs * 2 ** max(attempts - 1, 0),
+            self.retry_max_delay_secs,
+        )
+
+    @staticmethod
+    def get_telegram_data(notify: Notification, text: str) -> dict[str, Any]:
+        return get_notify_data(
+            notify.name,
+            text,
+            type="ERROR",
+            url=(
+                notify.task_run.get_url()
+                if notify.task_run
+                else CONFIG_NOTIFICATION["base_url"]
+            ),
+            has_delete_button=True,
+        )
+
+    def send(
+        self,
+        notify: Notification,
+        text: str,
+        smtp_session: SmtpSession | None = None,
+    ) -> None:
+        match notify.kind:
+            case NotificationKindEnum.EMAIL:
+                if smtp_session:
+                    smtp_session.send_message(create_email(notify.name, text))
+                else:
+                    send_email(notify.name, text)
+
+            case NotificationKindEnum.TELEGRAM:
+                self.telegram_client.send(self.get_telegram_data(notify, text))
+
+            case _:
+                raise Exception(f"Неизвестный вид уведомления {notify.kind.value}")
+
+    def _send(
+        self,
+        notify: Notification,
+        smtp_session: SmtpSession | None = None,
+    ) -> None:
+        try:
+            self.log_info(f"Отправка уведомления #{notify.id} в {notify.kind.value}")
+            text: str = notify.get_text()
+            self.send(notify, text, smtp_session=smtp_session)
+            notify.set_as_send(text=text)
+
+        except Exception as e:
+            self._set_as_failed(notify, e)
+
+        finally:
+            self._set_as_done(notify)
+
+    def _set_as_failed(self, notify: Notification, e: Exception) -> None:
+        delay_secs: float = self.get_retry_delay_secs(notify.attempts + 1)
+
+        text = "Ошибка при отправке уведомления"
+        self.log_exception(
+            f"{text} #{notify.id} (попытка {notify.attempts + 1}, "
+            f"следующая через {delay_secs} секунд)",
+            e,
+        )
+
+        error: str = get_full_exception(e)
+        notify.set_as_failed(error=error, delay_secs=delay_secs)
+
+        if notify.task_run:
+            notify.task_run.add_log_err(f"{text}:\n{error}")
+
+    def _set_as_done(self, notify: Notification) -> None:
+        with self._lock:
+            self._in_progress[notify.kind].discard(notify.id)
+
+        # Освободилось место для следующих уведомлений
+        self._wake_event.set()
+
+    def _send_emails(self, items: list[Notification]) -> None:
+        """
+        Функция отправляет письма в одной сессии с почтовым сервером
+        """
+
+        sent: int = 0
+        try:
+            with self.smtp_pool.session() as smtp_session:
+                for notify in items:
+                    sent += 1
+                    self._send(notify, smtp_session=smtp_session)
+
+        except Exception as e:
+            # Не удалось подключиться к серверу
+            for notify in items[sent:]:
+                try:
+                    self._set_as_failed(notify, e)
+                finally:
+                    self._set_as_done(notify)
+
+    def _send_telegrams(self, items: list[Notification]) -> None:
+        """
+        Функция отправляет уведомления в телеграм одним запросом, если сервер
+        это поддерживает, иначе по одному
+        """
+
+        if not self.telegram_client.batch_url:
+            for notify in items:
+                self._send(notify)
+            return
+
+        texts: dict[int, str] = dict()
+        try:
+            for notify in items:
+                try:
+                    texts[notify.id] = notify.get_text()
+                except Exception as e:
+                    self._set_as_failed(notify, e)
+                    self._set_as_done(notify)
+
+            items = [notify for notify in items if notify.id in texts]
+            if not items:
                 return
 
+            self.log_info(
+                f"Отправка уведомлений ({len(items)}) в "
+                f"{NotificationKindEnum.TELEGRAM.value} одним запросом"
+            )
             try:
-                self.log_info(
-                    f"Отправка уведомления #{notify.id} в {notify.kind.value}"
+                self.telegram_client.send_many(
+                    [
+                        self.get_telegram_data(notify, texts[notify.id])
+                        for notify in items
+                    ]
                 )
+            except Exception as e:
+                for notify in items:
+                    self._set_as_failed(notify, e)
+                return
 
-                match notify.kind:
-                    case NotificationKindEnum.EMAIL:
-                        send_email(notify.name, notify.text)
-
-                    case NotificationKindEnum.TELEGRAM:
-                        add_notify(
-                            notify.name,
-                            notify.text,
-                            type="ERROR",
-                            url=(
-                                notify.task_run.get_url()
-                                if notify.task_run
-                                else CONFIG_NOTIFICATION["base_url"]
-                            ),
-                            has_delete_button=True,
-                        )
-
-                    case _:
-                        raise Exception(
-                            f"Неизвестный вид уведомления {notify.kind.value}"
-                        )
-
-                notify.set_as_send()
+            for notify in items:
+                notify.set_as_send(text=texts[notify.id])
 
-            except Exception as e:
-                text = "Ошибка при отправке уведомления"
-                self.log_exception(text, e)
+        finally:
+            for notify in items:
+                self._set_as_done(notify)
+
+    def coalesce(self, now: datetime | None = None) -> list[Notification]:
+        """
+        Функция объединяет неотправленные уведомления запусков по задаче и виду
+        и возвращает созданные сводные уведомления. Если уведомление такой
+        задачи и вида было отправлено меньше окна назад, то новые уведомления
+        откладываются до конца окна
+        """
+
+        if self.coalesce_window_secs <= 0:
+            return []
+
+        if now is None:
+            now = datetime.now()
+
+        window = timedelta(seconds=self.coalesce_window_secs)
+
+        with self._lock:
+            in_progress: set[int] = set().union(*self._in_progress.values())
+
+        # Сводные уведомления повторно не объединяются, как и уведомления
+        # с неудачными попытками отправки
+        Merged = Notification.alias()
+        items: list[Notification] = list(
+            Notification.select(Notification, TaskRun)
+            .join(TaskRun)
+            .where(
+                Notification.is_unsent,
+                Notification.attempts == 0,
+                Notification.id.not_in(list(in_progress)),
+                Notification.id.not_in(
+                    Merged.select(Merged.merged_into).where(
+                        Merged.merged_into.is_null(False)
+                    )
+                ),
+            )
+            .order_by(Notification.append_date, Notification.id)
+        )
+        if not items:
+            return []
+
+        groups: dict[tuple[int, NotificationKindEnum], list[Notification]] = dict()
+        for notify in items:
+            groups.setdefault((notify.task_run.task_id, notify.kind), []).append(notify)
+
+        last_sending_dates: dict[tuple[int, NotificationKindEnum], datetime] = {
+            (task_id, kind): date
+            for task_id, kind, date in (
+                Notification.select(
+                    TaskRun.task, Notification.kind, fn.MAX(Notification.sending_date)
+                )
+                .join(TaskRun)
+                .where(
+                    TaskRun.task.in_([task_id for task_id, _ in groups]),
+                    Notification.sending_date.is_null(False),
+                )
+                .group_by(TaskRun.task, Notification.kind)
+                .tuples()
+            )
+        }
+
+        digests: list[Notification] = []
+        for key, group in groups.items():
+            last_sending_date: datetime | None = last_sending_dates.get(key)
+            if last_sending_date and now < last_sending_date + window:
+                Notification.update(next_attempt_date=last_sending_date + window).where(
+                    Notification.id.in_([notify.id for notify in group])
+                ).execute()
+                continue
+
+            if len(group) < 2:
+                continue
+
+            run: TaskRun = group[-1].task_run
+            kind: NotificationKindEnum = group[-1].kind
+            template_key: str = "digest_template"
+            variables: dict[str, Any] = dict(
+                task=run.task,
+                run=run,
+                runs=[notify.task_run for notify in group],
+                config=CONFIG,
+            )
+
+            # Текст будет сформирован при отправке
+            if NOTIFICATION_LAZY_TEXT:
+                name: str = render_notification_part(
+                    kind, variables, template_key, part="name"
+                )
+                text: str | None = None
+            else:
+                name, text = render_notification(kind, variables, template_key)
+
+            digest = Notification.merge(
+                group, name=name, text=text, template_key=template_key
+            )
+            digests.append(digest)
+
+            self.log_info(
+                f"Уведомления ({len(group)}) задачи #{run.task_id} "
+                f"объединены в #{digest.id}"
+            )
+
+        return digests
+
+    def dispatch(self, now: datetime | None = None) -> list[Notification]:
+        """
+        Функция отправляет готовые уведомления в пулы их видов и возвращает
+        отправленные уведомления
+        """
+
+        submitted: list[Notification] = []
+
+        if now is None:
+            now = datetime.now()
+
+        for kind, pool in self._pools.items():
+            with self._lock:
+                in_progress: set[int] = set(self._in_progress[kind])
+
+            limit: int = self.batch_size - len(in_progress)
+            if limit <= 0:
+                continue
+
+            items: list[Notification] = Notification.get_ready_to_send(
+                kind=kind,
+                now=now,
+                exclude_ids=in_progress,
+                limit=limit,
+            )
+            with self._lock:
+                self._in_progress[kind].update(notify.id for notify in items)
+
+            if kind == NotificationKindEnum.EMAIL:
+                send_batch, batch_size = self._send_emails, self.email_batch_size
+            else:
+                send_batch, batch_size = self._send_telegrams, self.telegram_batch_size
+
+            # Пачки распределяются по всем отправителям
+            size: int = max(
+                min(batch_size, math.ceil(len(items) / self.workers_per_kind)),
+                1,
+            )
+            for i in range(0, len(items), size):
+                pool.submit(send_batch, items[i : i + size])
+
+            submitted += items
+
+        return submitted
+
+    def process(self) -> None:
+        if not CONFIG_NOTIFICATION["enabled"]:
+            self.log_warn("Отправка уведомления отключена")
+            time.sleep(60)  # Побольше задержка, чтобы не спамить в логах
+            return
+
+        # Завершения отправки после этого разбудят следующее ожидание
+        self._wake_event.clear()
+
+        now = datetime.now()
+        self.coalesce(now)
+        self.dispatch(now)
+
+    def wait_next_process(self) -> None:
+        timeout: float = self._process_iter_delay_secs
+
+        # Ближайшая повторная попытка. Уже готовые уведомления ждут освобождения
+        # отправителей, о котором придет оповещение
+        now = datetime.now()
+        notify: Notification | None = (
+            Notification.select(Notification.next_attempt_date)
+            .where(Notification.is_unsent, Notification.next_attempt_date > now)
+            .order_by(Notification.next_attempt_date)
+            .first()
+        )
+        if notify:
+            timeout = min(timeout, (notify.next_attempt_date - now).total_seconds())
+
+        # Завершение отправки будит сразу
+        self._wake_event.wait(max(timeout, 0))
 
-                if notify.task_run:
-                    notify.task_run.add_log_err(f"{text}:\n{get_full_exception(e)}")
+    def stop(self) -> None:
+        super().stop()
 
-                time.sleep(60)
+        self._wake_event.set()
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
 
-            finally:
-                time.sleep(1)
+        self.smtp_pool.close()
+        self.telegram_client.close()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from peewee import fn
+
+from run_tasks.app_task_manager.config import (
+    EXECUTOR_MAX_WORKERS,
+    EXECUTOR_MAX_RUNS_PER_TASK,
+)
+from run_tasks.app_task_manager.units.base_unit import BaseUnit
+from run_tasks.app_task_manager.utils import TaskRunner
+from run_tasks.db import Task, TaskRun, TaskRunStatusEnum
+from run_tasks.events import TASK_EVENTS
+
+
+class PoolExecutorUnit(BaseUnit):
+    """
+    Исполнитель запусков на общем пуле потоков фиксированного размера.
+    Готовые запуски выбираются из общей очереди в порядке запланированной
+    даты (или даты создания для ручных запусков) с ограничением количества
+    одновременных запусков как всего, так и у одной задачи
+    """
+
+    def __init__(
+        self,
+        owner: "TaskManager",
+        max_workers: int = EXECUTOR_MAX_WORKERS,
+        max_runs_per_task: int = EXECUTOR_MAX_RUNS_PER_TASK,
+    ) -> None:
+        super().__init__(owner)
+
+        # Запасная проверка запусков из других процессов (например, из веба)
+        self._process_iter_delay_secs: int = 1
+
+        self.encoding: str = owner.encoding
+        self.timeout_on_stopping_secs: int = 5
+
+        self.max_workers = max_workers
+        self.max_runs_per_task = max_runs_per_task
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix=type(self).__name__,
+        )
+        self._lock = threading.Lock()
+
+        # Запуски, отправленные в пул, по идентификатору запуска
+        self.runners: dict[int, TaskRunner] = dict()
+        self._task_id_by_run_id: dict[int, int] = dict()
+        self._futures: set[Future] = set()
+
+    def get_current_task_runs(self) -> list[TaskRun]:
+        with self._lock:
+            runners = list(self.runners.values())
+
+        return [
+            runner.current_task_run for runner in runners if runner.current_task_run
+        ]
+
+    def get_ready_runs(self) -> list[TaskRun]:
+        return list(
+            TaskRun.select(TaskRun, Task)
+            .join(Task)
+            .where(
+                Task.is_enabled == True,
+                TaskRun.status == TaskRunStatusEnum.PENDING,
+                TaskRun.scheduled_date.is_null(True)
+                | (TaskRun.scheduled_date <= datetime.now()),
+            )
+            .order_by(
+                fn.COALESCE(TaskRun.scheduled_date, TaskRun.create_date),
+                TaskRun.id,
+            )
+        )
+
+    def _run(self, runner: TaskRunner, task: Task, task_run: TaskRun) -> None:
+        try:
+            runner.start_task_run(task, task_run)
+        except Exception as e:
+            self.log_exception(f"Ошибка при выполнении запуска #{task_run.id}", e)
+        finally:
+            with self._lock:
+                self.runners.pop(task_run.id, None)
+                self._task_id_by_run_id.pop(task_run.id, None)
+
+            # Освободилось место для следующего запуска
+            TASK_EVENTS.notify(task.id)
+
+    def dispatch(self) -> list[TaskRun]:
+        """
+        Функция отправляет готовые запуски в пул с учетом ограничений и
+        возвращает отправленные запуски
+        """
+
+        submitted: list[tuple[TaskRunner, TaskRun]] = []
+
+        with self._lock:
+            number_by_task: dict[int, int] = dict()
+            for task_id in self._task_id_by_run_id.values():
+                number_by_task[task_id] = number_by_task.get(task_id, 0) + 1
+
+            for run in self.get_ready_runs():
+                if len(self.runners) >= self.max_workers:
+                    break
+
+                if run.id in self.runners:
+                    continue
+
+                task: Task = run.task
+                if number_by_task.get(task.id, 0) >= self.max_runs_per_task:
+                    continue
+
+                number_by_task[task.id] = number_by_task.get(task.id, 0) + 1
+
+                runner = TaskRunner(encoding=self.encoding)
+                self.runners[run.id] = runner
+                self._task_id_by_run_id[run.id] = task.id
+                submitted.append((runner, run))
+
+        for runner, run in submitted:
+            future = self._pool.submit(self._run, runner, run.task, run)
+            self._futures.add(future)
+            future.add_done_callback(self._futures.discard)
+
+        return [run for _, run in submitted]
+
+    def before_process(self) -> None:
+        super().before_process()
+
+        self.log_info(
+            f"Запуск пула исполнителей (max_workers={self.max_workers}, "
+            f"max_runs_per_task={self.max_runs_per_task})"
+        )
+
+    def process(self) -> None:
+        for run in self.dispatch():
+            self.log_info(f"Запуск #{run.id} задачи #{run.task.id} отправлен в пул")
+
+    def wait_next_process(self) -> None:
+        # Новые запуски и завершение текущих будят сразу
+        TASK_EVENTS.wait_any(timeout=self._process_iter_delay_secs)
+
+    def stop(self) -> None:
+        super().stop()
+
+        with self._lock:
+            runners = list(self.runners.values())
+
+        for runner in runners:
+            runner.stop()
+
+        TASK_EVENTS.notify_any()
+
+        self.log_info(
+            f"Ожидание {self.timeout_on_stopping_secs} секунд на завершение запусков"
+        )
+
+        # Запуски, еще не начавшие выполнение, останутся ожидающими
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+        _, not_done = wait(list(self._futures), timeout=self.timeout_on_stopping_secs)
+        if not_done:
+            self.log_info("Вышло время на завершение запусков")
+            # TODO: Нужно явно убивать процессы
+        else:
+            self.log_info("Все запуски завершены")
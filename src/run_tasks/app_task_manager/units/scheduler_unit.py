@@ -4,38 +4,208 @@
 __author__ = "ipetrash"
 
 
-from datetime import datetime
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
 
 from run_tasks.app_task_manager.units.base_unit import BaseUnit
 from run_tasks.db import Task, TaskRunStatusEnum
-from run_tasks.common import get_scheduled_date_generator
+from run_tasks.common import CompiledCron, get_cron, get_scheduled_date_generator
+from run_tasks.events import TASK_EVENTS
 
 
 class SchedulerUnit(BaseUnit):
+    """
+    Планировщик запусков задач. Даты следующих проверок задач хранятся
+    в куче (min-heap), поэтому поток спит до ближайшей из них, а не
+    перебирает все задачи с вычислением расписания на каждой итерации
+    """
+
     def __init__(self, owner: "TaskManager") -> None:
         super().__init__(owner)
 
+        # Интервал проверки изменений задач в базе (например, из веба)
         self._process_iter_delay_secs = 5
 
+        # Повторная проверка, если запланированный запуск еще не начал выполнение
+        self._retry_delay_secs: int = 1
+
+        # Куча из (дата проверки, идентификатор задачи). Устаревшие элементы
+        # не удаляются, а пропускаются при сравнении с _next_dates
+        self._heap: list[tuple[datetime, int]] = []
+        self._next_dates: dict[int, datetime] = dict()
+
+        # Состояние задач (название, cron, is_infinite). Разобранные расписания
+        # кэшируются в get_cron по выражению и названию (значения H зависят
+        # от него), поэтому при их изменении берется новое
+        self._tasks: dict[int, tuple[str, str | None, bool]] = dict()
+
+        self._last_refresh_time: float | None = None
+
+        # Задачи, о которых пришли оповещения (новый или завершенный запуск,
+        # изменение активности)
+        self._lock = threading.Lock()
+        self._notified_task_ids: set[int] = set()
+        self._wake_event = threading.Event()
+
     @classmethod
-    def _get_scheduled_date(cls, cron: str) -> datetime:
+    def _get_scheduled_date(cls, cron: str | CompiledCron) -> datetime:
         return next(get_scheduled_date_generator(cron))
 
+    def _on_task_event(self, task_id: int) -> None:
+        with self._lock:
+            self._notified_task_ids.add(task_id)
+
+        self._wake_event.set()
+
+    def _push(self, task_id: int, date: datetime) -> None:
+        # Более ранняя проверка не должна теряться
+        current_date: datetime | None = self._next_dates.get(task_id)
+        if current_date is not None and current_date <= date:
+            return
+
+        self._next_dates[task_id] = date
+        heapq.heappush(self._heap, (date, task_id))
+
+    def _remove(self, task_id: int) -> None:
+        self._tasks.pop(task_id, None)
+        self._next_dates.pop(task_id, None)
+
+    def get_next_date(self) -> datetime | None:
+        while self._heap:
+            date, task_id = self._heap[0]
+            if self._next_dates.get(task_id) == date:
+                return date
+
+            heapq.heappop(self._heap)
+
+        return None
+
+    def refresh(self) -> None:
+        """
+        Функция сверяет задачи с базой. Для новых задач и задач с измененным
+        расписанием сразу назначается проверка
+        """
+
+        now = datetime.now()
+        tasks: dict[int, tuple[str, str | None, bool]] = {
+            task.id: (task.name, task.cron, task.is_infinite)
+            for task in Task.select(
+                Task.id, Task.name, Task.cron, Task.is_infinite
+            ).where(Task.is_enabled == True)
+        }
+
+        for task_id in set(self._tasks) - set(tasks):
+            self._remove(task_id)
+
+        for task_id, state in tasks.items():
+            if self._tasks.get(task_id) == state:
+                continue
+
+            self._tasks[task_id] = state
+            self._next_dates.pop(task_id, None)
+            self._push(task_id, now)
+
+        # Удаление накопившихся устаревших элементов
+        if len(self._heap) > 2 * len(self._next_dates):
+            self._heap = [(date, task_id) for task_id, date in self._next_dates.items()]
+            heapq.heapify(self._heap)
+
+        self._last_refresh_time = time.monotonic()
+
+    def schedule(self, task: Task) -> datetime | None:
+        """
+        Функция при необходимости добавляет запуск задачи и возвращает дату
+        следующей проверки задачи
+        """
+
+        now = datetime.now()
+
+        if task.is_infinite and not task.get_runs_by([TaskRunStatusEnum.RUNNING]):
+            # Без запланированного времени
+            scheduled_date = None
+        elif task.cron:
+            scheduled_date = self._get_scheduled_date(
+                get_cron(task.cron, seed=task.name)
+            )
+        else:
+            # Бесконечная задача проверяется после завершения запуска (придет
+            # оповещение) и периодически, как запасной вариант
+            return (
+                now + timedelta(seconds=self._process_iter_delay_secs)
+                if task.is_infinite
+                else None
+            )
+
+        run = task.get_pending_run(has_scheduled_date=scheduled_date is not None)
+        if not run:
+            run = task.add_or_get_run(scheduled_date=scheduled_date)
+            self.log_info(
+                f"Запланирован запуск:\n" f"    Задача: {task}\n" f"    Запуск: {run}"
+            )
+
+        if scheduled_date is None:
+            return now + timedelta(seconds=self._process_iter_delay_secs)
+
+        # Следующий запуск планируется после начала выполнения текущего
+        if run.scheduled_date > now:
+            return run.scheduled_date
+        return now + timedelta(seconds=self._retry_delay_secs)
+
+    def before_process(self) -> None:
+        super().before_process()
+
+        TASK_EVENTS.add_listener(self._on_task_event)
+
     def process(self) -> None:
-        for task in Task.select().where(Task.is_enabled == True):
-            if task.is_infinite and not task.get_runs_by([TaskRunStatusEnum.RUNNING]):
-                # Без запланированного времени
-                scheduled_date = None
-            elif task.cron:
-                scheduled_date = self._get_scheduled_date(task.cron)
-            else:
+        if (
+            self._last_refresh_time is None
+            or time.monotonic() - self._last_refresh_time
+            >= self._process_iter_delay_secs
+        ):
+            self.refresh()
+
+        with self._lock:
+            task_ids, self._notified_task_ids = self._notified_task_ids, set()
+
+        now = datetime.now()
+        for task_id in task_ids:
+            if task_id in self._tasks:
+                self._push(task_id, now)
+
+        while True:
+            date: datetime | None = self.get_next_date()
+            if date is None or date > datetime.now():
+                break
+
+            _, task_id = heapq.heappop(self._heap)
+            self._next_dates.pop(task_id, None)
+
+            task: Task | None = Task.get_or_none(id=task_id)
+            if not task or not task.is_enabled:
+                self._remove(task_id)
                 continue
 
-            run = task.get_pending_run(has_scheduled_date=scheduled_date is not None)
-            if not run:
-                run = task.add_or_get_run(scheduled_date=scheduled_date)
-                self.log_info(
-                    f"Запланирован запуск:\n"
-                    f"    Задача: {task}\n"
-                    f"    Запуск: {run}"
-                )
+            next_date: datetime | None = self.schedule(task)
+            if next_date is not None:
+                self._push(task_id, next_date)
+
+    def wait_next_process(self) -> None:
+        timeout: float = self._process_iter_delay_secs
+        if self._last_refresh_time is not None:
+            timeout -= time.monotonic() - self._last_refresh_time
+
+        date: datetime | None = self.get_next_date()
+        if date is not None:
+            timeout = min(timeout, (date - datetime.now()).total_seconds())
+
+        # Оповещения о задачах будят сразу
+        self._wake_event.wait(max(timeout, 0))
+        self._wake_event.clear()
+
+    def stop(self) -> None:
+        super().stop()
+
+        TASK_EVENTS.remove_listener(self._on_task_event)
+        self._wake_event.set()
@@ -4,23 +4,36 @@
 __author__ = "ipetrash"
 
 
+import asyncio
+import concurrent.futures
 import os
 import signal
 import subprocess
 import sys
 import threading
-import traceback
 import time
+import traceback
+from datetime import datetime
 from pathlib import Path
 from tempfile import NamedTemporaryFile
-from typing import Callable, IO, AnyStr
+from typing import Callable, Coroutine, IO, AnyStr
 
 import psutil
 
 from run_tasks.app_task_manager.common import log_manager as log
-from run_tasks.app_task_manager.config import ENCODING, PATTERN_FILE_TASK_COMMAND
+from run_tasks.app_task_manager.config import (
+    ENCODING,
+    EXECUTOR_PROCESS_SUPERVISOR,
+    EXECUTOR_STOP_CHECK_INTERVAL_SECS,
+    PATTERN_FILE_TASK_COMMAND,
+    LOG_STORAGE_IS_CHUNKS,
+    LOG_STORAGE_CHUNK_LINES,
+    LOG_STORAGE_COMPRESSION,
+)
+from run_tasks.app_task_manager.log_writer import TaskRunLogWriter
 from run_tasks.db import Task, TaskRun, TaskRunStatusEnum, StopReasonEnum
 from run_tasks.config import PROJECT_NAME
+from run_tasks.events import TASK_EVENTS, STOP_TOKENS, StopToken
 
 IS_WIN: bool = sys.platform == "win32"
 
@@ -159,11 +172,18 @@ class ThreadRunProcess(threading.Thread):
         self.process: psutil.Popen | None = None
         self.process_return_code = None
 
+        self._is_stop_requested: bool = False
         self._exc: Exception | None = None
 
+    def stop(self) -> None:
+        self._is_stop_requested = True
+
+    def _need_stop(self) -> bool:
+        return self._is_stop_requested or self.stop_on()
+
     def run(self) -> None:
         try:
-            if self.stop_on():
+            if self._need_stop():
                 return
 
             def read_stream(
@@ -172,7 +192,7 @@ class ThreadRunProcess(threading.Thread):
             ) -> None:
                 for text in iter(stream.readline, ""):
                     on_callback(text)
-                    if self.stop_on():
+                    if self._need_stop():
                         break
                 stream.close()
 
@@ -206,7 +226,7 @@ class ThreadRunProcess(threading.Thread):
 
             while True:
                 try:
-                    if self.stop_on():
+                    if self._need_stop():
                         log.info(f"Нужно остановить процесс #{self.process.pid}")
                         kill_proc_tree(self.process.pid)
 
@@ -234,75 +254,262 @@ class ThreadRunProcess(threading.Thread):
             raise self._exc
 
 
-class TaskThread(threading.Thread):
-    def __init__(self, name: str, encoding: str = ENCODING) -> None:
-        super().__init__(
-            name=name,
-            daemon=True,  # Thread dies with the program
-        )
+class ProcessSupervisor:
+    """
+    Общий поток с циклом событий asyncio, в котором обслуживаются все дочерние
+    процессы: чтение их вывода, ожидание завершения и остановка
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if not self._loop:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name=type(self).__name__,
+                    daemon=True,  # Thread dies with the program
+                )
+                self._thread.start()
+
+            return self._loop
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop())
+
+    def call_soon(self, callback: Callable[[], None]) -> None:
+        self.get_loop().call_soon_threadsafe(callback)
+
+
+PROCESS_SUPERVISOR = ProcessSupervisor()
+
+
+class AsyncRunProcess:
+    """
+    Запуск процесса в цикле событий ProcessSupervisor.
+    Интерфейс совпадает с ThreadRunProcess, но отдельные потоки на процесс
+    и чтение его вывода не создаются. Остановка через stop() приходит событием,
+    а stop_on, обращающийся к базе, проверяется раз в stop_check_interval_secs
+    """
+
+    # Размер буфера чтения потока процесса, более длинные строки отдаются частями
+    STREAM_LIMIT: int = 1024 * 1024
+
+    def __init__(
+        self,
+        command: str | list[str],
+        on_stdout_callback: Callable[[str], None],
+        on_stderr_callback: Callable[[str], None],
+        on_start_callback: Callable[[psutil.Process], None],
+        on_finish_callback: Callable[[psutil.Process | None], None] = None,
+        stop_on: Callable[[], bool] = lambda: False,
+        encoding: str = ENCODING,
+        stop_check_interval_secs: float = 1,
+        supervisor: ProcessSupervisor = PROCESS_SUPERVISOR,
+    ) -> None:
+        self.command = command
+
+        self.on_stdout_callback = on_stdout_callback
+        self.on_stderr_callback = on_stderr_callback
+        self.on_start_callback = on_start_callback
+        self.on_finish_callback = on_finish_callback
+
+        self.stop_on = stop_on
+        self.stop_check_interval_secs = stop_check_interval_secs
 
         self.encoding = encoding
-        self.current_task_run: TaskRun | None = None
-        self._is_stopped: bool = False
+        self.supervisor = supervisor
 
-    def stop(self) -> None:
-        if (
-            self.current_task_run
-            and self.current_task_run.status == TaskRunStatusEnum.RUNNING
-        ):
-            self.current_task_run.set_stop(StopReasonEnum.UNIT_STOP)
+        self.process: psutil.Process | None = None
+        self.process_return_code = None
 
-        self._is_stopped = True
+        self._is_stop_requested: bool = False
+        self._stop_event: asyncio.Event | None = None
+        self._future: concurrent.futures.Future | None = None
 
-    def _find_run(self, task: Task) -> TaskRun | None:
-        task_runs = task.get_runs_by([TaskRunStatusEnum.PENDING])
-        if not task_runs:
-            return None
+    def start(self) -> None:
+        self._future = self.supervisor.submit(self._run())
 
-        # Не запланированные запуски более приоритетные
-        for run in task_runs:
-            if run.scheduled_date is None:
-                return run
+    def join(self, timeout: float | None = None) -> None:
+        if self._future:
+            self._future.result(timeout=timeout)
 
-        for run in task_runs:
-            if run.is_scheduled_date_has_arrived():
-                return run
+    def stop(self) -> None:
+        self._is_stop_requested = True
 
-        return None
+        # Событие создается уже в цикле событий
+        def _set() -> None:
+            if self._stop_event:
+                self._stop_event.set()
 
-    def run(self) -> None:
-        while not self._is_stopped:
-            task: Task | None = Task.get_by_name(self.name)
-            if not task:
-                log.warn(f"Задача {self.name!r} не найдена!")
-                return
+        self.supervisor.call_soon(_set)
 
-            if not task.is_enabled:
-                log.info(f"Задача {self.name!r} не активна!")
+    async def _read_stream(
+        self,
+        stream: asyncio.StreamReader,
+        on_callback: Callable[[str], None],
+    ) -> None:
+        buffer: bytes = b""
+        while True:
+            # Читается все, что уже есть в потоке, поэтому на пачку строк
+            # приходится один переход в поток обработки
+            data: bytes = await stream.read(self.STREAM_LIMIT)
+            buffer += data
+
+            lines: list[bytes] = buffer.split(b"\n")
+            # Незавершенная строка дожидается продолжения, если не превышен лимит
+            buffer = lines.pop()
+            lines = [line + b"\n" for line in lines]
+            if buffer and (not data or len(buffer) >= self.STREAM_LIMIT):
+                lines.append(buffer)
+                buffer = b""
+
+            if lines:
+                texts: list[str] = [
+                    line.decode(self.encoding, errors="replace").replace("\r\n", "\n")
+                    for line in lines
+                ]
+
+                # Запись логов может ждать очередь базы, поэтому выполняется вне
+                # цикла событий, чтобы не задерживать остальные процессы
+                await asyncio.to_thread(self._call_for_each, on_callback, texts)
+
+            # Конец потока
+            if not data:
+                break
+
+    @staticmethod
+    def _call_for_each(on_callback: Callable[[str], None], texts: list[str]) -> None:
+        for text in texts:
+            on_callback(text)
+
+    async def _wait_stop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                await asyncio.wait_for(
+                    self._stop_event.wait(),
+                    timeout=self.stop_check_interval_secs,
+                )
+            except TimeoutError:
+                if await asyncio.to_thread(self.stop_on):
+                    return
+
+    async def _run(self) -> None:
+        self._stop_event = asyncio.Event()
+        if self._is_stop_requested:
+            self._stop_event.set()
+
+        try:
+            if self._is_stop_requested or await asyncio.to_thread(self.stop_on):
                 return
 
-            if run := self._find_run(task):
-                self._start_task_run(task, run)
+            log.info(f"Запуск: {self.command}")
+
+            command: list[str] = (
+                [self.command] if isinstance(self.command, str) else self.command
+            )
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=Path.home(),
+                env=get_env_for_children_process(),
+                limit=self.STREAM_LIMIT,
+            )
+            self.process = psutil.Process(process.pid)
+            await asyncio.to_thread(self.on_start_callback, self.process)
 
-            time.sleep(2)  # TODO:
+            readers = asyncio.gather(
+                self._read_stream(process.stdout, self.on_stdout_callback),
+                self._read_stream(process.stderr, self.on_stderr_callback),
+            )
+            waiter = asyncio.ensure_future(process.wait())
+            stopper = asyncio.ensure_future(self._wait_stop())
 
-    def _start_task_run(self, task: Task, task_run: TaskRun) -> None:
+            await asyncio.wait([waiter, stopper], return_when=asyncio.FIRST_COMPLETED)
+            if not waiter.done():
+                log.info(f"Нужно остановить процесс #{process.pid}")
+                await asyncio.to_thread(kill_proc_tree, process.pid)
+
+            stopper.cancel()
+
+            self.process_return_code = await waiter
+            await readers
+
+        finally:
+            if self.on_finish_callback:
+                await asyncio.to_thread(self.on_finish_callback, self.process)
+
+
+class TaskRunner:
+    """
+    Выполнение запуска задачи в вызывающем потоке
+    """
+
+    def __init__(
+        self,
+        encoding: str = ENCODING,
+        process_supervisor: str = EXECUTOR_PROCESS_SUPERVISOR,
+        stop_check_interval_secs: float = EXECUTOR_STOP_CHECK_INTERVAL_SECS,
+    ) -> None:
+        self.encoding = encoding
+        self.process_supervisor = process_supervisor
+        self.stop_check_interval_secs = stop_check_interval_secs
+        self.current_task_run: TaskRun | None = None
+        self._log_writer: TaskRunLogWriter | None = None
+        self._process: ThreadRunProcess | AsyncRunProcess | None = None
+
+    def stop(self) -> None:
+        if (
+            self.current_task_run
+            and self.current_task_run.status == TaskRunStatusEnum.RUNNING
+        ):
+            # Буферизированные логи должны оказаться в базе раньше лога об остановке
+            if self._log_writer:
+                self._log_writer.flush()
+
+            self.current_task_run.set_stop(StopReasonEnum.UNIT_STOP)
+
+            if self._process:
+                self._process.stop()
+
+    def start_task_run(self, task: Task, task_run: TaskRun) -> None:
         def start_callback(process: psutil.Popen) -> None:
             log.debug(f"{log_prefix} process_id: {process.pid}")
             task_run.set_process_id(process.pid)
 
+        def finish_callback(process: psutil.Popen | None) -> None:
+            log_writer.flush()
+
         def process_stdout(text: str) -> None:
             log.debug(f"{log_prefix} stdout: {text!r}")
-            task_run.add_log_out(text)
+            log_writer.write_out(text)
 
         def process_stderr(text: str) -> None:
             log.debug(f"{log_prefix} stderr: {text!r}")
-            task_run.add_log_err(text)
+            log_writer.write_err(text)
 
         def stop_on() -> bool:
+            nonlocal last_stop_check_time
+
+            # Остановка внутри процесса известна сразу, а изменения из других
+            # процессов (например, из веба) проверяются в базе не чаще интервала
+            if (
+                not stop_token.is_set()
+                and time.monotonic() - last_stop_check_time
+                < self.stop_check_interval_secs
+            ):
+                return False
+            last_stop_check_time = time.monotonic()
+
             actual_task_run: TaskRun = task_run.get_new()
 
             if not task.get_actual_is_enabled():
+                log_writer.flush()
                 actual_task_run.set_stop(StopReasonEnum.TASK_DISABLED)
 
             status = actual_task_run.status
@@ -325,6 +532,12 @@ class TaskThread(threading.Thread):
             return need_stop
 
         log_prefix = f"[Задача #{task.id}, запуск {task_run.seq} (#{task_run.id})]"
+
+        stop_token: StopToken = STOP_TOKENS.register(task_run.id, task.id)
+        last_stop_check_time: float = time.monotonic()
+
+        log_writer = TaskRunLogWriter(task_run)
+        self._log_writer = log_writer
         try:
             if task_run.task.is_infinite:
                 start_reason = " по бесконечному запуску задачи"
@@ -342,19 +555,30 @@ class TaskThread(threading.Thread):
 
             temp_file = create_temp_file(task, task_run)
 
-            thread = ThreadRunProcess(
+            log_writer.start()
+
+            process_class = (
+                AsyncRunProcess
+                if self.process_supervisor == "asyncio"
+                else ThreadRunProcess
+            )
+            thread = process_class(
                 command=get_shell_command(temp_file.name),
                 on_stdout_callback=process_stdout,
                 on_stderr_callback=process_stderr,
                 on_start_callback=start_callback,
+                on_finish_callback=finish_callback,
                 stop_on=stop_on,
                 encoding=self.encoding,
             )
+            self._process = thread
             thread.start()
             thread.join()
 
             temp_file.close()
 
+            log_writer.close()
+
             process_return_code = thread.process_return_code
             log.debug(f"{log_prefix} process_return_code: {process_return_code}")
 
@@ -381,13 +605,107 @@ class TaskThread(threading.Thread):
                 task_run.add_log_out("Отправка уведомлений")
                 task_run.send_notifications()
 
+            if LOG_STORAGE_IS_CHUNKS:
+                number = task_run.pack_logs(
+                    chunk_size=LOG_STORAGE_CHUNK_LINES,
+                    compression=LOG_STORAGE_COMPRESSION,
+                )
+                log.debug(f"{log_prefix} Упаковано строк логов: {number}")
+
             self.current_task_run = None
 
         except Exception:
             log.exception(f"{log_prefix} error:")
 
             text = traceback.format_exc()
+            log_writer.close()
             task_run.set_error(text)
 
         finally:
+            STOP_TOKENS.unregister(task_run.id)
+
+            log_writer.close()
+            self._log_writer = None
+            self._process = None
+
+            log.debug(f"{log_prefix} Статистика записи логов: {log_writer.get_stats()}")
             log.debug(f"{log_prefix} Завершение с статусом {task_run.status.value}")
+
+            # Планировщик сразу узнает о завершении запуска (например, для
+            # бесконечных задач)
+            TASK_EVENTS.notify(task.id)
+
+
+class TaskThread(threading.Thread):
+    def __init__(self, name: str, encoding: str = ENCODING) -> None:
+        super().__init__(
+            name=name,
+            daemon=True,  # Thread dies with the program
+        )
+
+        self.runner = TaskRunner(encoding=encoding)
+        self.task_id: int | None = None
+        self._is_stopped: bool = False
+
+    @property
+    def current_task_run(self) -> TaskRun | None:
+        return self.runner.current_task_run
+
+    def wake_up(self) -> None:
+        # До получения задачи из базы поток не ожидает
+        if self.task_id is not None:
+            TASK_EVENTS.notify(self.task_id)
+
+    def stop(self) -> None:
+        self.runner.stop()
+
+        self._is_stopped = True
+        self.wake_up()
+
+    def _find_run(self, task: Task) -> tuple[TaskRun | None, datetime | None]:
+        """
+        Функция возвращает запуск, готовый к выполнению, и ближайшую
+        запланированную дату среди ожидающих запусков
+        """
+
+        task_runs = task.get_runs_by([TaskRunStatusEnum.PENDING])
+        if not task_runs:
+            return None, None
+
+        # Не запланированные запуски более приоритетные
+        for run in task_runs:
+            if run.scheduled_date is None:
+                return run, None
+
+        for run in task_runs:
+            if run.is_scheduled_date_has_arrived():
+                return run, None
+
+        return None, min(run.scheduled_date for run in task_runs)
+
+    def run(self) -> None:
+        while not self._is_stopped:
+            task: Task | None = Task.get_by_name(self.name)
+            if not task:
+                log.warn(f"Задача {self.name!r} не найдена!")
+                return
+
+            if not task.is_enabled:
+                log.info(f"Задача {self.name!r} не активна!")
+                return
+
+            self.task_id = task.id
+
+            run, scheduled_date = self._find_run(task)
+            if run:
+                self.runner.start_task_run(task, run)
+                continue
+
+            # Ожидание оповещения о новом запуске или наступления запланированной даты.
+            # Запуски из других процессов (например, из веба) оповещает ExecutorUnit
+            timeout: float | None = (
+                max((scheduled_date - datetime.now()).total_seconds(), 0)
+                if scheduled_date
+                else None
+            )
+            TASK_EVENTS.wait(task.id, timeout=timeout)
@@ -4,23 +4,61 @@
 __author__ = "ipetrash"
 
 
+import html
 import json
+import threading
+import time
 
+from datetime import date, datetime, timedelta
 from functools import reduce
 from dataclasses import dataclass, field
 from http import HTTPStatus
 from operator import or_
-from typing import Self, Any, Callable
-
-from flask import Blueprint, Request, Response, jsonify, request, abort
+from typing import Self, Any, Callable, Iterator
+
+from flask import (
+    Blueprint,
+    Request,
+    Response,
+    jsonify,
+    request,
+    abort,
+    current_app,
+    stream_with_context,
+)
 from werkzeug.exceptions import BadRequest
 
-from peewee import Model, Field, Expression, SQL, ColumnBase, ModelSelect, JOIN, fn
+from peewee import (
+    Model,
+    Field,
+    Expression,
+    SQL,
+    ColumnBase,
+    ModelSelect,
+    Ordering,
+    Tuple,
+    JOIN,
+    fn,
+)
 from playhouse.shortcuts import model_to_dict
 
 from querystring_parser import parser
 
-from run_tasks.app_web.config import API_PAGE_LENGTH_DEFAULT
+from run_tasks.app_web.config import (
+    API_PAGE_LENGTH_DEFAULT,
+    API_LOGS_TAIL_LIMIT_DEFAULT,
+    API_LOGS_SEARCH_LIMIT_DEFAULT,
+    API_CRON_NEXT_DATES_MAX_NUMBER,
+    API_FORECAST_LIMIT_DEFAULT,
+    API_FORECAST_MAX_LIMIT,
+    API_COUNT_CACHE_TTL_SECS,
+    API_COUNT_CACHE_MAX_SIZE,
+    CHANGE_FEED_POLL_INTERVAL_SECS,
+    CHANGE_FEED_KEEP_ALIVE_SECS,
+    CHANGE_FEED_MAX_LOGS,
+    CHANGE_FEED_SUBSCRIPTION_MAX_SIZE,
+)
+from run_tasks.app_web.change_feed import ChangeFeed, Event
 from run_tasks.app_web.common import (
     StatusEnum,
     prepare_response,
@@ -33,12 +71,35 @@ from run_tasks.db import (
     TaskRun,
     StopReasonEnum,
     TaskRunLog,
+    TaskRunLogSearch,
     Notification,
     NotificationKindEnum,
     TaskRunStatusEnum,
     TaskRunWorkStatusEnum,
+    slice_logs,
 )
-from run_tasks.common import get_scheduled_date_generator
+from run_tasks.common import get_cron
+from run_tasks.forecast import Forecast, get_forecast
+
+TASK_RUN_LOGS_ALLOWED_COLUMNS: list[Field] = [
+    TaskRunLog.id,
+    # TaskRunLog.task_run,  # TODO: Не нужно
+    TaskRunLog.text,
+    TaskRunLog.kind,
+    TaskRunLog.date,
+]
+TASK_LOGS_ALLOWED_COLUMNS: list[Field] = [
+    TaskRunLog.id,
+    TaskRunLog.task_run,
+    TaskRunLog.text,
+    TaskRunLog.kind,
+    TaskRunLog.date,
+]
+# NOTE: Поиск по тексту через полнотекстовый индекс
+TASK_RUN_LOGS_SEARCH_FIELDS: list[Callable[[str], Expression | None]] = [
+    TaskRunLog.search_text,
+    TaskRunLog.search_kind,
+]
 
 
 @dataclass(frozen=True, kw_only=True)
@@ -46,17 +107,32 @@ class DataTableRequest:
     draw: int
     start: int
     length: int
-    # TODO: search_value: str. Разделить логику отделив peewee
+    # TODO: Разделить логику отделив peewee
     where_filters: list[Expression] = field(default_factory=list)
     order_by: list[Expression] = field(default_factory=list)
 
+    # Значения запроса без преобразования в выражения peewee
+    search_value: str = ""
+    column_filters: dict[str, Any] = field(default_factory=dict)
+    order_by_columns: list[tuple[str, str]] = field(default_factory=list)
+
+    # Поля сортировки, None для колонок, не являющихся полями моделей
+    order_by_fields: list[tuple[ColumnBase | None, str]] = field(default_factory=list)
+
+    # Ключ сортировки последней строки предыдущей страницы. None - постраничный
+    # режим через offset, пустой список - первая страница в режиме курсора
+    after: list[Any] | None = None
+
+    # "exact" - точное количество, "cached" - закэшированное, "none" - без подсчета
+    count: str = "exact"
+
     @classmethod
     def from_request(
         cls,
         request: Request,
         models: list[type[Model]],
         allowed_columns: list[str | Field],
-        search_fields: list[Field],
+        search_fields: list[Field | Callable[[str], Expression | None]],
         default_order: Expression,
     ) -> Self:
         def validate_column(
@@ -109,6 +185,7 @@ class DataTableRequest:
         search_value: str = search_dict.get("value", "").strip()
 
         where_filters: list[Expression] = []
+        column_filters: dict[str, Any] = dict()
         for col_idx, column in enumerate(nested_args.get("columns", [])):
             col_name: str | None = column.get("name")
             validate_column(col_name, col_idx, action_type="filtering")
@@ -124,12 +201,50 @@ class DataTableRequest:
             value = json.loads(value_str)
 
             where_filters.append(field_obj == value)
+            column_filters[col_name] = value
 
         if search_value and search_fields:
-            conditions = [field.contains(search_value) for field in search_fields]
-            where_filters.append(reduce(or_, conditions))
+            conditions: list[Expression] = []
+            for search_field in search_fields:
+                # Вместо поля может быть функция, возвращающая условие поиска
+                condition: Expression | None = (
+                    search_field.contains(search_value)
+                    if isinstance(search_field, ColumnBase)
+                    else search_field(search_value)
+                )
+                if condition is not None:
+                    conditions.append(condition)
+
+            if conditions:
+                where_filters.append(reduce(or_, conditions))
+            else:
+                # Совпадений точно нет
+                where_filters.append(SQL("0"))
+
+        after: list[Any] | None = None
+        if "after" in nested_args:
+            after_str: str = nested_args["after"]
+            try:
+                after = json.loads(after_str) if after_str else []
+            except json.JSONDecodeError:
+                after = None
+
+            if not isinstance(after, list):
+                abort(
+                    HTTPStatus.BAD_REQUEST,
+                    description="Parameter 'after' must be a JSON list",
+                )
+
+        count: str = nested_args.get("count", "exact")
+        if count not in ("exact", "cached", "none"):
+            abort(
+                HTTPStatus.BAD_REQUEST,
+                description=f"Unknown value {count!r} of parameter 'count'",
+            )
 
         order_list: list[Expression] = []
+        order_by_columns: list[tuple[str, str]] = []
+        order_by_fields: list[tuple[ColumnBase | None, str]] = []
 
         orders = nested_args.get("order", [])
 
@@ -140,16 +255,24 @@ class DataTableRequest:
             validate_column(col_name, col_idx, action_type="sorting")
 
             field_obj: ColumnBase | None = get_column(col_name)
+            direction: str = order_data.get("dir", "asc")
+            order_by_fields.append((field_obj, direction))
+
             if not field_obj:
                 field_obj = SQL(col_name)
 
-            direction: str = order_data.get("dir", "asc")
             order_list.append(
                 field_obj.desc() if direction == "desc" else field_obj.asc()
             )
+            order_by_columns.append((col_name, direction))
 
         if not order_list:
             order_list.append(default_order)
+            order_by_fields.append(
+                (default_order.node, default_order.direction.lower())
+                if isinstance(default_order, Ordering)
+                else (None, "asc")
+            )
 
         return cls(
             draw=draw,
@@ -157,15 +280,115 @@ class DataTableRequest:
             length=length,
             where_filters=where_filters,
             order_by=order_list,
+            search_value=search_value,
+            column_filters=column_filters,
+            order_by_columns=order_by_columns,
+            order_by_fields=order_by_fields,
+            after=after,
+            count=count,
         )
 
 
+class CountCache:
+    """
+    Кэш количества записей запросов (по тексту запроса с параметрами,
+    т.е. отдельно для каждого фильтра) на время ttl_secs
+    """
+
+    def __init__(self, ttl_secs: float, max_size: int) -> None:
+        self.ttl_secs = ttl_secs
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        self._items: dict[tuple, tuple[float, int]] = dict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def get_count(self, query: ModelSelect) -> int:
+        sql, params = query.sql()
+        key: tuple = (sql, tuple(params))
+
+        now: float = time.monotonic()
+        with self._lock:
+            item: tuple[float, int] | None = self._items.get(key)
+            if item and item[0] > now:
+                return item[1]
+
+        number: int = query.count()
+
+        with self._lock:
+            self._items.pop(key, None)
+            if len(self._items) >= self.max_size:
+                # Удаление самого старого
+                self._items.pop(next(iter(self._items)))
+
+            self._items[key] = (now + self.ttl_secs, number)
+
+        return number
+
+
+COUNT_CACHE = CountCache(
+    ttl_secs=API_COUNT_CACHE_TTL_SECS,
+    max_size=API_COUNT_CACHE_MAX_SIZE,
+)
+
+
+def get_keyset_fields(
+    query: ModelSelect,
+    data_table_rq: DataTableRequest,
+) -> tuple[list[Field], str] | None:
+    """
+    Функция возвращает поля ключа сортировки (с первичным ключом в конце для
+    однозначности) и направление, если по ним возможна постраничность курсором
+    """
+
+    model: type[Model] = query.model
+    primary_key: Field = model._meta.primary_key
+
+    fields: list[Field] = []
+    directions: set[str] = set()
+    for field_obj, direction in data_table_rq.order_by_fields:
+        # Поддерживаются только поля модели запроса с единым направлением
+        if not isinstance(field_obj, Field) or field_obj.model is not model:
+            return None
+
+        fields.append(field_obj)
+        directions.add(direction)
+
+    if len(directions) != 1:
+        return None
+
+    if primary_key not in fields:
+        fields.append(primary_key)
+
+    return fields, directions.pop()
+
+
+def get_keyset_value(obj: Model, fields: list[Field]) -> list[Any] | None:
+    values: list[Any] = []
+    for field_obj in fields:
+        value: Any = field_obj.db_value(obj.__data__.get(field_obj.name))
+
+        # Сравнение с NULL не дает результата, такая строка не может быть курсором
+        if value is None:
+            return None
+
+        if isinstance(value, date):
+            value = str(value)
+
+        values.append(value)
+
+    return values
+
+
 def prepare_datatables_response(
     query: ModelSelect,
     request: Request,
     models: list[type[Model]],
     allowed_columns: list[str | Field],
-    search_fields: list[Field],
+    search_fields: list[Field | Callable[[str], Expression | None]],
     default_order: Expression,
     to_dict: Callable[[Model], dict[str, Any]],
 ) -> Response:
@@ -177,110 +400,175 @@ def prepare_datatables_response(
         default_order=default_order,
     )
 
-    total_records: int = query.count()
-    records_filtered: int = total_records
+    def get_count(query: ModelSelect) -> int | None:
+        match data_table_rq.count:
+            case "cached":
+                return COUNT_CACHE.get_count(query)
+            case "none":
+                return None
+            case _:
+                return query.count()
+
+    # Режим курсора, если клиент его запросил и сортировка это позволяет
+    keyset: tuple[list[Field], str] | None = (
+        get_keyset_fields(query, data_table_rq)
+        if data_table_rq.after is not None
+        else None
+    )
+    after: list[Any] = data_table_rq.after or []
+    if keyset and after and len(after) != len(keyset[0]):
+        abort(
+            HTTPStatus.BAD_REQUEST,
+            description=f"Parameter 'after' must contain {len(keyset[0])} values",
+        )
+
+    total_records: int | None = get_count(query)
+    records_filtered: int | None = total_records
     items: list[dict[str, Any]] = []
+    next_after: list[Any] | None = None
 
     # Фильтрация, пагинация, сортировки имеют смысл только, если есть записи
-    if total_records > 0:
+    if total_records is None or total_records > 0:
         if data_table_rq.where_filters:
             query = query.where(*data_table_rq.where_filters)
 
-        records_filtered = query.count()
+            # Без фильтров количество совпадает с общим
+            records_filtered = get_count(query)
+
+        if keyset:
+            fields, direction = keyset
+
+            # Переход к странице поиском по индексу, а не пропуском строк
+            if after:
+                query = query.where(
+                    Tuple(*fields) > Tuple(*after)
+                    if direction == "asc"
+                    else Tuple(*fields) < Tuple(*after)
+                )
+
+            query = query.order_by(
+                *[f.desc() if direction == "desc" else f.asc() for f in fields]
+            ).limit(data_table_rq.length)
+        else:
+            query = (
+                query.order_by(*data_table_rq.order_by)
+                .offset(data_table_rq.start)
+                .limit(data_table_rq.length)
+            )
+
+        objects: list[Model] = list(query.objects())
+        items = [to_dict(obj) for obj in objects]
+
+        if keyset and objects and len(objects) == data_table_rq.length:
+            next_after = get_keyset_value(objects[-1], keyset[0])
+
+    data: dict[str, Any] = {
+        "draw": data_table_rq.draw,
+        "recordsTotal": total_records,
+        "recordsFiltered": records_filtered,
+        "data": items,
+    }
+    if data_table_rq.after is not None:
+        data["next_after"] = next_after
+
+    return jsonify(data)
+
+
+def prepare_packed_logs_datatables_response(
+    source: TaskRun | Task,
+    request: Request,
+    allowed_columns: list[Field] = TASK_RUN_LOGS_ALLOWED_COLUMNS,
+) -> Response:
+    """
+    Аналог prepare_datatables_response для запуска (или всех запусков задачи),
+    чьи логи упакованы в чанки или перенесены в архив.
+    Без фильтрации и с сортировкой по id страница берется по индексу чанков,
+    иначе логи читаются по одному, а в памяти держится не больше start + length
+    логов (см. slice_logs)
+    """
+
+    data_table_rq = DataTableRequest.from_request(
+        request,
+        models=[TaskRunLog],
+        allowed_columns=allowed_columns,
+        search_fields=TASK_RUN_LOGS_SEARCH_FIELDS,
+        default_order=TaskRunLog.id.asc(),
+    )
+
+    total_records: int = source.get_number_of_logs()
+    records_filtered: int = total_records
+
+    start: int = data_table_rq.start
+    length: int = data_table_rq.length
+    if length < 0:
+        length = total_records
+
+    order_by_columns: list[tuple[str, str]] = data_table_rq.order_by_columns
+    is_order_by_id: bool = not order_by_columns or (
+        len(order_by_columns) == 1 and order_by_columns[0][0] == TaskRunLog.id.name
+    )
+    has_filters: bool = bool(data_table_rq.search_value or data_table_rq.column_filters)
+
+    if is_order_by_id and not has_filters:
+        desc: bool = bool(order_by_columns) and order_by_columns[0][1] == "desc"
+        logs: list[TaskRunLog] = source.get_logs_page(start, length, desc=desc)
+
+    else:
+        search_value: str = data_table_rq.search_value.lower()
+        column_filters: dict[str, Any] = data_table_rq.column_filters
+
+        # Значения берутся из __data__, чтобы для task_run сравнивался id
+        # запуска без его загрузки
+        def is_matched(log: TaskRunLog) -> bool:
+            if search_value and not (
+                search_value in log.text.lower()
+                or search_value in log.kind.value.lower()
+            ):
+                return False
+
+            return all(
+                log.__data__.get(name) == value
+                for name, value in column_filters.items()
+            )
 
-        query = (
-            query.order_by(*data_table_rq.order_by)
-            .offset(data_table_rq.start)
-            .limit(data_table_rq.length)
+        order_by: list[tuple[str, bool]] = [
+            (name, direction == "desc") for name, direction in order_by_columns
+        ]
+
+        # Логи и так идут по возрастанию id
+        if order_by == [(TaskRunLog.id.name, False)]:
+            order_by = []
+
+        logs, records_filtered = slice_logs(
+            (log for log in source.iter_logs() if is_matched(log)),
+            start=start,
+            length=length,
+            order_by=order_by,
         )
-        items = [to_dict(obj) for obj in query.objects()]
 
     return jsonify(
         {
             "draw": data_table_rq.draw,
             "recordsTotal": total_records,
             "recordsFiltered": records_filtered,
-            "data": items,
+            "data": [log.to_dict() for log in logs],
         }
     )
 
 
 api_bp = Blueprint("api", __name__)
 
+CHANGE_FEED = ChangeFeed(
+    poll_interval_secs=CHANGE_FEED_POLL_INTERVAL_SECS,
+    max_logs=CHANGE_FEED_MAX_LOGS,
+    subscription_max_size=CHANGE_FEED_SUBSCRIPTION_MAX_SIZE,
+)
+
 
 @api_bp.route("/tasks")
 def tasks() -> Response:
-    subquery_last_started_run = (
-        TaskRun.select(
-            TaskRun,
-            TaskRun.work_status.alias("work_status"),
-            fn.MAX(TaskRun.id),
-        )
-        .where(TaskRun.status != TaskRunStatusEnum.PENDING)
-        .group_by(TaskRun.task)
-        .alias("last_started_run")
-    )
-
-    subquery_nearest_scheduled_run = (
-        TaskRun.select(
-            TaskRun.task,
-            TaskRun.scheduled_date,
-            fn.MAX(TaskRun.id),
-        )
-        .where(
-            (TaskRun.status == TaskRunStatusEnum.PENDING)
-            & TaskRun.scheduled_date.is_null(False)
-        )
-        .group_by(TaskRun.task)
-        .alias("nearest_scheduled_run")
-    )
-
-    # TODO: Подумать над названием свойств с db_ - мб что-то по другому назвать
-    #       В ответе их с таким же названием возвращать?
-    query = (
-        Task.select(
-            Task,
-            fn.COALESCE(
-                subquery_last_started_run.c.work_status,
-                TaskRunWorkStatusEnum.NONE,
-            ).alias("db_last_work_status"),
-            subquery_last_started_run.c.start_date.alias(
-                "db_last_started_run_start_date"
-            ),
-            fn.COALESCE(subquery_last_started_run.c.seq, 0).alias("db_number_of_runs"),
-            subquery_last_started_run.c.seq.alias("db_last_started_run_seq"),
-            subquery_nearest_scheduled_run.c.scheduled_date.alias(
-                "db_next_scheduled_date"
-            ),
-        )
-        .join(
-            subquery_last_started_run,
-            JOIN.LEFT_OUTER,
-            on=(Task.id == subquery_last_started_run.c.task_id),
-        )
-        .join(
-            subquery_nearest_scheduled_run,
-            JOIN.LEFT_OUTER,
-            on=(Task.id == subquery_nearest_scheduled_run.c.task_id),
-        )
-    )
-
-    # TODO: Не соответствует Task.to_dict
-    def to_dict(obj: Model) -> dict[str, Any]:
-        return {
-            **model_to_dict(obj, recurse=False),
-            **{
-                "url_path": obj.url_path,
-                "number_of_runs": obj.db_number_of_runs,
-                "last_started_run_seq": obj.db_last_started_run_seq,
-                "last_started_run_start_date": obj.db_last_started_run_start_date,
-                "next_scheduled_date": obj.db_next_scheduled_date,
-                "last_work_status": obj.db_last_work_status,
-            },
-        }
-
     return prepare_datatables_response(
-        query=query,
+        query=Task.select_with_stats(),
         request=request,
         models=[Task],
         allowed_columns=[
@@ -295,6 +583,7 @@ def tasks() -> Response:
             "db_number_of_runs",
             "db_last_started_run_seq",
             "db_next_scheduled_date",
+            "db_success_rate",
         ],
         search_fields=[
             Task.name,
@@ -303,15 +592,39 @@ def tasks() -> Response:
             Task.cron,
         ],
         default_order=Task.id.asc(),
-        to_dict=to_dict,
+        to_dict=Task.to_dict,
     )
 
 
+# Сроки хранения, переопределяющие значения из конфига
+TASK_STORAGE_DAYS_FIELDS: list[str] = [
+    "logs_storage_days",
+    "archived_logs_storage_days",
+    "task_run_storage_days",
+]
+
+
+def validate_task_storage_days(data: dict[str, Any]) -> None:
+    for name in TASK_STORAGE_DAYS_FIELDS:
+        value: Any = data.get(name)
+        if value is None:
+            continue
+
+        # NOTE: bool является подклассом int
+        if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+            abort(
+                HTTPStatus.BAD_REQUEST,
+                description=f"The {name!r} parameter must be null or a positive integer.",
+            )
+
+
 @api_bp.route("/task/create", methods=["POST"])
 def task_create() -> Response | tuple[Response, int]:
     data: dict[str, Any] = request.json
     data["name"] = str(data.get("name") or "").strip()
 
+    validate_task_storage_days(data)
+
     name: str = data["name"]
     if not name:
         return (
@@ -361,6 +674,7 @@ def task_update(task_id: int) -> Response | tuple[Response, int]:
     task: Task = get_task(task_id)
 
     data: dict[str, Any] = request.json
+    validate_task_storage_days(data)
 
     if "name" in data:
         name: str = str(data["name"] or "").strip()
@@ -405,6 +719,10 @@ def task_update(task_id: int) -> Response | tuple[Response, int]:
     if "description" in data:
         task.description = data["description"]
 
+    for name in TASK_STORAGE_DAYS_FIELDS:
+        if name in data:
+            setattr(task, name, data[name])
+
     task.save()
 
     return jsonify(
@@ -418,6 +736,13 @@ def task_update(task_id: int) -> Response | tuple[Response, int]:
 @api_bp.route("/task/<int:task_id>/logs")
 def task_logs(task_id: int) -> Response:
     task: Task = get_task(task_id)
+    if task.has_packed_logs:
+        return prepare_packed_logs_datatables_response(
+            task,
+            request,
+            allowed_columns=TASK_LOGS_ALLOWED_COLUMNS,
+        )
+
     query = TaskRunLog.select().where(
         TaskRunLog.task_run.in_(TaskRun.select().where(TaskRun.task == task)),
     )
@@ -426,17 +751,8 @@ def task_logs(task_id: int) -> Response:
         query=query,
         request=request,
         models=[TaskRunLog],
-        allowed_columns=[
-            TaskRunLog.id,
-            TaskRunLog.task_run,
-            TaskRunLog.text,
-            TaskRunLog.kind,
-            TaskRunLog.date,
-        ],
-        search_fields=[
-            TaskRunLog.text,
-            TaskRunLog.kind,
-        ],
+        allowed_columns=TASK_LOGS_ALLOWED_COLUMNS,
+        search_fields=TASK_RUN_LOGS_SEARCH_FIELDS,
         default_order=TaskRunLog.id.asc(),
         to_dict=lambda obj: obj.to_dict(),
     )
@@ -555,24 +871,19 @@ def task_run_do_send_notifications(task_id: int, task_run_seq: int) -> Response:
 
 @api_bp.route("/task/<int:task_id>/run/<int:task_run_seq>/logs")
 def task_run_logs(task_id: int, task_run_seq: int) -> Response:
-    query = get_task_run(task_id, task_run_seq).logs.order_by(TaskRunLog.id)
+    task_run: TaskRun = get_task_run(task_id, task_run_seq)
+    if task_run.has_packed_logs:
+        return prepare_packed_logs_datatables_response(task_run, request)
+
+    query = task_run.logs.order_by(TaskRunLog.id)
 
     # TODO: Совпадает с task /logs
     return prepare_datatables_response(
         query=query,
         request=request,
         models=[TaskRunLog],
-        allowed_columns=[
-            TaskRunLog.id,
-            # TaskRunLog.task_run,  # TODO: Не нужно
-            TaskRunLog.text,
-            TaskRunLog.kind,
-            TaskRunLog.date,
-        ],
-        search_fields=[
-            TaskRunLog.text,
-            TaskRunLog.kind,
-        ],
+        allowed_columns=TASK_RUN_LOGS_ALLOWED_COLUMNS,
+        search_fields=TASK_RUN_LOGS_SEARCH_FIELDS,
         default_order=TaskRunLog.id.asc(),
         to_dict=lambda obj: obj.to_dict(),
     )
@@ -588,16 +899,8 @@ def task_run_logs_last(task_id: int) -> Response:
         data_table_rq = DataTableRequest.from_request(
             request,
             models=[TaskRunLog],
-            allowed_columns=[
-                TaskRunLog.id,
-                TaskRunLog.text,
-                TaskRunLog.kind,
-                TaskRunLog.date,
-            ],
-            search_fields=[
-                TaskRunLog.text,
-                TaskRunLog.kind,
-            ],
+            allowed_columns=TASK_RUN_LOGS_ALLOWED_COLUMNS,
+            search_fields=TASK_RUN_LOGS_SEARCH_FIELDS,
             default_order=TaskRunLog.id.asc(),
         )
         return jsonify(
@@ -612,6 +915,144 @@ def task_run_logs_last(task_id: int) -> Response:
     return task_run_logs(task_id, task_run_seq)
 
 
+def prepare_logs_tail_response(task_run: TaskRun | None) -> Response:
+    last_id: int = request.args.get("last_id", default=0, type=int)
+    limit: int = request.args.get(
+        "limit", default=API_LOGS_TAIL_LIMIT_DEFAULT, type=int
+    )
+    if limit <= 0:
+        abort(
+            HTTPStatus.BAD_REQUEST,
+            description="The 'limit' parameter must be greater than 0",
+        )
+
+    logs: list[TaskRunLog] = task_run.get_logs_after(last_id, limit) if task_run else []
+
+    return jsonify(
+        prepare_response(
+            status=StatusEnum.OK,
+            result=[
+                dict(
+                    task_run=task_run.to_dict() if task_run else None,
+                    logs=[log.to_dict() for log in logs],
+                    last_id=logs[-1].id if logs else last_id,
+                    has_more=len(logs) == limit,
+                )
+            ],
+        ),
+    )
+
+
+@api_bp.route("/task/<int:task_id>/run/<int:task_run_seq>/logs/tail")
+def task_run_logs_tail(task_id: int, task_run_seq: int) -> Response:
+    return prepare_logs_tail_response(get_task_run(task_id, task_run_seq))
+
+
+@api_bp.route("/task/<int:task_id>/run/last/logs/tail")
+def task_run_logs_tail_last(task_id: int) -> Response:
+    task: Task = get_task(task_id)
+    task_run_seq: int | None = task.last_started_run_seq
+    return prepare_logs_tail_response(
+        get_task_run(task_id, task_run_seq) if task_run_seq else None
+    )
+
+
+def prepare_logs_search_response(filters: list[Expression]) -> Response:
+    value: str = request.args.get("q", default="").strip()
+    if len(value) < TaskRunLogSearch.MIN_LENGTH:
+        abort(
+            HTTPStatus.BAD_REQUEST,
+            description=(
+                "The 'q' parameter must contain at least "
+                f"{TaskRunLogSearch.MIN_LENGTH} characters"
+            ),
+        )
+
+    limit: int = request.args.get(
+        "limit", default=API_LOGS_SEARCH_LIMIT_DEFAULT, type=int
+    )
+    if limit <= 0:
+        abort(
+            HTTPStatus.BAD_REQUEST,
+            description="The 'limit' parameter must be greater than 0",
+        )
+
+    def to_dict(log: TaskRunLog) -> dict[str, Any]:
+        data: dict[str, Any] = log.to_dict()
+
+        # Текст лога экранируется, разметкой будут только совпадения
+        data["snippet"] = (
+            html.escape(log.search_snippet)
+            .replace(TaskRunLogSearch.SNIPPET_START, "<mark>")
+            .replace(TaskRunLogSearch.SNIPPET_END, "</mark>")
+        )
+        return data
+
+    logs: list[TaskRunLog] = TaskRunLogSearch.search(
+        value, filters=filters, limit=limit
+    )
+
+    return jsonify(
+        prepare_response(
+            status=StatusEnum.OK,
+            result=[to_dict(log) for log in logs],
+        ),
+    )
+
+
+@api_bp.route("/task/<int:task_id>/logs/search")
+def task_logs_search(task_id: int) -> Response:
+    task: Task = get_task(task_id)
+    return prepare_logs_search_response(
+        filters=[
+            TaskRunLog.task_run.in_(TaskRun.select().where(TaskRun.task == task)),
+        ]
+    )
+
+
+@api_bp.route("/task/<int:task_id>/run/<int:task_run_seq>/logs/search")
+def task_run_logs_search(task_id: int, task_run_seq: int) -> Response:
+    task_run: TaskRun = get_task_run(task_id, task_run_seq)
+    return prepare_logs_search_response(filters=[TaskRunLog.task_run == task_run])
+
+
+@api_bp.route("/events")
+def events() -> Response:
+    task_id: int | None = request.args.get("task_id", type=int)
+    subscription = CHANGE_FEED.subscribe(task_id=task_id)
+
+    def prepare_event(event: Event) -> str:
+        return f"event: {event.name}\ndata: {current_app.json.dumps(event.data)}\n\n"
+
+    def generate() -> Iterator[str]:
+        try:
+            # Интервал переподключения клиента при разрыве соединения
+            yield "retry: 1000\n\n"
+
+            while not subscription.is_closed:
+                event: Event | None = subscription.get(
+                    timeout=CHANGE_FEED_KEEP_ALIVE_SECS
+                )
+                if event is None:
+                    # Комментарий для поддержания соединения
+                    yield ": keep-alive\n\n"
+                    continue
+
+                yield prepare_event(event)
+
+        finally:
+            CHANGE_FEED.unsubscribe(subscription)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 @api_bp.route("/notifications")
 def notifications() -> Response:
     def to_dict(obj: Notification) -> dict[str, Any]:
@@ -725,19 +1166,59 @@ def notification_do_stop(notification_id: int) -> Response:
     )
 
 
+def get_date_arg(name: str) -> datetime | None:
+    value: str | None = request.args.get(name)
+    if not value:
+        return None
+
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(
+            HTTPStatus.BAD_REQUEST,
+            description=f"Parameter '{name}' must be an ISO date",
+        )
+
+
 @api_bp.route("/cron/get-next-dates")
 def cron_get_next_dates() -> Response:
     if "cron" not in request.args:
         raise BadRequest('Отсутствует параметр "cron"')
 
     cron: str = request.args["cron"]
-    number: int = int(request.args.get("number", 5))
+
+    # Название задачи для вычисления значений H
+    seed: str | None = request.args.get("seed") or None
+
+    start_date: datetime = get_date_arg("start_date") or datetime.now()
+    end_date: datetime | None = get_date_arg("end_date")
+
+    # Для окна дат по умолчанию возвращаются все даты окна
+    number: int = request.args.get(
+        "number",
+        default=API_CRON_NEXT_DATES_MAX_NUMBER if end_date else 5,
+        type=int,
+    )
+    if not 0 < number <= API_CRON_NEXT_DATES_MAX_NUMBER:
+        abort(
+            HTTPStatus.BAD_REQUEST,
+            description=(
+                f"Parameter 'number' must be between 1 "
+                f"and {API_CRON_NEXT_DATES_MAX_NUMBER}"
+            ),
+        )
 
     status = StatusEnum.OK
     text = None
     try:
-        it = get_scheduled_date_generator(cron)
-        result = [dict(date=next(it)) for _ in range(number)]
+        result = [
+            dict(date=scheduled_date)
+            for scheduled_date in get_cron(cron, seed=seed).get_dates(
+                start_date=start_date,
+                end_date=end_date,
+                number=number,
+            )
+        ]
     except Exception:
         status = StatusEnum.ERROR
         text = "Неправильный формат"
@@ -750,3 +1231,33 @@ def cron_get_next_dates() -> Response:
             result=result,
         ),
     )
+
+
+@api_bp.route("/forecast")
+def forecast_get() -> Response:
+    start_date: datetime = get_date_arg("start_date") or datetime.now()
+    end_date: datetime = get_date_arg("end_date") or start_date + timedelta(days=1)
+    limit: int = request.args.get(
+        "limit",
+        default=API_FORECAST_LIMIT_DEFAULT,
+        type=int,
+    )
+    if not 0 < limit <= API_FORECAST_MAX_LIMIT:
+        abort(
+            HTTPStatus.BAD_REQUEST,
+            description=(
+                f"Parameter 'limit' must be between 1 and {API_FORECAST_MAX_LIMIT}"
+            ),
+        )
+
+    try:
+        forecast: Forecast = get_forecast(start_date, end_date)
+    except ValueError as e:
+        abort(HTTPStatus.BAD_REQUEST, description=str(e))
+
+    return jsonify(
+        prepare_response(
+            status=StatusEnum.OK,
+            result=[forecast.to_dict(limit=limit)],
+        ),
+    )
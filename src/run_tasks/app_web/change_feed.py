@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import logging
+import queue
+import threading
+
+from dataclasses import dataclass
+from typing import Any
+
+from peewee import fn
+
+from run_tasks.db import (
+    TaskRun,
+    TaskRunLog,
+    TaskRunStatusEnum,
+    Notification,
+)
+
+
+log = logging.getLogger("werkzeug")
+
+
+@dataclass
+class Event:
+    name: str
+    data: dict[str, Any]
+    task_id: int | None = None
+
+    # Событие только для подписчиков на задачу
+    only_for_task: bool = False
+
+
+class Subscription:
+    def __init__(self, task_id: int | None, max_size: int) -> None:
+        # Если задача указана, то будут приходить и строки логов ее запусков
+        self.task_id = task_id
+
+        self._queue: queue.Queue[Event] = queue.Queue(maxsize=max_size)
+        self.is_closed: bool = False
+
+    def put(self, event: Event) -> None:
+        if self.is_closed:
+            return
+
+        if event.task_id is not None and self.task_id not in (None, event.task_id):
+            return
+
+        if event.only_for_task and self.task_id is None:
+            return
+
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Подписчик не успевает забирать события. Клиент переподключится
+            # и заново запросит актуальное состояние
+            self.close()
+
+    def get(self, timeout: float | None = None) -> Event | None:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self.is_closed = True
+
+
+class ChangeFeed:
+    """
+    Лента изменений: новые логи, смена статусов запусков и количество неотправленных
+    уведомлений. Изменения проверяются одним общим потоком и только пока есть
+    подписчики, после чего рассылаются им
+    """
+
+    def __init__(
+        self,
+        poll_interval_secs: float,
+        max_logs: int,
+        subscription_max_size: int,
+    ) -> None:
+        self.poll_interval_secs = poll_interval_secs
+        self.max_logs = max_logs
+        self.subscription_max_size = subscription_max_size
+
+        self._subscriptions: list[Subscription] = []
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+        self._reset_state()
+
+    def _reset_state(self) -> None:
+        self._last_log_id: int | None = None
+        self._last_task_run_id: int | None = None
+        self._task_run_statuses: dict[int, TaskRunStatusEnum] = dict()
+        self._number_of_unsent: int | None = None
+
+    @property
+    def number_of_subscriptions(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, task_id: int | None = None, start: bool = True) -> Subscription:
+        subscription = Subscription(
+            task_id=task_id,
+            max_size=self.subscription_max_size,
+        )
+
+        with self._lock:
+            self._subscriptions.append(subscription)
+
+            # Новый подписчик сразу получает известное значение
+            if self._number_of_unsent is not None:
+                subscription.put(self._get_event_notifications())
+
+            if start and not self._thread:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=type(self).__name__,
+                    daemon=True,  # Thread dies with the program
+                )
+                self._thread.start()
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscription.close()
+
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, event: Event) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def _run(self) -> None:
+        stop_event = threading.Event()
+
+        while not stop_event.wait(self.poll_interval_secs):
+            with self._lock:
+                self._subscriptions = [
+                    s for s in self._subscriptions if not s.is_closed
+                ]
+
+                # Без подписчиков база не опрашивается
+                if not self._subscriptions:
+                    self._thread = None
+                    self._reset_state()
+                    return
+
+            try:
+                self.poll()
+            except Exception:
+                log.exception("Ошибка при проверке изменений:")
+
+    def _get_event_notifications(self) -> Event:
+        return Event(
+            name="notifications",
+            data=dict(number=self._number_of_unsent),
+        )
+
+    def _poll_logs(self) -> list[Event]:
+        max_log_id: int = TaskRunLog.select(fn.MAX(TaskRunLog.id)).scalar() or 0
+
+        # При первой проверке запоминается текущее состояние
+        if self._last_log_id is None or max_log_id <= self._last_log_id:
+            self._last_log_id = max_log_id
+            return []
+
+        with self._lock:
+            task_ids: set[int] = {
+                s.task_id for s in self._subscriptions if s.task_id is not None
+            }
+
+        # Строки логов нужны только подписчикам на задачи
+        if not task_ids:
+            self._last_log_id = max_log_id
+            return []
+
+        logs: list[TaskRunLog] = list(
+            TaskRunLog.select(TaskRunLog, TaskRun.id, TaskRun.task)
+            .join(TaskRun)
+            .where(
+                TaskRunLog.id.between(self._last_log_id + 1, max_log_id),
+                TaskRun.task.in_(task_ids),
+            )
+            .order_by(TaskRunLog.id)
+            .limit(self.max_logs)
+        )
+        self._last_log_id = logs[-1].id if len(logs) == self.max_logs else max_log_id
+
+        run_by_logs: dict[int, list[TaskRunLog]] = dict()
+        for log_item in logs:
+            run_by_logs.setdefault(log_item.task_run.id, []).append(log_item)
+
+        return [
+            Event(
+                name="logs",
+                task_id=items[0].task_run.task_id,
+                only_for_task=True,
+                data=dict(
+                    task_id=items[0].task_run.task_id,
+                    task_run_id=task_run_id,
+                    last_id=items[-1].id,
+                    logs=[log_item.to_dict() for log_item in items],
+                ),
+            )
+            for task_run_id, items in run_by_logs.items()
+        ]
+
+    def _poll_task_runs(self) -> list[Event]:
+        is_first: bool = self._last_task_run_id is None
+
+        where = TaskRun.is_active | TaskRun.id.in_(list(self._task_run_statuses))
+        if not is_first:
+            # Запуски, появившиеся и завершившиеся между проверками
+            where |= TaskRun.id > self._last_task_run_id
+
+        changed_runs: list[TaskRun] = []
+        statuses: dict[int, TaskRunStatusEnum] = dict()
+
+        for run in TaskRun.select().where(where):
+            if self._task_run_statuses.get(run.id) != run.status:
+                changed_runs.append(run)
+
+            if run.is_active:
+                statuses[run.id] = run.status
+
+        self._task_run_statuses = statuses
+        if is_first:
+            self._last_task_run_id = TaskRun.select(fn.MAX(TaskRun.id)).scalar() or 0
+            return []
+
+        for run in changed_runs:
+            self._last_task_run_id = max(self._last_task_run_id, run.id)
+
+        return [
+            Event(
+                name="task_run",
+                task_id=run.task_id,
+                data=run.to_dict(),
+            )
+            for run in changed_runs
+        ]
+
+    def _poll_notifications(self) -> list[Event]:
+        number: int = Notification.select().where(Notification.is_unsent).count()
+        if number == self._number_of_unsent:
+            return []
+
+        self._number_of_unsent = number
+        return [self._get_event_notifications()]
+
+    def poll(self) -> list[Event]:
+        """
+        Функция проверяет изменения в базе и рассылает события подписчикам
+        """
+
+        events: list[Event] = (
+            self._poll_logs() + self._poll_task_runs() + self._poll_notifications()
+        )
+        for event in events:
+            self.publish(event)
+
+        return events
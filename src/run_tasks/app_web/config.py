@@ -18,5 +18,20 @@ USERS: dict[str, str] = {
     CONFIG_WEB["login"]: CONFIG_WEB["password"],
 }
 
+CONFIG_CHANGE_FEED: dict[str, Any] = CONFIG_WEB["change_feed"]
+CHANGE_FEED_POLL_INTERVAL_SECS: float = CONFIG_CHANGE_FEED["poll_interval_secs"]
+CHANGE_FEED_KEEP_ALIVE_SECS: float = CONFIG_CHANGE_FEED["keep_alive_secs"]
+CHANGE_FEED_MAX_LOGS: int = CONFIG_CHANGE_FEED["max_logs"]
+CHANGE_FEED_SUBSCRIPTION_MAX_SIZE: int = CONFIG_CHANGE_FEED["subscription_max_size"]
+
+CONFIG_COUNT_CACHE: dict[str, Any] = CONFIG_WEB["count_cache"]
+API_COUNT_CACHE_TTL_SECS: float = CONFIG_COUNT_CACHE["ttl_secs"]
+API_COUNT_CACHE_MAX_SIZE: int = CONFIG_COUNT_CACHE["max_size"]
+
 # TODO: Вынести в CONFIG
 API_PAGE_LENGTH_DEFAULT: int = 10
+API_LOGS_TAIL_LIMIT_DEFAULT: int = 1000
+API_LOGS_SEARCH_LIMIT_DEFAULT: int = 100
+API_CRON_NEXT_DATES_MAX_NUMBER: int = 10_000
+API_FORECAST_LIMIT_DEFAULT: int = 10
+API_FORECAST_MAX_LIMIT: int = 1000
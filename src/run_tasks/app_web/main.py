@@ -85,7 +85,8 @@ def task(task_identifier: str) -> str:
     return render_template(
         "task.html",
         title=PROJECT_NAME,
-        task=get_task_by_url_path(task_identifier),
+        # Статистика запусков для шаблона получается одним запросом
+        task=get_task_by_url_path(task_identifier).get_with_stats(),
     )
 
 
@@ -257,15 +257,71 @@ LANG_DATATABLES = {
 }
 
 
+// Общий для страницы канал событий об изменениях на сервере (Server-Sent Events)
+let CHANGE_FEED = null;
+
+
+function get_change_feed() {
+    if (CHANGE_FEED == null) {
+        let url = "/api/events";
+
+        // Для страниц задачи приходят также строки логов ее запусков
+        if (typeof TASK_ID !== "undefined") {
+            url += `?task_id=${TASK_ID}`;
+        }
+
+        CHANGE_FEED = new EventSource(url);
+    }
+    return CHANGE_FEED;
+}
+
+
+function on_change_feed(event_names, callback) {
+    const listener = e => callback(e.type, e.data ? JSON.parse(e.data) : null);
+
+    let change_feed = get_change_feed();
+    for (let event_name of event_names) {
+        change_feed.addEventListener(event_name, listener);
+    }
+
+    // Функция отписки
+    return () => {
+        for (let event_name of event_names) {
+            change_feed.removeEventListener(event_name, listener);
+        }
+    };
+}
+
+
+function throttle(func, delay_ms) {
+    let timeout_id = null;
+
+    return function() {
+        if (timeout_id != null) {
+            return;
+        }
+
+        timeout_id = setTimeout(
+            () => {
+                timeout_id = null;
+                func();
+            },
+            delay_ms
+        );
+    };
+}
+
+
 const DATATABLES_AUTO_RELOAD = new Map();
 const DATATABLES_AUTO_RELOAD_STOPPING = [];
 
 
 function stop_datatables_auto_reload() {
-    for (const [tableId, intervalId] of DATATABLES_AUTO_RELOAD) {
+    for (const [tableId, unsubscribe] of DATATABLES_AUTO_RELOAD) {
         console.log(`Stopping auto reload in table ${tableId}`);
-        clearInterval(intervalId);
+        unsubscribe();
     }
+    DATATABLES_AUTO_RELOAD.clear();
 }
 
 
@@ -275,19 +331,23 @@ function tableInitComplete(settings, json) {
     if (!DATATABLES_AUTO_RELOAD_STOPPING.includes(tableId)) {
         let api = this.api();
 
-        let intervalId = setInterval(
+        // Таблица перезагружается при изменениях на сервере, но не чаще раза в секунду
+        let reload = throttle(
             function () {
                 if (DATATABLES_AUTO_RELOAD_STOPPING.includes(tableId)) {
-                    clearInterval(intervalId);
                     return;
                 }
 
                 // Пользовательская пагинация не сбрасывается при обновлении
                 api.ajax.reload(null, false);
             },
-            5000 // Каждые 5 секунд
+            1000
         );
-        DATATABLES_AUTO_RELOAD.set(tableId, intervalId);
+        // События, при которых меняются данные таблицы, задаются в настройках
+        // таблицы autoReloadEvents, по умолчанию - изменения запусков
+        let events = settings.oInit.autoReloadEvents || ["task_run"];
+        let unsubscribe = on_change_feed(["open", ...events], reload);
+        DATATABLES_AUTO_RELOAD.set(tableId, unsubscribe);
     }
 }
 
@@ -316,6 +376,42 @@ function prepare_data_for_server_side(d) {
 }
 
 
+// Постраничность курсором: следующая страница запрашивается по ключу сортировки
+// последней строки предыдущей, а количество записей берется из кэша сервера.
+// Для произвольного перехода по страницам используется обычный offset
+function create_keyset_paging() {
+    // Курсоры по началу страницы, сбрасываются при смене сортировки и поиска
+    let state = {key: null, cursors: {}, start: 0, length: 0};
+
+    return {
+        data: function(d) {
+            prepare_data_for_server_side(d);
+
+            const key = JSON.stringify([d.order, d.search, d.length]);
+            if (key !== state.key) {
+                state = {key: key, cursors: {0: ""}, start: 0, length: 0};
+            }
+
+            const after = state.cursors[d.start];
+            if (after !== undefined) {
+                d.after = after;
+                d.count = "cached";
+            }
+
+            state.start = d.start;
+            state.length = d.length;
+            return d;
+        },
+        dataSrc: function(json) {
+            if (json.next_after != null) {
+                state.cursors[state.start + state.length] = JSON.stringify(json.next_after);
+            }
+            return json.data;
+        },
+    };
+}
+
+
 COMMON_PROPS_DATA_TABLE = {
     lengthMenu: [
         [10, 25, 50, 100],
@@ -799,12 +895,14 @@ $(function() {
         }
     });
 
-    if ($("#unsent-notifications").length) {
+    let $unsent_notifications = $("#unsent-notifications");
+    if ($unsent_notifications.length) {
         check_notifications_get_number_of_unsent();
-        setInterval(
-            check_notifications_get_number_of_unsent,
-            5000 // Каждые 5 секунд
-        );
+
+        on_change_feed(["notifications"], (event_name, data) => {
+            $unsent_notifications.text(data.number);
+            $unsent_notifications.toggleClass("d-none", data.number == 0);
+        });
     }
 });
 
@@ -190,6 +190,13 @@ $(function() {
             { data: 'last_started_run_start_date', name: 'db_last_started_run_start_date', title: 'Последний запуск', render: date_render, },
             { data: 'next_scheduled_date', name: 'db_next_scheduled_date', title: 'Следующий запуск', visible: false, render: date_render, },
             { data: 'number_of_runs', name: 'db_number_of_runs', title: 'Запуски', },
+            {
+                data: 'success_rate',
+                name: 'db_success_rate',
+                title: 'Успешные',
+                visible: false,
+                render: (data, type, row, meta) => data == null ? '' : `${Math.round(data * 100)}%`,
+            },
         ],
         order: [
             // Сортировка по возрастанию id
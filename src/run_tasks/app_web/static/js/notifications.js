@@ -17,6 +17,15 @@ function kind_render(data, type, row, meta) {
 }
 
 
+function text_render(data, type, row, meta) {
+    // Текст формируется при отправке
+    if (data == null) {
+        return type === 'display' ? `<i class="text-secondary">Будет сформирован при отправке</i>` : '';
+    }
+    return data;
+}
+
+
 function send_ajax_create_notification(url, method, data) {
     $.ajax({
         url: url,
@@ -113,10 +122,12 @@ $(function() {
     new DataTable('#table-notifications', {
         ajax: {
             url: '/api/notifications',
-            data: prepare_data_for_server_side,
+            ...create_keyset_paging(),
         },
         serverSide: true,
         rowId: 'id',
+        // Таблица перезагружается только при изменениях уведомлений
+        autoReloadEvents: ["notifications"],
         columns: [
             {
                 data: null, // Явное указание, что тут нет источника данных
@@ -129,7 +140,7 @@ $(function() {
             { data: 'task_run.id', name: "TaskRun.id", title: 'Ид. запуска', }, // TODO: Спрятать? Заполнять ссылку на запуск (брать task_run_seq)?
             { data: 'task_run.seq', name: "TaskRun.seq", title: 'Номер запуска', },
             { data: 'name', name: "name", title: 'Название', },
-            { data: 'text', name: "text", title: 'Текст', },
+            { data: 'text', name: "text", title: 'Текст', render: text_render, },
             { data: 'kind', name: "kind", title: 'Тип', render: kind_render, },
             { data: 'append_date', name: "append_date", title: 'Добавлено', render: date_render, },
             { data: 'sending_date', name: "sending_date", title: 'Отправлено', render: date_render, },
@@ -74,10 +74,7 @@ function update_task(task=null) {
 
 $(function() {
     update_task();
-    setInterval(
-        check_update_task,
-        1000 // Каждая секунда
-    );
+    on_change_feed(["open", "task_run"], check_update_task);
 
     new DataTable('#table-task-runs', {
         ajax: {
@@ -7,7 +7,7 @@ $(function() {
     new DataTable(`#${tableId}`, {
         ajax: {
             url: `/api/task/${TASK_ID}/logs`,
-            data: prepare_data_for_server_side,
+            ...create_keyset_paging(),
         },
         serverSide: true,
         rowId: 'id',
@@ -15,6 +15,8 @@ function process_cron() {
         method: "GET",
         data: {
             cron: cron,
+            // Значения H в расписании зависят от названия задачи
+            seed: $("#name").val() || $("#cron").data("seed"),
             number: 7,
         },
         contentType: "application/json; charset=utf-8",
@@ -43,6 +45,7 @@ function process_cron() {
 $(function() {
     process_cron();
     $("#cron").on("input change", () => process_cron());
+    $("#name").on("change", () => process_cron());
 
     $('[type="checkbox"][data-bs-toggle="collapse"][data-bs-target]').each(
         (i, item) => {
@@ -3,20 +3,69 @@ function is_last_uri() {
 }
 
 
+const TABLE_ID_LOGS = "table-task-run-logs";
+
+
+// Идентификатор последнего полученного лога и номер запуска, к которому он относится
+let tail_last_log_id = 0;
+let tail_task_run_seq = null;
+let tail_is_loading = false;
+let tail_need_reload = false;
+
+
 function check_update_task_run() {
-    send_ajax(
-        `/api/task/${window.TASK_ID}/run/${window.TASK_RUN_SEQ}`,
-        "GET",
-        null, // json
-        null, // css_selector_table
-        (css_selector_table, rs) => {
-            update_task_run(rs.result[0]);
-        }
-    );
+    // Предыдущий запрос еще не завершен, повторный будет после него
+    if (tail_is_loading) {
+        tail_need_reload = true;
+        return;
+    }
+    tail_is_loading = true;
+    tail_need_reload = false;
+
+    $.ajax({
+        url: `/api/task/${window.TASK_ID}/run/${window.TASK_RUN_SEQ}/logs/tail`,
+        method: "GET",
+        data: {last_id: tail_last_log_id},
+        dataType: "json",
+        success: data => on_ajax_success(data, null, (css_selector_table, rs) => {
+            let result = rs.result[0];
+            let task_run = result.task_run;
+            if (task_run == null) {
+                return;
+            }
+
+            let table = $(`#${TABLE_ID_LOGS}`).DataTable();
+
+            // На странице последнего запуска при появлении нового запуска логи начинаются заново
+            if (tail_task_run_seq != null && tail_task_run_seq != task_run.seq) {
+                table.clear();
+            }
+            tail_task_run_seq = task_run.seq;
+            tail_last_log_id = result.last_id;
+
+            // Пользовательская пагинация не сбрасывается при добавлении строк
+            table.rows.add(result.logs).draw(false);
+
+            update_task_run(task_run);
+
+            // Оставшиеся логи запрашиваются сразу
+            if (result.has_more) {
+                tail_need_reload = true;
+            }
+        }),
+        error: data => on_ajax_error(data),
+        complete: () => {
+            tail_is_loading = false;
+            if (tail_need_reload) {
+                check_update_task_run();
+            }
+        },
+    });
 }
 
 
-let interval_update_task_run = null;
+// Функция отписки от событий об изменениях на сервере
+let unsubscribe_update_task_run = null;
 
 
 function update_task_run(task_run=null) {
@@ -43,13 +92,14 @@ function update_task_run(task_run=null) {
         : task_run.work_status
     ;
 
-    // Завершение интервала для завершенных запусков
+    // Отписка от событий для завершенных запусков
     if (
-        interval_update_task_run != null
+        unsubscribe_update_task_run != null
         && !["none", "in_processed"].includes(work_status)
         && !is_last_uri()  // Если это не страница последнего запуска
     ) {
-        clearInterval(interval_update_task_run);
+        unsubscribe_update_task_run();
+        unsubscribe_update_task_run = null;
         stop_datatables_auto_reload();
     }
 
@@ -61,30 +111,34 @@ function update_task_run(task_run=null) {
 
 
 $(function() {
-    const tableId = "table-task-run-logs";
-
     update_task_run();
 
-    // Запуск интервала для не завершенных запусков
+    // Обновление для не завершенных запусков
     // Или для страницы последней задачи
     let auto_reload = ["none", "in_processed"].includes(window.TASK_RUN_WORK_STATUS)
         || is_last_uri();
-    if (auto_reload) {
-        interval_update_task_run = setInterval(
-            check_update_task_run,
-            1000 // Каждая секунда
-        );
-    } else {
-        // Отключение автообновления таблиц из base.js
-        DATATABLES_AUTO_RELOAD_STOPPING.push(tableId);
-    }
 
-    new DataTable(`#${tableId}`, {
-        ajax: {
-            url: `/api/task/${TASK_ID}/run/${window.TASK_RUN_SEQ}/logs`,
-            data: prepare_data_for_server_side,
-        },
-        serverSide: true,
+    // Отключение автообновления таблиц из base.js
+    // Для не завершенных запусков новые логи дописываются в таблицу по мере появления
+    DATATABLES_AUTO_RELOAD_STOPPING.push(TABLE_ID_LOGS);
+
+    let data_props = auto_reload
+        ? {
+            // Логи загружаются check_update_task_run
+            data: [],
+            deferRender: true,
+        }
+        : {
+            ajax: {
+                url: `/api/task/${TASK_ID}/run/${window.TASK_RUN_SEQ}/logs`,
+                ...create_keyset_paging(),
+            },
+            serverSide: true,
+        }
+    ;
+
+    new DataTable(`#${TABLE_ID_LOGS}`, {
+        ...data_props,
         rowId: 'id',
         columnDefs: [
             {
@@ -126,4 +180,14 @@ $(function() {
         ],
         ...COMMON_PROPS_DATA_TABLE,
     });
+
+    if (auto_reload) {
+        // Новые логи и статус запрашиваются при событиях об изменениях на сервере
+        // и при (пере)подключении к ним
+        unsubscribe_update_task_run = on_change_feed(
+            ["open", "task_run", "logs"],
+            check_update_task_run
+        );
+        check_update_task_run();
+    }
 });
@@ -5,12 +5,20 @@ __author__ = "ipetrash"
 
 
 import smtplib
+import threading
 import traceback
-from datetime import datetime
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
 from email.message import EmailMessage
-from typing import Any, Generator
+from functools import lru_cache
+from time import monotonic
+from typing import Any, Generator, Iterator, Self
 
+import requests
 from cron_converter import Cron
+from requests.adapters import HTTPAdapter
 
 from run_tasks.config import CONFIG
 from run_tasks.third_party.cron_converter__examples.from_jenkins import do_convert
@@ -22,6 +30,26 @@ EMAIL_SEND_TO: str = CONFIG_EMAIL["send_to"]
 EMAIL_LOGIN: str = CONFIG_EMAIL["login"]
 EMAIL_PASSWORD: str = CONFIG_EMAIL["password"]
 
+CONFIG_EMAIL_POOL: dict[str, Any] = CONFIG_EMAIL["connection_pool"]
+EMAIL_POOL_MAX_SIZE: int = CONFIG_EMAIL_POOL["max_size"]
+EMAIL_POOL_IDLE_TIMEOUT_SECS: float = CONFIG_EMAIL_POOL["idle_timeout_secs"]
+EMAIL_POOL_TIMEOUT_SECS: float = CONFIG_EMAIL_POOL["timeout_secs"]
+
+CONFIG_TELEGRAM: dict[str, Any] = CONFIG["notification"]["telegram"]
+TELEGRAM_ADD_NOTIFY_URL: str = CONFIG_TELEGRAM["add_notify_url"]
+TELEGRAM_ADD_NOTIFY_BATCH_URL: str | None = CONFIG_TELEGRAM["add_notify_batch_url"]
+
+CONFIG_TELEGRAM_POOL: dict[str, Any] = CONFIG_TELEGRAM["connection_pool"]
+TELEGRAM_POOL_CONNECT_TIMEOUT_SECS: float = CONFIG_TELEGRAM_POOL["connect_timeout_secs"]
+TELEGRAM_POOL_READ_TIMEOUT_SECS: float = CONFIG_TELEGRAM_POOL["read_timeout_secs"]
+
+# Количество разобранных расписаний в кэше
+CRON_CACHE_MAX_SIZE: int = 1024
+
+# Ограничение поиска даты для расписаний, которые почти не срабатывают
+# (например, 29 февраля в заданный день недели)
+CRON_MAX_SEARCH_DAYS: int = 366 * 30
+
 
 def get_full_exception(e: BaseException) -> str:
     return "".join(traceback.format_exception(e)).strip()
@@ -36,27 +64,348 @@ def send_email(
     login: str = EMAIL_LOGIN,
     password: str = EMAIL_PASSWORD,
 ) -> None:
+    msg = create_email(subject, text, send_to)
+
+    with smtplib.SMTP_SSL(host=host, port=port) as s:
+        s.login(user=login, password=password)
+        s.send_message(msg)
+
+
+def create_email(subject: str, text: str, send_to: str = EMAIL_SEND_TO) -> EmailMessage:
     msg = EmailMessage()
     msg["Subject"] = subject
     msg["From"] = send_to
     msg["To"] = send_to
     msg.set_content(text)
+    return msg
 
-    with smtplib.SMTP_SSL(host=host, port=port) as s:
-        s.login(user=login, password=password)
-        s.send_message(msg)
+
+class SmtpSession:
+    """
+    Сессия с почтовым сервером, взятая из пула. Если сервер закрыл соединение
+    (например, по своему таймауту), то при отправке выполняется переподключение
+    и одна повторная попытка
+    """
+
+    def __init__(self, pool: "SmtpPool", smtp: smtplib.SMTP) -> None:
+        self.pool = pool
+        self.smtp = smtp
+        self.is_broken: bool = False
+
+    def send_message(self, msg: EmailMessage) -> None:
+        try:
+            self.smtp.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self.pool.close_connection(self.smtp)
+
+            self.is_broken = True
+            self.smtp = self.pool.connect()
+            self.is_broken = False
+            self.pool.number_of_reconnects += 1
+
+            self.smtp.send_message(msg)
+
+        self.pool.number_of_messages += 1
+
+
+class SmtpPool:
+    """
+    Пул соединений с почтовым сервером. Соединения после входа переиспользуются,
+    поэтому несколько писем отправляются без новых TLS и login. Соединения,
+    простаивающие дольше idle_timeout_secs, закрываются
+    """
+
+    def __init__(
+        self,
+        host: str = EMAIL_HOST,
+        port: int = EMAIL_PORT,
+        login: str = EMAIL_LOGIN,
+        password: str = EMAIL_PASSWORD,
+        max_size: int = EMAIL_POOL_MAX_SIZE,
+        idle_timeout_secs: float = EMAIL_POOL_IDLE_TIMEOUT_SECS,
+        timeout_secs: float = EMAIL_POOL_TIMEOUT_SECS,
+        smtp_class: type[smtplib.SMTP] = smtplib.SMTP_SSL,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.login = login
+        self.password = password
+        self.max_size = max_size
+        self.idle_timeout_secs = idle_timeout_secs
+        self.timeout_secs = timeout_secs
+        self.smtp_class = smtp_class
+
+        # Свободные соединения и время их последнего использования
+        self._idle: list[tuple[smtplib.SMTP, float]] = []
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(self.max_size)
+
+        self.number_of_connections: int = 0
+        self.number_of_reconnects: int = 0
+        self.number_of_messages: int = 0
+
+    def connect(self) -> smtplib.SMTP:
+        smtp = self.smtp_class(
+            host=self.host,
+            port=self.port,
+            timeout=self.timeout_secs,
+        )
+        try:
+            smtp.login(user=self.login, password=self.password)
+        except Exception:
+            smtp.close()
+            raise
+
+        self.number_of_connections += 1
+        return smtp
+
+    @staticmethod
+    def close_connection(smtp: smtplib.SMTP) -> None:
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    def _acquire(self) -> smtplib.SMTP:
+        smtp: smtplib.SMTP | None = None
+        expired: list[smtplib.SMTP] = []
+
+        with self._lock:
+            now: float = monotonic()
+            while self._idle:
+                item, last_used = self._idle.pop()
+                if now - last_used < self.idle_timeout_secs:
+                    smtp = item
+                    break
+
+                expired.append(item)
+
+        for item in expired:
+            self.close_connection(item)
+
+        return smtp or self.connect()
+
+    def _release(self, smtp: smtplib.SMTP) -> None:
+        with self._lock:
+            self._idle.append((smtp, monotonic()))
+
+    @contextmanager
+    def session(self) -> Iterator[SmtpSession]:
+        """
+        Функция возвращает сессию для отправки одного или нескольких писем.
+        Одновременно открыто не больше max_size соединений
+        """
+
+        with self._semaphore:
+            session = SmtpSession(self, self._acquire())
+            try:
+                yield session
+            except (smtplib.SMTPServerDisconnected, OSError):
+                session.is_broken = True
+                raise
+            finally:
+                if session.is_broken:
+                    self.close_connection(session.smtp)
+                else:
+                    self._release(session.smtp)
+
+    def send_message(self, msg: EmailMessage) -> None:
+        with self.session() as session:
+            session.send_message(msg)
+
+    def close(self) -> None:
+        with self._lock:
+            items, self._idle = self._idle, []
+
+        for smtp, _ in items:
+            self.close_connection(smtp)
+
+    def get_stats(self) -> dict[str, Any]:
+        return dict(
+            number_of_idle=len(self._idle),
+            number_of_connections=self.number_of_connections,
+            number_of_reconnects=self.number_of_reconnects,
+            number_of_messages=self.number_of_messages,
+        )
+
+
+class TelegramClient:
+    """
+    Клиент сервера уведомлений в телеграм. HTTP-соединения с сервером
+    переиспользуются (keep-alive) всеми отправителями, одновременно открыто
+    не больше pool_size соединений. Повторные попытки клиент не выполняет,
+    ошибка возвращается вызывающему.
+
+    Если задан batch_url, то список уведомлений отправляется одним запросом
+    """
+
+    def __init__(
+        self,
+        url: str = TELEGRAM_ADD_NOTIFY_URL,
+        batch_url: str | None = TELEGRAM_ADD_NOTIFY_BATCH_URL,
+        pool_size: int = 1,
+        connect_timeout_secs: float = TELEGRAM_POOL_CONNECT_TIMEOUT_SECS,
+        read_timeout_secs: float = TELEGRAM_POOL_READ_TIMEOUT_SECS,
+    ) -> None:
+        self.url = url
+        self.batch_url = batch_url
+        self.pool_size = pool_size
+        self.timeout: tuple[float, float] = (connect_timeout_secs, read_timeout_secs)
+
+        self.session = requests.Session()
+
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=0,
+            pool_block=True,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self.number_of_requests: int = 0
+        self.number_of_messages: int = 0
+
+    def _post(self, url: str, data: dict[str, Any] | list[dict[str, Any]]) -> None:
+        rs = self.session.post(url, json=data, timeout=self.timeout)
+        rs.raise_for_status()
+
+        with self._lock:
+            self.number_of_requests += 1
+            self.number_of_messages += len(data) if isinstance(data, list) else 1
+
+    def send(self, data: dict[str, Any]) -> None:
+        self._post(self.url, data)
+
+    def send_many(self, items: list[dict[str, Any]]) -> None:
+        """
+        Функция отправляет уведомления одним запросом, если сервер это
+        поддерживает, иначе по одному
+        """
+
+        if not items:
+            return
+
+        if self.batch_url:
+            self._post(self.batch_url, items)
+            return
+
+        for data in items:
+            self.send(data)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def get_stats(self) -> dict[str, Any]:
+        return dict(
+            number_of_requests=self.number_of_requests,
+            number_of_messages=self.number_of_messages,
+        )
+
+
+@dataclass(frozen=True)
+class CompiledCron:
+    """
+    Расписание, разобранное в множества подходящих значений, чтобы следующая
+    дата вычислялась сразу от заданного времени, а не перебором по минутам
+    """
+
+    minutes: tuple[int, ...]
+    hours: tuple[int, ...]
+    days: frozenset[int]
+    months: frozenset[int]
+    weekdays: frozenset[int]
+
+    @classmethod
+    def parse(cls, cron: str, seed: str | None = None) -> Self:
+        minutes, hours, days, months, weekdays = Cron(
+            do_convert(cron, seed=seed)
+        ).to_list()
+        return cls(
+            minutes=tuple(sorted(minutes)),
+            hours=tuple(sorted(hours)),
+            days=frozenset(days),
+            months=frozenset(months),
+            # NOTE: В cron воскресенье - 0, а isoweekday() возвращает 7
+            weekdays=frozenset(7 if d == 0 else d for d in weekdays),
+        )
+
+    def _is_day_matched(self, d: date) -> bool:
+        # Как и в cron_converter, день месяца и день недели должны совпасть оба
+        return (
+            d.month in self.months
+            and d.day in self.days
+            and d.isoweekday() in self.weekdays
+        )
+
+    def get_next_date(self, start_date: datetime) -> datetime:
+        """
+        Функция возвращает ближайшую дату расписания не раньше start_date
+        """
+
+        if start_date.second or start_date.microsecond:
+            start_date += timedelta(minutes=1)
+        start_date = start_date.replace(second=0, microsecond=0)
+
+        d: date = start_date.date()
+        for _ in range(CRON_MAX_SEARCH_DAYS):
+            if self._is_day_matched(d):
+                is_start_day: bool = d == start_date.date()
+                min_hour: int = start_date.hour if is_start_day else 0
+
+                for hour in self.hours[bisect_left(self.hours, min_hour) :]:
+                    min_minute: int = (
+                        start_date.minute if is_start_day and hour == min_hour else 0
+                    )
+                    i: int = bisect_left(self.minutes, min_minute)
+                    if i < len(self.minutes):
+                        return datetime.combine(d, time(hour, self.minutes[i]))
+
+            d += timedelta(days=1)
+
+        raise ValueError("Не найдена дата по расписанию")
+
+    def iter_dates(self, start_date: datetime) -> Generator[datetime, None, None]:
+        scheduled_date: datetime = self.get_next_date(start_date)
+        while True:
+            yield scheduled_date
+            scheduled_date = self.get_next_date(scheduled_date + timedelta(minutes=1))
+
+    def get_dates(
+        self,
+        start_date: datetime,
+        end_date: datetime | None = None,
+        number: int | None = None,
+    ) -> list[datetime]:
+        """
+        Функция возвращает даты расписания, начиная с start_date, до end_date
+        включительно и/или не больше number
+        """
+
+        items: list[datetime] = []
+        for scheduled_date in self.iter_dates(start_date):
+            if end_date and scheduled_date > end_date:
+                break
+
+            if number is not None and len(items) >= number:
+                break
+
+            items.append(scheduled_date)
+
+        return items
 
 
-def get_scheduled_date_generator(cron: str) -> Generator[datetime, None, None]:
-    cron = do_convert(cron)
+@lru_cache(maxsize=CRON_CACHE_MAX_SIZE)
+def get_cron(cron: str, seed: str | None = None) -> CompiledCron:
+    # NOTE: seed (название задачи) определяет значения H в расписании
+    return CompiledCron.parse(cron, seed=seed)
 
-    midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    schedule = Cron(cron).schedule(midnight)
 
-    scheduled_date = schedule.next()
-    while scheduled_date < datetime.now():
-        scheduled_date = schedule.next()
+def get_scheduled_date_generator(
+    cron: str | CompiledCron,
+) -> Generator[datetime, None, None]:
+    if isinstance(cron, str):
+        cron = get_cron(cron)
 
-    while True:
-        yield scheduled_date
-        scheduled_date = schedule.next()
+    return cron.iter_dates(datetime.now())
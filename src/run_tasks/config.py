@@ -23,6 +23,9 @@ DB_DIR_NAME.mkdir(parents=True, exist_ok=True)
 
 DB_FILE_NAME: Path = DB_DIR_NAME / "db.sqlite"
 
+# Сжатые файлы логов старых запусков
+DB_LOGS_ARCHIVE_DIR_NAME: Path = DB_DIR_NAME / "logs_archive"
+
 CONFIG_FILE_NAME: Path = DIR / "config.yaml"
 CONFIG_EXAMPLE_FILE_NAME: Path = DIR / "etc" / "example-config.yaml"
 if not CONFIG_FILE_NAME.exists():
@@ -77,7 +80,25 @@ for handler in CONFIG["logging"]["handlers"].values():
 logging.config.dictConfig(CONFIG["logging"])
 
 PROJECT_NAME: str = CONFIG["project_name"]
+
+CONFIG_DB_WRITE_QUEUE: dict[str, Any] = CONFIG["database"]["write_queue"]
+DB_WRITE_QUEUE_MAX_SIZE: int = CONFIG_DB_WRITE_QUEUE["max_size"]
+DB_WRITE_QUEUE_RESULTS_TIMEOUT_SECS: float = CONFIG_DB_WRITE_QUEUE[
+    "results_timeout_secs"
+]
+# NOTE: Записи из очереди фиксируются пачками в одной транзакции
+DB_WRITE_QUEUE_COMMIT_INTERVAL_SECS: float = CONFIG_DB_WRITE_QUEUE[
+    "commit_interval_secs"
+]
+DB_WRITE_QUEUE_MAX_COMMIT_SIZE: int = CONFIG_DB_WRITE_QUEUE["max_commit_size"]
+DB_WRITE_QUEUE_BACKPRESSURE: str = CONFIG_DB_WRITE_QUEUE["backpressure"]
+
 CONFIG_NOTIFICATION: dict[str, Any] = CONFIG["notification"]
+# NOTE: Текст уведомлений запусков формируется при отправке, а не при создании
+NOTIFICATION_LAZY_TEXT: bool = CONFIG_NOTIFICATION["lazy_text"]
+# NOTE: Ограничение логов запуска в уведомлениях (TaskRun.get_logs_tail)
+NOTIFICATION_LOGS_TAIL_MAX_LINES: int = CONFIG_NOTIFICATION["logs_tail"]["max_lines"]
+NOTIFICATION_LOGS_TAIL_MAX_BYTES: int = CONFIG_NOTIFICATION["logs_tail"]["max_bytes"]
 
 # TODO: Вынести в CONFIG
 PY_DATE_FORMAT: str = "%d.%m.%Y %H:%M:%S"
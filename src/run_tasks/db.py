@@ -5,36 +5,83 @@ __author__ = "ipetrash"
 
 
 import enum
+import gzip
+import heapq
+import json
+import logging
 import time
-from datetime import datetime
-from typing import Type, Iterable, Self, Optional, Any
+import zlib
+from collections import deque
+from datetime import datetime, timedelta
+from functools import cmp_to_key, lru_cache
+from itertools import islice
+from pathlib import Path
+from typing import Type, Iterable, Iterator, Self, Optional, Any
 from urllib.parse import urljoin
 
+from jinja2 import Template
 from jinja2.sandbox import SandboxedEnvironment
 
 # pip install peewee
 from peewee import (
     Model,
+    ModelSelect,
+    JOIN,
+    SQL,
+    NodeList,
+    EnclosedNodeList,
     Expression,
     Case,
     Field,
+    Ordering,
     TextField,
     ForeignKeyField,
     DateTimeField,
     BooleanField,
     CharField,
     IntegerField,
+    BlobField,
+    fn,
 )
 from playhouse.hybrid import hybrid_property
 from playhouse.shortcuts import model_to_dict
-from playhouse.sqliteq import SqliteQueueDatabase
+from playhouse.sqlite_ext import (
+    AutoIncrementField,
+    FTS5Model,
+    RowIDField,
+    SearchField,
+)
 
 from slugify import slugify
 
-from run_tasks.config import DB_FILE_NAME, CONFIG, CONFIG_NOTIFICATION
+from run_tasks.config import (
+    DB_FILE_NAME,
+    DB_WRITE_QUEUE_MAX_SIZE,
+    DB_WRITE_QUEUE_RESULTS_TIMEOUT_SECS,
+    DB_WRITE_QUEUE_COMMIT_INTERVAL_SECS,
+    DB_WRITE_QUEUE_MAX_COMMIT_SIZE,
+    DB_WRITE_QUEUE_BACKPRESSURE,
+    DB_LOGS_ARCHIVE_DIR_NAME,
+    CONFIG,
+    CONFIG_NOTIFICATION,
+    NOTIFICATION_LOGS_TAIL_MAX_LINES,
+    NOTIFICATION_LOGS_TAIL_MAX_BYTES,
+    NOTIFICATION_LAZY_TEXT,
+)
+from run_tasks.db_queue import BackpressureEnum, GroupCommitQueueDatabase
+from run_tasks.events import TASK_EVENTS, STOP_TOKENS
 from run_tasks.third_party.db_enum_field import EnumField
 from run_tasks.third_party.shorten import shorten
 
+try:
+    # Python 3.14+
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+
+logger = logging.getLogger(__name__)
+
 
 class NotDefinedParameterException(ValueError):
     def __init__(self, parameter_name: str) -> None:
@@ -46,7 +93,8 @@ class NotDefinedParameterException(ValueError):
 
 # This working with multithreading
 # SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#sqliteq
-db = SqliteQueueDatabase(
+# NOTE: Записи из очереди фиксируются пачками, см. GroupCommitQueueDatabase
+db = GroupCommitQueueDatabase(
     DB_FILE_NAME,
     pragmas={
         "foreign_keys": 1,
@@ -55,8 +103,13 @@ db = SqliteQueueDatabase(
     },
     use_gevent=False,  # Use the standard library "threading" module.
     autostart=True,
-    queue_max_size=64,  # Max. # of pending writes that can accumulate.
-    results_timeout=5.0,  # Max. time to wait for query to be executed.
+    # Max. # of pending writes that can accumulate.
+    queue_max_size=DB_WRITE_QUEUE_MAX_SIZE,
+    # Max. time to wait for query to be executed.
+    results_timeout=DB_WRITE_QUEUE_RESULTS_TIMEOUT_SECS,
+    commit_interval_secs=DB_WRITE_QUEUE_COMMIT_INTERVAL_SECS,
+    max_commit_size=DB_WRITE_QUEUE_MAX_COMMIT_SIZE,
+    backpressure=BackpressureEnum(DB_WRITE_QUEUE_BACKPRESSURE),
 )
 
 
@@ -72,6 +125,12 @@ class TaskRunStatusEnum(enum.StrEnum):
     ERROR = enum.auto()
 
 
+ACTIVE_TASK_RUN_STATUSES: list[TaskRunStatusEnum] = [
+    TaskRunStatusEnum.PENDING,
+    TaskRunStatusEnum.RUNNING,
+]
+
+
 @enum.unique
 class TaskRunWorkStatusEnum(enum.StrEnum):
     NONE = enum.auto()
@@ -100,6 +159,174 @@ class NotificationKindEnum(enum.StrEnum):
     TELEGRAM = enum.auto()
 
 
+@enum.unique
+class CompressionEnum(enum.StrEnum):
+    ZLIB = enum.auto()
+    ZSTD = enum.auto()
+
+
+@enum.unique
+class LogsStorageEnum(enum.StrEnum):
+    # Строки или чанки в базе
+    DB = enum.auto()
+    # Сжатый файл на диске
+    ARCHIVE = enum.auto()
+    # Логи удалены, остались только данные запуска
+    DELETED = enum.auto()
+
+
+# NOTE: Значения подставляются в сам запрос, а не параметрами, иначе SQLite
+#       не сможет применить частичный индекс
+def literal_in(field: Field, values: list[enum.StrEnum]) -> NodeList:
+    return NodeList(
+        (field, SQL("IN"), EnclosedNodeList([SQL(f"'{v.value}'") for v in values]))
+    )
+
+
+def literal_is_null(field: Field) -> NodeList:
+    return NodeList((field, SQL("IS NULL")))
+
+
+NOTIFICATION_TEMPLATE_KEYS: list[str] = ["template", "digest_template"]
+
+TEMPLATE_ENV = SandboxedEnvironment()
+
+
+# NOTE: Шаблоны кэшируются по тексту, поэтому при изменении конфига
+#       новый шаблон будет скомпилирован при первом использовании
+@lru_cache(maxsize=64)
+def get_template(source: str) -> Template:
+    return TEMPLATE_ENV.from_string(source)
+
+
+def validate_notification_templates() -> None:
+    """
+    Функция компилирует все шаблоны уведомлений из конфига. При ошибке
+    в шаблоне будет выброшено исключение jinja2.TemplateSyntaxError
+    """
+
+    for kind in NotificationKindEnum:
+        for template_key in NOTIFICATION_TEMPLATE_KEYS:
+            template: dict[str, str] = CONFIG_NOTIFICATION[kind.value][template_key]
+            get_template(template["name"])
+            get_template(template["text"])
+
+
+def render_notification_part(
+    kind: NotificationKindEnum,
+    variables: dict[str, Any],
+    template_key: str = "template",
+    part: str = "text",
+) -> str:
+    """
+    Функция возвращает заголовок (part="name") или текст (part="text")
+    уведомления по шаблону из конфига
+    """
+
+    source: str = CONFIG_NOTIFICATION[kind.value][template_key][part]
+    return get_template(source).render(variables)
+
+
+def render_notification(
+    kind: NotificationKindEnum,
+    variables: dict[str, Any],
+    template_key: str = "template",
+) -> tuple[str, str]:
+    """
+    Функция возвращает заголовок и текст уведомления по шаблону из конфига
+    """
+
+    return (
+        render_notification_part(kind, variables, template_key, part="name"),
+        render_notification_part(kind, variables, template_key, part="text"),
+    )
+
+
+@lru_cache(maxsize=1024)
+def read_logs_archive_info(path: str, mtime_ns: int) -> tuple[int, int | None]:
+    """
+    Функция возвращает количество строк в архиве логов и идентификатор
+    последней строки. mtime_ns нужен для сброса кэша при изменении файла
+    """
+
+    number: int = 0
+    last_id: int | None = None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            last_id = json.loads(line)[0]
+            number += 1
+
+    return number, last_id
+
+
+def slice_logs(
+    logs: Iterable["TaskRunLog"],
+    start: int,
+    length: int,
+    order_by: list[tuple[str, bool]] | None = None,
+) -> tuple[list["TaskRunLog"], int]:
+    """
+    Функция возвращает логи [start, start + length) после сортировки по order_by
+    (имя поля и признак сортировки по убыванию) и общее количество логов.
+    Логи читаются по одному, в памяти держится не больше start + length логов
+    """
+
+    number: int = 0
+
+    def counted() -> Iterator["TaskRunLog"]:
+        nonlocal number
+        for log in logs:
+            number += 1
+            yield log
+
+    def compare(a: "TaskRunLog", b: "TaskRunLog") -> int:
+        for name, desc in order_by:
+            value_a, value_b = a.__data__.get(name), b.__data__.get(name)
+            if value_a != value_b:
+                result: int = -1 if value_a < value_b else 1
+                return -result if desc else result
+        return 0
+
+    items: Iterator[TaskRunLog] = counted()
+    limit: int = start + length
+    if order_by:
+        # Сортировка устойчивая, как у sorted
+        top: list[TaskRunLog] = heapq.nsmallest(limit, items, key=cmp_to_key(compare))
+    else:
+        top: list[TaskRunLog] = list(islice(items, limit))
+
+        # Дочитывание для подсчета количества
+        deque(items, maxlen=0)
+
+    return top[start:], number
+
+
+def compress_data(data: bytes, compression: CompressionEnum) -> bytes:
+    match compression:
+        case CompressionEnum.ZLIB:
+            return zlib.compress(data)
+
+        case CompressionEnum.ZSTD:
+            if not zstd:
+                raise ValueError("Сжатие zstd не поддерживается (нужен Python 3.14+)")
+            return zstd.compress(data)
+
+    raise ValueError(f"Неизвестный вид сжатия {compression!r}")
+
+
+def decompress_data(data: bytes, compression: CompressionEnum) -> bytes:
+    match compression:
+        case CompressionEnum.ZLIB:
+            return zlib.decompress(data)
+
+        case CompressionEnum.ZSTD:
+            if not zstd:
+                raise ValueError("Сжатие zstd не поддерживается (нужен Python 3.14+)")
+            return zstd.decompress(data)
+
+    raise ValueError(f"Неизвестный вид сжатия {compression!r}")
+
+
 class BaseModel(Model):
     class Meta:
         database = db
@@ -170,21 +397,97 @@ class Task(BaseModel):
     cron = TextField(null=True)
     is_infinite = BooleanField(default=False)
 
+    # Сроки хранения в днях: логов в базе, архива логов и самих запусков.
+    # Если не заданы, то берутся из конфига
+    logs_storage_days = IntegerField(null=True)
+    archived_logs_storage_days = IntegerField(null=True)
+    task_run_storage_days = IntegerField(null=True)
+
     @property
     def url_path(self) -> str:
         clean_slug = slugify(self.name)
         return f"{self.id}-{clean_slug}"
 
+    @classmethod
+    def select_with_stats(cls, *fields) -> ModelSelect:
+        """
+        Функция возвращает запрос задач вместе со статистикой их запусков.
+        Статистика доступна в атрибутах с префиксом db_
+        """
+
+        last_started_run = TaskRun.alias("last_started_run")
+        nearest_scheduled_run = TaskRun.alias("nearest_scheduled_run")
+
+        # TODO: Подумать над названием свойств с db_ - мб что-то по другому назвать
+        #       В ответе их с таким же названием возвращать?
+        return (
+            cls.select(
+                *(fields or [cls]),
+                Case(
+                    None,
+                    [(last_started_run.id.is_null(), TaskRunWorkStatusEnum.NONE)],
+                    last_started_run.work_status,
+                ).alias("db_last_work_status"),
+                last_started_run.start_date.alias("db_last_started_run_start_date"),
+                fn.COALESCE(last_started_run.seq, 0).alias("db_number_of_runs"),
+                last_started_run.seq.alias("db_last_started_run_seq"),
+                nearest_scheduled_run.scheduled_date.alias("db_next_scheduled_date"),
+                TaskSummary.success_rate.alias("db_success_rate"),
+            )
+            # Запуски берутся по идентификаторам из сводки, без поиска по истории
+            .join(
+                TaskSummary,
+                JOIN.LEFT_OUTER,
+                on=(TaskSummary.task == cls.id),
+            )
+            .join(
+                last_started_run,
+                JOIN.LEFT_OUTER,
+                on=(last_started_run.id == TaskSummary.last_started_run_id),
+            )
+            .switch(TaskSummary)
+            .join(
+                nearest_scheduled_run,
+                JOIN.LEFT_OUTER,
+                on=(nearest_scheduled_run.id == TaskSummary.nearest_scheduled_run_id),
+            )
+            # Все значения присваиваются экземпляру задачи
+            .objects()
+        )
+
+    # Атрибуты статистики запусков из select_with_stats
+    STATS_FIELDS: tuple[str, ...] = (
+        "db_last_work_status",
+        "db_last_started_run_start_date",
+        "db_number_of_runs",
+        "db_last_started_run_seq",
+        "db_next_scheduled_date",
+        "db_success_rate",
+    )
+
+    def get_with_stats(self) -> Self:
+        """
+        Функция возвращает задачу со статистикой запусков. Статистика загружается
+        одним запросом при первом обращении и запоминается в экземпляре, если
+        задача не была получена через select_with_stats. Сбросить статистику
+        можно через refresh_stats
+        """
+
+        if not hasattr(self, "db_last_work_status"):
+            obj: Task = Task.select_with_stats().where(Task.id == self.id).get()
+            for name in self.STATS_FIELDS:
+                setattr(self, name, getattr(obj, name))
+
+        return self
+
+    def refresh_stats(self) -> None:
+        # Статистика будет загружена заново при следующем обращении
+        for name in self.STATS_FIELDS:
+            self.__dict__.pop(name, None)
+
     @hybrid_property
     def number_of_runs(self) -> int:
-        number: int | None = (
-            TaskRun.select(TaskRun.seq)
-            .where(TaskRun.task == self, TaskRun.status != TaskRunStatusEnum.PENDING)
-            .order_by(TaskRun.seq.desc())
-            .limit(1)
-            .scalar()
-        )
-        return number if number is not None else 0
+        return self.get_with_stats().db_number_of_runs
 
     def get_last_started_run(self) -> Optional["TaskRun"]:
         return self.get_last_run(filters=[TaskRun.status != TaskRunStatusEnum.PENDING])
@@ -200,40 +503,39 @@ class Task(BaseModel):
 
     @hybrid_property
     def last_started_run_seq(self) -> int | None:
-        run: TaskRun | None = self.get_last_started_run()
-        return run.seq if run else None
+        return self.get_with_stats().db_last_started_run_seq
 
     @hybrid_property
     def last_started_run_start_date(self) -> datetime | None:
-        run: TaskRun | None = self.get_last_started_run()
-        return run.start_date if run else None
+        return TaskRun.start_date.python_value(
+            self.get_with_stats().db_last_started_run_start_date
+        )
 
     @hybrid_property
     def next_scheduled_date(self) -> datetime | None:
-        run = self.get_pending_run(has_scheduled_date=True)
-        return run.scheduled_date if run else None
+        return TaskRun.scheduled_date.python_value(
+            self.get_with_stats().db_next_scheduled_date
+        )
 
     @hybrid_property
     def last_work_status(self) -> TaskRunWorkStatusEnum:
-        run: TaskRun | None = self.get_last_started_run()
-        if not run:
-            return TaskRunWorkStatusEnum.NONE
+        return TaskRunWorkStatusEnum(self.get_with_stats().db_last_work_status)
 
-        return run.work_status
+    @property
+    def success_rate(self) -> float | None:
+        return self.get_with_stats().db_success_rate
 
     def to_dict(self) -> dict[str, Any]:
-        return model_to_dict(
-            self,
-            recurse=False,
-            extra_attrs=[
-                "url_path",
-                "number_of_runs",
-                "last_started_run_seq",
-                "last_started_run_start_date",
-                "next_scheduled_date",
-                "last_work_status",
-            ],
-        )
+        return {
+            **model_to_dict(self, recurse=False),
+            "url_path": self.url_path,
+            "number_of_runs": self.number_of_runs,
+            "last_started_run_seq": self.last_started_run_seq,
+            "last_started_run_start_date": self.last_started_run_start_date,
+            "next_scheduled_date": self.next_scheduled_date,
+            "last_work_status": self.last_work_status,
+            "success_rate": self.success_rate,
+        }
 
     @classmethod
     def get_by_name(cls, name: str) -> Self | None:
@@ -254,6 +556,9 @@ class Task(BaseModel):
         cron: str = None,
         is_enabled: bool = True,
         is_infinite: bool = False,
+        logs_storage_days: int = None,
+        archived_logs_storage_days: int = None,
+        task_run_storage_days: int = None,
     ) -> Self:
         obj = cls.get_by_name(name)
         if obj:
@@ -266,6 +571,9 @@ class Task(BaseModel):
             cron=cron,
             is_enabled=is_enabled,
             is_infinite=is_infinite,
+            logs_storage_days=logs_storage_days,
+            archived_logs_storage_days=archived_logs_storage_days,
+            task_run_storage_days=task_run_storage_days,
         )
 
     def set_command(self, command: str) -> None:
@@ -289,6 +597,11 @@ class Task(BaseModel):
         self.is_enabled = value
         self.save()
 
+        if not value:
+            STOP_TOKENS.stop_task(self.id)
+
+        TASK_EVENTS.notify(self.id)
+
     def set_is_infinite(self, value: bool) -> None:
         if self.is_infinite == value:
             return
@@ -305,16 +618,15 @@ class Task(BaseModel):
         return last_run
 
     def get_pending_run(self, has_scheduled_date: bool = False) -> Optional["TaskRun"]:
-        for run in self.get_runs_by([TaskRunStatusEnum.PENDING]):
-            # Если нужно вернуть запуск с запланированной датой
-            if has_scheduled_date:
-                if run.scheduled_date is not None:
-                    return run
-            else:
-                if run.scheduled_date is None:
-                    return run
-
-        return None
+        # Если нужно вернуть запуск с запланированной датой
+        return (
+            self.runs.where(
+                TaskRun.status == TaskRunStatusEnum.PENDING,
+                TaskRun.scheduled_date.is_null(not has_scheduled_date),
+            )
+            .order_by(TaskRun.create_date)
+            .first()
+        )
 
     def add_or_get_run(self, scheduled_date: datetime = None) -> "TaskRun":
         # Ограничение количества запусков в ожидании, максимум 2: без запланированной даты и с ней
@@ -328,6 +640,10 @@ class Task(BaseModel):
                 command=self.command,
                 scheduled_date=scheduled_date,
             )
+
+            # Поток задачи сразу узнает о новом запуске
+            TASK_EVENTS.notify(self.id)
+
         return run
 
     def get_runs_by(self, statuses: list[TaskRunStatusEnum]) -> list["TaskRun"]:
@@ -341,6 +657,97 @@ class Task(BaseModel):
         items = self.get_runs_by([TaskRunStatusEnum.RUNNING])
         return items[0] if items else None
 
+    @property
+    def has_packed_logs(self) -> bool:
+        return self.runs.where(TaskRun.has_packed_logs).exists()
+
+    def get_runs_number_of_logs(self) -> list[tuple["TaskRun", int]]:
+        """
+        Функция возвращает запуски задачи по возрастанию id с количеством их логов.
+        Количества строк в базе и в чанках считаются двумя групповыми запросами,
+        для архива берутся из закэшированных сведений о нем
+        """
+
+        def get_numbers(query: ModelSelect) -> dict[int, int]:
+            return dict(query.join(TaskRun).where(TaskRun.task == self).tuples())
+
+        number_of_rows: dict[int, int] = get_numbers(
+            TaskRunLog.select(TaskRunLog.task_run, fn.COUNT(TaskRunLog.id)).group_by(
+                TaskRunLog.task_run
+            )
+        )
+        number_of_packed: dict[int, int] = get_numbers(
+            TaskRunLogChunk.select(
+                TaskRunLogChunk.task_run,
+                fn.MAX(TaskRunLogChunk.first_line + TaskRunLogChunk.number_of_lines),
+            ).group_by(TaskRunLogChunk.task_run)
+        )
+
+        items: list[tuple[TaskRun, int]] = []
+        for run in self.runs.order_by(TaskRun.id):
+            if run.logs_storage != LogsStorageEnum.DB:
+                number: int = run.get_logs_archive_info()[0]
+            else:
+                number: int = number_of_packed.get(run.id, 0) + number_of_rows.get(
+                    run.id, 0
+                )
+            items.append((run, number))
+
+        return items
+
+    def get_number_of_logs(self) -> int:
+        return sum(number for _, number in self.get_runs_number_of_logs())
+
+    def iter_logs(self) -> Iterator["TaskRunLog"]:
+        """
+        Функция возвращает логи всех запусков задачи, включая упакованные в чанки
+        и перенесенные в архив. Запуски задачи выполняются по очереди, поэтому
+        порядок запусков совпадает с порядком id логов
+        """
+
+        for run in self.runs.order_by(TaskRun.id):
+            yield from run.iter_logs()
+
+    def get_logs_page(
+        self,
+        start: int,
+        length: int,
+        desc: bool = False,
+    ) -> list["TaskRunLog"]:
+        """
+        Функция возвращает страницу логов всех запусков задачи. Логи читаются
+        только у запусков, попадающих в страницу, а у них - только из нужных чанков
+        """
+
+        runs_number_of_logs: list[tuple[TaskRun, int]] = self.get_runs_number_of_logs()
+
+        if desc:
+            total: int = sum(number for _, number in runs_number_of_logs)
+            end = max(total - start, 0)
+            start = max(end - length, 0)
+        else:
+            end = start + length
+
+        items: list[TaskRunLog] = []
+
+        # Номер первой строки запуска среди логов задачи
+        offset: int = 0
+        for run, number in runs_number_of_logs:
+            if offset >= end:
+                break
+
+            if offset + number > start:
+                run_start: int = max(start - offset, 0)
+                run_end: int = min(end - offset, number)
+                items += run.get_logs_page(run_start, run_end - run_start)
+
+            offset += number
+
+        if desc:
+            items.reverse()
+
+        return items
+
     def get_all_logs(
         self,
         filter_by_text: str | None = None,
@@ -348,11 +755,32 @@ class Task(BaseModel):
         page: int = 1,
         items_per_page: int = 10,
     ) -> list["TaskRunLog"]:
+        if self.has_packed_logs:
+            # Упакованные логи фильтруются и сортируются по мере чтения
+            logs: Iterable[TaskRunLog] = self.iter_logs()
+            if filter_by_text:
+                value: str = filter_by_text.lower()
+                logs = (log for log in logs if value in log.text.lower())
+
+            order: list[tuple[str, bool]] = []
+            if order_by:
+                is_ordering: bool = isinstance(order_by, Ordering)
+                field: Field = order_by.node if is_ordering else order_by
+                order.append((field.name, is_ordering and order_by.direction == "DESC"))
+
+            items, _ = slice_logs(
+                logs,
+                start=(page - 1) * items_per_page,
+                length=items_per_page,
+                order_by=order,
+            )
+            return items
+
         filters = [
             TaskRunLog.task_run.in_(TaskRun.select().where(TaskRun.task == self)),
         ]
         if filter_by_text:
-            filters.append(TaskRunLog.text.ilike(f"%{filter_by_text}%"))
+            filters.append(TaskRunLog.search_text(filter_by_text))
 
         query = TaskRunLog.select().where(*filters)
         if order_by:
@@ -374,6 +802,7 @@ class TaskRun(BaseModel):
     start_date = DateTimeField(null=True)
     finish_date = DateTimeField(null=True)
     scheduled_date = DateTimeField(null=True)
+    logs_storage = EnumField(choices=LogsStorageEnum, default=LogsStorageEnum.DB)
 
     class Meta:
         indexes = (
@@ -381,6 +810,14 @@ class TaskRun(BaseModel):
             (("task_id", "seq"), True),
         )
 
+    @hybrid_property
+    def is_active(self) -> bool:
+        return self.status in ACTIVE_TASK_RUN_STATUSES
+
+    @is_active.expression
+    def is_active(cls) -> Any:
+        return literal_in(cls.status, ACTIVE_TASK_RUN_STATUSES)
+
     @hybrid_property
     def is_success(self) -> bool:
         return (
@@ -452,6 +889,22 @@ class TaskRun(BaseModel):
             ],
         )
 
+    def _refresh_task_stats(self) -> None:
+        # Статистика уже загруженной задачи запуска устарела
+        task: Task | None = self.__rel__.get("task")
+        if task:
+            task.refresh_stats()
+
+    def save(self, *args, **kwargs) -> int | bool:
+        result = super().save(*args, **kwargs)
+        self._refresh_task_stats()
+        return result
+
+    def delete_instance(self, *args, **kwargs) -> int:
+        result = super().delete_instance(*args, **kwargs)
+        self._refresh_task_stats()
+        return result
+
     @classmethod
     def get_by_seq(cls, task_id: int, seq: int) -> Self:
         return cls.get(
@@ -517,6 +970,8 @@ class TaskRun(BaseModel):
         self.set_status(TaskRunStatusEnum.STOPPED)
         self.add_log_out(text=f"Запуск остановлен по причине: {reason.value}")  # TODO:
 
+        STOP_TOKENS.stop(self.id)
+
     def is_scheduled_date_has_arrived(self) -> bool:
         if self.scheduled_date is None:
             return False
@@ -545,17 +1000,383 @@ class TaskRun(BaseModel):
     def add_log_err(self, text: str, end: str = "\n") -> "TaskRunLog":
         return self.add_log(text=text, kind=LogKindEnum.ERR, end=end)
 
+    def add_logs(self, items: list[tuple[str, LogKindEnum, datetime]]) -> None:
+        """
+        Функция добавляет логи одним запросом.
+        Элементы: (текст, вид, дата), текст должен уже содержать окончание строки
+        """
+
+        if not items:
+            return
+
+        # Вставка одним запросом сохраняет порядок идентификаторов
+        TaskRunLog.insert_many(
+            [
+                dict(task_run=self, text=text, kind=kind, date=date)
+                for text, kind, date in items
+            ]
+        ).execute()
+
+    def get_number_of_packed_logs(self) -> int:
+        last_chunk: TaskRunLogChunk | None = self.log_chunks.order_by(
+            TaskRunLogChunk.first_line.desc()
+        ).first()
+        if not last_chunk:
+            return 0
+
+        return last_chunk.first_line + last_chunk.number_of_lines
+
+    def get_number_of_logs(self) -> int:
+        if self.logs_storage != LogsStorageEnum.DB:
+            return self.get_logs_archive_info()[0]
+
+        return self.get_number_of_packed_logs() + self.logs.count()
+
+    @hybrid_property
+    def has_packed_logs(self) -> bool:
+        # Логи читаются из чанков или архива, а не из строк TaskRunLog
+        return self.logs_storage != LogsStorageEnum.DB or self.log_chunks.exists()
+
+    @has_packed_logs.expression
+    def has_packed_logs(cls) -> Any:
+        return (cls.logs_storage != LogsStorageEnum.DB) | cls.id.in_(
+            TaskRunLogChunk.select(TaskRunLogChunk.task_run)
+        )
+
+    def get_logs_archive_path(self) -> Path:
+        return DB_LOGS_ARCHIVE_DIR_NAME / f"task_{self.task_id}" / f"run_{self.id}.gz"
+
+    def iter_archived_logs(self) -> Iterator["TaskRunLog"]:
+        """
+        Функция читает логи из сжатого файла по мере обхода. Если файла нет
+        или он поврежден, то логи заканчиваются на последней прочитанной
+        строке, а в лог пишется предупреждение
+        """
+
+        if self.logs_storage != LogsStorageEnum.ARCHIVE:
+            return
+
+        path: Path = self.get_logs_archive_path()
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    log_id, kind, date, text = json.loads(line)
+                    yield TaskRunLog(
+                        id=log_id,
+                        task_run=self.id,
+                        text=text,
+                        kind=LogKindEnum(kind),
+                        date=datetime.fromisoformat(date),
+                    )
+
+        except (OSError, EOFError, ValueError) as e:
+            logger.warning(
+                f"Не удалось прочитать архив логов запуска #{self.id} {path}: {e}"
+            )
+
+    def get_logs_archive_info(self) -> tuple[int, int | None]:
+        """
+        Функция возвращает количество строк в архиве логов и идентификатор
+        последней строки. Значения кэшируются по дате изменения файла
+        """
+
+        if self.logs_storage != LogsStorageEnum.ARCHIVE:
+            return 0, None
+
+        path: Path = self.get_logs_archive_path()
+        try:
+            mtime_ns: int = path.stat().st_mtime_ns
+        except OSError as e:
+            logger.warning(f"Не найден архив логов запуска #{self.id} {path}: {e}")
+            return 0, None
+
+        try:
+            return read_logs_archive_info(str(path), mtime_ns)
+        except (OSError, EOFError, ValueError) as e:
+            logger.warning(
+                f"Не удалось прочитать архив логов запуска #{self.id} {path}: {e}"
+            )
+            return 0, None
+
+    def archive_logs(self) -> int:
+        """
+        Функция переносит логи завершенного запуска в сжатый файл и возвращает
+        количество перенесенных строк. Строки и чанки логов в базе после этого
+        не читаются, их удаление выполняется отдельно (RetentionPurge)
+        """
+
+        if self.is_active:
+            raise ValueError(f"Нельзя архивировать логи запуска #{self.id} в работе")
+
+        if self.logs_storage != LogsStorageEnum.DB:
+            return 0
+
+        path: Path = self.get_logs_archive_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Запись через временный файл, чтобы не оставить недописанный архив
+        tmp_path: Path = path.with_suffix(".tmp")
+
+        number: int = 0
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for log in self.iter_logs():
+                item = [log.id, log.kind.value, log.date.isoformat(), log.text]
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+                number += 1
+
+        tmp_path.replace(path)
+
+        self.logs_storage = LogsStorageEnum.ARCHIVE
+        self.save(only=[TaskRun.logs_storage])
+
+        return number
+
+    def delete_logs_archive(self) -> None:
+        if self.logs_storage == LogsStorageEnum.DELETED:
+            return
+
+        self.get_logs_archive_path().unlink(missing_ok=True)
+
+        self.logs_storage = LogsStorageEnum.DELETED
+        self.save(only=[TaskRun.logs_storage])
+
+    def _get_packed_logs(self, start: int, end: int) -> list["TaskRunLog"]:
+        """
+        Функция возвращает упакованные логи по номерам строк [start, end).
+        Распаковываются только чанки, попадающие в диапазон
+        """
+
+        items: list[TaskRunLog] = []
+        if start >= end:
+            return items
+
+        query = self.log_chunks.where(
+            TaskRunLogChunk.first_line < end,
+            (TaskRunLogChunk.first_line + TaskRunLogChunk.number_of_lines) > start,
+        ).order_by(TaskRunLogChunk.first_line)
+
+        for chunk in query:
+            offset: int = chunk.first_line
+            items += chunk.get_logs()[max(start - offset, 0) : end - offset]
+
+        return items
+
+    def get_logs_page(
+        self,
+        start: int,
+        length: int,
+        desc: bool = False,
+    ) -> list["TaskRunLog"]:
+        """
+        Функция возвращает страницу логов запуска с учетом упакованных в чанки логов
+        """
+
+        if self.logs_storage != LogsStorageEnum.DB:
+            if desc:
+                total: int = self.get_number_of_logs()
+                end = max(total - start, 0)
+                start = max(end - length, 0)
+            else:
+                end = start + length
+
+            items: list[TaskRunLog] = list(
+                islice(self.iter_archived_logs(), start, end)
+            )
+            if desc:
+                items.reverse()
+            return items
+
+        number_of_packed: int = self.get_number_of_packed_logs()
+
+        if desc:
+            total: int = number_of_packed + self.logs.count()
+            end = max(total - start, 0)
+            start = max(end - length, 0)
+        else:
+            end = start + length
+
+        items: list[TaskRunLog] = self._get_packed_logs(
+            start, min(end, number_of_packed)
+        )
+        if end > number_of_packed:
+            offset = max(start, number_of_packed)
+            items += list(
+                self.logs.order_by(TaskRunLog.id)
+                .offset(offset - number_of_packed)
+                .limit(end - offset)
+            )
+
+        if desc:
+            items.reverse()
+
+        return items
+
+    def get_last_logs(self, number: int) -> list["TaskRunLog"]:
+        """
+        Функция возвращает последние number логов запуска. В отличие от
+        get_logs_page(desc=True) не считает количество логов запуска
+        """
+
+        if number <= 0:
+            return []
+
+        if self.logs_storage != LogsStorageEnum.DB:
+            total: int = self.get_number_of_logs()
+            return list(islice(self.iter_archived_logs(), max(total - number, 0), None))
+
+        items: list[TaskRunLog] = list(
+            self.logs.order_by(TaskRunLog.id.desc()).limit(number)
+        )
+        items.reverse()
+
+        rest: int = number - len(items)
+        if rest > 0:
+            number_of_packed: int = self.get_number_of_packed_logs()
+            items = (
+                self._get_packed_logs(max(number_of_packed - rest, 0), number_of_packed)
+                + items
+            )
+
+        return items
+
+    def get_logs_tail(
+        self,
+        max_lines: int = NOTIFICATION_LOGS_TAIL_MAX_LINES,
+        max_bytes: int = NOTIFICATION_LOGS_TAIL_MAX_BYTES,
+    ) -> str:
+        """
+        Функция возвращает текст последних логов запуска: не больше max_lines
+        строк и max_bytes байт (в UTF-8). Нужна для шаблонов уведомлений,
+        чтобы размер уведомления не зависел от размера логов
+        """
+
+        lines: list[str] = []
+        size: int = 0
+        is_truncated: bool = False
+
+        items: list[TaskRunLog] = self.get_last_logs(max_lines + 1)
+        if len(items) > max_lines:
+            items = items[1:]
+            is_truncated = True
+
+        for log in reversed(items):
+            size += len(log.text.encode("utf-8"))
+            if size > max_bytes:
+                is_truncated = True
+                break
+
+            lines.append(log.text)
+
+        lines.reverse()
+        if is_truncated:
+            lines.insert(0, "...\n")
+
+        # Строки логов уже содержат окончания строк
+        return "".join(lines)
+
+    def get_logs_after(self, last_id: int, limit: int) -> list["TaskRunLog"]:
+        """
+        Функция возвращает логи запуска с идентификатором больше last_id
+        """
+
+        if self.logs_storage != LogsStorageEnum.DB:
+            # Новых строк в архиве быть не может
+            last_archived_id: int | None = self.get_logs_archive_info()[1]
+            if last_archived_id is None or last_archived_id <= last_id:
+                return []
+
+            return list(
+                islice(
+                    (log for log in self.iter_archived_logs() if log.id > last_id),
+                    limit,
+                )
+            )
+
+        items: list[TaskRunLog] = []
+
+        for chunk in self.log_chunks.where(
+            TaskRunLogChunk.last_log_id > last_id
+        ).order_by(TaskRunLogChunk.first_line):
+            items += [log for log in chunk.get_logs() if log.id > last_id]
+            if len(items) >= limit:
+                return items[:limit]
+
+        items += list(
+            self.logs.where(TaskRunLog.id > last_id)
+            .order_by(TaskRunLog.id)
+            .limit(limit - len(items))
+        )
+        return items
+
+    def iter_logs(self) -> Iterator["TaskRunLog"]:
+        if self.logs_storage != LogsStorageEnum.DB:
+            yield from self.iter_archived_logs()
+            return
+
+        for chunk in self.log_chunks.order_by(TaskRunLogChunk.first_line):
+            yield from chunk.get_logs()
+
+        yield from self.logs.order_by(TaskRunLog.id).iterator()
+
+    def pack_logs(
+        self,
+        chunk_size: int = 1000,
+        compression: CompressionEnum = CompressionEnum.ZLIB,
+    ) -> int:
+        """
+        Функция упаковывает логи запуска в сжатые чанки и удаляет упакованные строки.
+        Возвращает количество упакованных строк
+        """
+
+        # Логи уже перенесены в архив
+        if self.logs_storage != LogsStorageEnum.DB:
+            return 0
+
+        first_line: int = self.get_number_of_packed_logs()
+
+        # Логи, упакованные ранее, не должны попасть в чанки повторно,
+        # даже если их удаление было прервано
+        last_log_id: int = (
+            self.log_chunks.select(fn.MAX(TaskRunLogChunk.last_log_id)).scalar() or 0
+        )
+
+        number: int = 0
+        while True:
+            items: list[TaskRunLog] = list(
+                self.logs.where(TaskRunLog.id > last_log_id)
+                .order_by(TaskRunLog.id)
+                .limit(chunk_size)
+            )
+            if not items:
+                break
+
+            TaskRunLogChunk.add(self, first_line + number, items, compression)
+            TaskRunLog.delete().where(
+                TaskRunLog.task_run == self,
+                TaskRunLog.id.between(items[0].id, items[-1].id),
+            ).execute()
+
+            number += len(items)
+            last_log_id = items[-1].id
+
+        return number
+
     def send_notifications(self) -> None:
         variables: dict[str, Any] = dict(run=self, config=CONFIG)
-        env = SandboxedEnvironment()
 
         for kind in NotificationKindEnum:
-            template: dict[str, str] = CONFIG_NOTIFICATION[kind.value]["template"]
-            template_name: str = template["name"]
-            template_text: str = template["text"]
-
-            name: str = env.from_string(template_name).render(variables)
-            text: str = env.from_string(template_text).render(variables)
+            # Текст будет сформирован при отправке
+            if NOTIFICATION_LAZY_TEXT:
+                Notification.add(
+                    task_run=self,
+                    name=render_notification_part(kind, variables, part="name"),
+                    text=None,
+                    kind=kind,
+                    template_key="template",
+                )
+                continue
+
+            name, text = render_notification(kind, variables)
 
             Notification.add(
                 task_run=self,
@@ -571,64 +1392,556 @@ class TaskRun(BaseModel):
         return urljoin(CONFIG_NOTIFICATION["base_url"], uri)
 
 
+# Запуски задачи по статусам в порядке создания (Task.get_runs_by, Task.get_pending_run)
+TaskRun.add_index(
+    TaskRun.index(TaskRun.task, TaskRun.status, TaskRun.create_date),
+)
+
+# Поиск "висящих" запусков (MaintenanceUnit)
+TaskRun.add_index(
+    TaskRun.index(TaskRun.status, TaskRun.start_date),
+)
+
+# Поиск старых запусков для удаления (MaintenanceUnit)
+TaskRun.add_index(
+    TaskRun.index(
+        fn.COALESCE(TaskRun.finish_date, TaskRun.create_date),
+        name="taskrun_finish_or_create_date",
+    ),
+)
+
+# Частичный индекс только по ожидающим и выполняющимся запускам, которых всегда мало
+TaskRun.add_index(
+    TaskRun.index(
+        TaskRun.status,
+        TaskRun.task,
+        where=TaskRun.is_active,
+        name="taskrun_active",
+    ),
+)
+
+
+class TaskSummary(BaseModel):
+    """
+    Сводка по запускам задачи. Поддерживается триггерами на Task и TaskRun,
+    поэтому меняется в том же выражении, что и запуск, а список задач
+    не зависит от размера истории запусков
+    """
+
+    task = ForeignKeyField(Task, primary_key=True, on_delete="CASCADE", backref="+")
+
+    # Последний запущенный и ближайший запланированный запуски
+    last_started_run_id = IntegerField(null=True)
+    nearest_scheduled_run_id = IntegerField(null=True)
+
+    # Завершенные (не ожидающие и не выполняющиеся) и успешные запуски
+    number_of_finished_runs = IntegerField(constraints=[SQL("DEFAULT 0")], default=0)
+    number_of_successful_runs = IntegerField(constraints=[SQL("DEFAULT 0")], default=0)
+
+    @hybrid_property
+    def success_rate(self) -> float | None:
+        if not self.number_of_finished_runs:
+            return None
+        return self.number_of_successful_runs / self.number_of_finished_runs
+
+    @success_rate.expression
+    def success_rate(cls) -> Any:
+        return cls.number_of_successful_runs.cast("REAL") / fn.NULLIF(
+            cls.number_of_finished_runs, 0
+        )
+
+    @classmethod
+    def create_table(cls, safe: bool = True, **options) -> None:
+        super().create_table(safe=safe, **options)
+        cls.create_triggers()
+
+    @classmethod
+    def _get_sql_update(cls, run: str, old_run: str | None = None) -> str:
+        table: str = cls._meta.table_name
+        run_table: str = TaskRun._meta.table_name
+
+        pending: str = TaskRunStatusEnum.PENDING.value
+        running: str = TaskRunStatusEnum.RUNNING.value
+        finished: str = TaskRunStatusEnum.FINISHED.value
+
+        def get_run_id(condition: str, order_by: str = "id DESC") -> str:
+            return (
+                f'(SELECT id FROM "{run_table}" WHERE task_id = {run}.task_id '
+                f"AND {condition} ORDER BY {order_by} LIMIT 1)"
+            )
+
+        def is_finished(r: str) -> str:
+            return (
+                f"(CASE WHEN {r}.status NOT IN ('{pending}', '{running}') "
+                f"THEN 1 ELSE 0 END)"
+            )
+
+        def is_successful(r: str) -> str:
+            return (
+                f"(CASE WHEN {r}.status = '{finished}' "
+                f"AND {r}.process_return_code = 0 THEN 1 ELSE 0 END)"
+            )
+
+        # Для удаления запуска передается только старое значение
+        number_of_finished: str = "number_of_finished_runs"
+        number_of_successful: str = "number_of_successful_runs"
+        if run != "old":
+            number_of_finished += f" + {is_finished(run)}"
+            number_of_successful += f" + {is_successful(run)}"
+        if old_run:
+            number_of_finished += f" - {is_finished(old_run)}"
+            number_of_successful += f" - {is_successful(old_run)}"
+
+        last_started_run_id: str = get_run_id(f"status != '{pending}'")
+        # Ближайший по дате запуска, а не последний созданный
+        nearest_scheduled_run_id: str = get_run_id(
+            f"status = '{pending}' AND scheduled_date IS NOT NULL",
+            order_by="scheduled_date ASC, id ASC",
+        )
+
+        return (
+            f'UPDATE "{table}" SET '
+            f"last_started_run_id = {last_started_run_id}, "
+            f"nearest_scheduled_run_id = {nearest_scheduled_run_id}, "
+            f"number_of_finished_runs = {number_of_finished}, "
+            f"number_of_successful_runs = {number_of_successful} "
+            f"WHERE task_id = {run}.task_id;"
+        )
+
+    @classmethod
+    def create_triggers(cls) -> None:
+        table: str = cls._meta.table_name
+        task_table: str = Task._meta.table_name
+        run_table: str = TaskRun._meta.table_name
+
+        add_task_sql: str = f'INSERT OR IGNORE INTO "{table}" (task_id) VALUES'
+
+        for name, event, body in [
+            (
+                f"{task_table}_summary_insert",
+                f'AFTER INSERT ON "{task_table}"',
+                f"{add_task_sql} (new.id);",
+            ),
+            (
+                f"{run_table}_summary_insert",
+                f'AFTER INSERT ON "{run_table}"',
+                f"{add_task_sql} (new.task_id); {cls._get_sql_update('new')}",
+            ),
+            (
+                f"{run_table}_summary_update",
+                f'AFTER UPDATE OF status, scheduled_date, process_return_code ON "{run_table}"',
+                cls._get_sql_update("new", old_run="old"),
+            ),
+            (
+                f"{run_table}_summary_delete",
+                f'AFTER DELETE ON "{run_table}"',
+                cls._get_sql_update("old", old_run="old"),
+            ),
+        ]:
+            cls._meta.database.execute_sql(
+                f'CREATE TRIGGER IF NOT EXISTS "{name}" {event} BEGIN {body} END'
+            )
+
+    @classmethod
+    def rebuild(cls) -> None:
+        """
+        Пересчет сводки всех задач по истории запусков
+        """
+
+        def get_run_id(
+            *filters: Expression,
+            order_by: tuple[Ordering, ...] = (TaskRun.id.desc(),),
+        ) -> ModelSelect:
+            return (
+                TaskRun.select(TaskRun.id)
+                .where(TaskRun.task == Task.id, *filters)
+                .order_by(*order_by)
+                .limit(1)
+            )
+
+        def count(*filters: Expression) -> ModelSelect:
+            return TaskRun.select(fn.COUNT(TaskRun.id)).where(
+                TaskRun.task == Task.id, *filters
+            )
+
+        query = Task.select(
+            Task.id,
+            get_run_id(TaskRun.status != TaskRunStatusEnum.PENDING),
+            get_run_id(
+                TaskRun.status == TaskRunStatusEnum.PENDING,
+                TaskRun.scheduled_date.is_null(False),
+                order_by=(TaskRun.scheduled_date.asc(), TaskRun.id.asc()),
+            ),
+            count(~TaskRun.is_active),
+            count(TaskRun.is_success),
+        )
+
+        cls.delete().execute()
+        cls.insert_from(
+            query,
+            fields=[
+                cls.task,
+                cls.last_started_run_id,
+                cls.nearest_scheduled_run_id,
+                cls.number_of_finished_runs,
+                cls.number_of_successful_runs,
+            ],
+        ).execute()
+
+
 class TaskRunLog(BaseModel):
+    # Идентификаторы удаленных (упакованных) логов не должны переиспользоваться
+    id = AutoIncrementField()
     task_run = ForeignKeyField(TaskRun, on_delete="CASCADE", backref="logs")
     text = TextField()
     kind = EnumField(choices=LogKindEnum)
     date = DateTimeField(default=datetime.now)
 
+    @classmethod
+    def search_text(cls, value: str) -> Expression:
+        # Индекс trigram ищет подстроки не короче 3 символов
+        if len(value) < TaskRunLogSearch.MIN_LENGTH:
+            return cls.text.contains(value)
+
+        return cls.id.in_(
+            TaskRunLogSearch.select(TaskRunLogSearch.rowid).where(
+                TaskRunLogSearch.match_text(value)
+            )
+        )
+
+    @classmethod
+    def search_kind(cls, value: str) -> Expression | None:
+        kinds: list[LogKindEnum] = [
+            kind for kind in LogKindEnum if value.lower() in kind.value
+        ]
+        return cls.kind.in_(kinds) if kinds else None
+
+
+class TaskRunLogSearch(FTS5Model, BaseModel):
+    """
+    Полнотекстовый индекс текста логов (FTS5 с токенизатором trigram) для
+    поиска подстрок без просмотра всей таблицы. Содержимое не хранится,
+    а берется из TaskRunLog, синхронизация выполняется триггерами
+    """
+
+    MIN_LENGTH: int = 3
+
+    # Обрамление совпадений во фрагменте текста
+    SNIPPET_START: str = "\x02"
+    SNIPPET_END: str = "\x03"
+
+    rowid = RowIDField()
+    text = SearchField()
+
+    class Meta:
+        database = db
+        options = {
+            "content": TaskRunLog,
+            "content_rowid": TaskRunLog.id,
+            "tokenize": "trigram",
+        }
+
+    @classmethod
+    def create_table(cls, safe: bool = True, **options) -> None:
+        super().create_table(safe=safe, **options)
+        cls.create_triggers()
+
+    @classmethod
+    def create_triggers(cls) -> None:
+        table: str = cls._meta.table_name
+        log_table: str = TaskRunLog._meta.table_name
+
+        add_sql: str = (
+            f'INSERT INTO "{table}" (rowid, "text") VALUES (new.id, new.text);'
+        )
+        delete_sql: str = (
+            f'INSERT INTO "{table}" ("{table}", rowid, "text") '
+            f"VALUES ('delete', old.id, old.text);"
+        )
+
+        for name, event, body in [
+            ("insert", "AFTER INSERT", add_sql),
+            ("delete", "AFTER DELETE", delete_sql),
+            ("update", 'AFTER UPDATE OF "text"', delete_sql + " " + add_sql),
+        ]:
+            cls._meta.database.execute_sql(
+                f'CREATE TRIGGER IF NOT EXISTS "{log_table}_search_{name}" '
+                f'{event} ON "{log_table}" BEGIN {body} END'
+            )
+
+    @classmethod
+    def match_text(cls, value: str) -> Expression:
+        # Поиск подстроки целиком, а не по синтаксису запросов FTS5
+        phrase: str = '"' + value.replace('"', '""') + '"'
+        return cls.match(phrase)
+
+    @classmethod
+    def search(
+        cls,
+        value: str,
+        filters: Iterable[Expression] = (),
+        limit: int = 100,
+        snippet_tokens: int = 64,
+    ) -> list[TaskRunLog]:
+        """
+        Функция возвращает логи в порядке релевантности с фрагментом текста
+        в атрибуте search_snippet, в котором совпадения обрамлены
+        SNIPPET_START и SNIPPET_END
+        """
+
+        snippet = fn.snippet(
+            cls._meta.entity,
+            0,
+            cls.SNIPPET_START,
+            cls.SNIPPET_END,
+            "…",
+            snippet_tokens,
+        )
+        return list(
+            TaskRunLog.select(TaskRunLog, snippet.alias("search_snippet"))
+            .join(cls, on=(cls.rowid == TaskRunLog.id))
+            .where(cls.match_text(value), *filters)
+            .order_by(cls.rank())
+            .limit(limit)
+            .objects()
+        )
+
+
+class TaskRunLogChunk(BaseModel):
+    """
+    Логи запуска, упакованные в сжатые блоки.
+    По first_line и number_of_lines находятся чанки нужной страницы логов
+    """
+
+    task_run = ForeignKeyField(TaskRun, on_delete="CASCADE", backref="log_chunks")
+    first_line = IntegerField()
+    number_of_lines = IntegerField()
+    first_log_id = IntegerField()
+    last_log_id = IntegerField()
+    compression = EnumField(choices=CompressionEnum)
+    data = BlobField()
+
+    class Meta:
+        indexes = (
+            # Уникальный индекс по идентификатору запуска и номеру первой строки
+            (("task_run_id", "first_line"), True),
+        )
+
+    @classmethod
+    def add(
+        cls,
+        task_run: TaskRun,
+        first_line: int,
+        logs: list[TaskRunLog],
+        compression: CompressionEnum = CompressionEnum.ZLIB,
+    ) -> Self:
+        items: list[list[Any]] = [
+            [log.id, log.kind.value, log.date.isoformat(), log.text] for log in logs
+        ]
+        data: bytes = json.dumps(items, ensure_ascii=False).encode("utf-8")
+
+        return cls.create(
+            task_run=task_run,
+            first_line=first_line,
+            number_of_lines=len(logs),
+            first_log_id=logs[0].id,
+            last_log_id=logs[-1].id,
+            compression=compression,
+            data=compress_data(data, compression),
+        )
+
+    def get_logs(self) -> list[TaskRunLog]:
+        data: bytes = decompress_data(bytes(self.data), self.compression)
+        return [
+            TaskRunLog(
+                id=log_id,
+                task_run=self.task_run_id,
+                text=text,
+                kind=LogKindEnum(kind),
+                date=datetime.fromisoformat(date),
+            )
+            for log_id, kind, date, text in json.loads(data)
+        ]
+
 
 class Notification(BaseModel):
     task_run = ForeignKeyField(
         TaskRun, null=True, on_delete="CASCADE", backref="notifications"
     )
     name = TextField()
-    text = TextField()
+    # Если текст не задан, то он формируется при отправке по шаблону template_key
+    # из конфига и сохраняется после отправки
+    text = TextField(null=True)
+    template_key = TextField(null=True)
     kind = EnumField(choices=NotificationKindEnum)
     append_date = DateTimeField(default=datetime.now)
     sending_date = DateTimeField(null=True)
     canceling_date = DateTimeField(null=True)
 
+    # Неудачные попытки отправки: количество, дата следующей попытки и ошибка
+    # последней из них
+    attempts = IntegerField(default=0)
+    next_attempt_date = DateTimeField(null=True)
+    last_error = TextField(null=True)
+
+    # Сводное уведомление, в которое было объединено это
+    merged_into = ForeignKeyField(
+        "self", null=True, on_delete="SET NULL", backref="merged", index=False
+    )
+
     @classmethod
     def add(
         cls,
         task_run: TaskRun | None,
         name: str,
-        text: str,
+        text: str | None,
         kind: NotificationKindEnum,
+        template_key: str | None = None,
     ) -> Self:
+        if text is None and (task_run is None or template_key is None):
+            raise ValueError("Без текста уведомлению нужны запуск и шаблон")
+
         return cls.create(
             task_run=task_run,
             name=name,
             text=text,
             kind=kind,
+            template_key=template_key,
         )
 
+    @classmethod
+    def merge(
+        cls,
+        items: list[Self],
+        name: str,
+        text: str | None,
+        template_key: str | None = None,
+    ) -> Self:
+        """
+        Функция создает сводное уведомление вместо items, которые помечаются
+        как объединенные в него. Сводное уведомление относится к последнему
+        запуску
+        """
+
+        obj = cls.add(
+            task_run=items[-1].task_run,
+            name=name,
+            text=text,
+            kind=items[-1].kind,
+            template_key=template_key,
+        )
+        cls.update(merged_into=obj).where(
+            cls.id.in_([item.id for item in items]),
+            cls.is_unsent,
+        ).execute()
+
+        return obj
+
     @classmethod
     def get_unsent(cls) -> list[Self]:
         """
         Функция, что возвращает неотправленные уведомления
         """
 
-        return list(
-            cls.select()
-            .where(
-                cls.sending_date.is_null(True),
-                cls.canceling_date.is_null(True),
-            )
-            .order_by(cls.append_date)
+        return list(cls.select().where(cls.is_unsent).order_by(cls.append_date))
+
+    @classmethod
+    def get_ready_to_send(
+        cls,
+        kind: NotificationKindEnum,
+        now: datetime | None = None,
+        exclude_ids: Iterable[int] = (),
+        limit: int | None = None,
+    ) -> list[Self]:
+        """
+        Функция возвращает неотправленные уведомления вида kind, для которых
+        наступило время следующей попытки отправки
+        """
+
+        if now is None:
+            now = datetime.now()
+
+        query = cls.select().where(
+            cls.is_unsent,
+            cls.kind == kind,
+            cls.next_attempt_date.is_null() | (cls.next_attempt_date <= now),
+        )
+
+        exclude_ids = list(exclude_ids)
+        if exclude_ids:
+            query = query.where(cls.id.not_in(exclude_ids))
+
+        return list(query.order_by(cls.append_date).limit(limit))
+
+    @hybrid_property
+    def is_unsent(self) -> bool:
+        return (
+            self.sending_date is None
+            and self.canceling_date is None
+            and self.merged_into_id is None
+        )
+
+    @is_unsent.expression
+    def is_unsent(cls) -> Any:
+        return (
+            literal_is_null(cls.sending_date)
+            & literal_is_null(cls.canceling_date)
+            & literal_is_null(cls.merged_into)
         )
 
     def is_ready(self) -> bool:
-        return self.sending_date is None and self.canceling_date is None
+        return self.is_unsent
+
+    def get_variables(self) -> dict[str, Any]:
+        variables: dict[str, Any] = dict(run=self.task_run, config=CONFIG)
+
+        # Запуски объединенных уведомлений
+        if self.template_key == "digest_template":
+            variables["task"] = self.task_run.task
+            variables["runs"] = [
+                item.task_run for item in self.merged.order_by(Notification.id)
+            ]
 
-    def set_as_send(self) -> None:
+        return variables
+
+    def get_text(self) -> str:
         """
-        Функция устанавливает дату отправки и сохраняет ее
+        Функция возвращает текст уведомления. Если текст не был сохранен,
+        то он формируется по шаблону
+        """
+
+        if self.text is not None:
+            return self.text
+
+        return render_notification_part(
+            kind=self.kind,
+            variables=self.get_variables(),
+            template_key=self.template_key,
+            part="text",
+        )
+
+    def set_as_send(self, text: str | None = None) -> None:
+        """
+        Функция устанавливает дату отправки и сохраняет ее. Для уведомления
+        без текста сохраняется отправленный текст text
         """
 
         if self.is_ready():
             self.sending_date = datetime.now()
+            if self.text is None:
+                self.text = text
+            self.save()
+
+    def set_as_failed(self, error: str, delay_secs: float) -> None:
+        """
+        Функция сохраняет неудачную попытку отправки и назначает следующую
+        через delay_secs секунд
+        """
+
+        if self.is_ready():
+            self.attempts += 1
+            self.last_error = error
+            self.next_attempt_date = datetime.now() + timedelta(seconds=delay_secs)
             self.save()
 
     def cancel(self) -> None:
@@ -641,6 +1954,26 @@ class Notification(BaseModel):
             self.save()
 
 
+# Частичный индекс только по неотправленным уведомлениям (Notification.get_unsent)
+Notification.add_index(
+    Notification.index(
+        Notification.append_date,
+        where=Notification.is_unsent,
+        name="notification_unsent",
+    ),
+)
+
+# Частичный индекс только по объединенным уведомлениям, чтобы для неотправленных
+# использовался notification_unsent
+Notification.add_index(
+    Notification.index(
+        Notification.merged_into,
+        where=Notification.merged_into.is_null(False),
+        name="notification_merged_into",
+    ),
+)
+
+
 db.connect()
 db.create_tables(BaseModel.get_inherited_models())
 
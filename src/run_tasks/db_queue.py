@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import enum
+import threading
+from collections import deque
+from contextlib import contextmanager
+from queue import Empty, Full
+from time import monotonic
+from typing import Any, Iterator
+
+from playhouse.sqliteq import (
+    SHUTDOWN,
+    PAUSE,
+    UNPAUSE,
+    AsyncCursor,
+    ShutdownException,
+    SqliteQueueDatabase,
+    Writer,
+    logger,
+)
+
+
+@enum.unique
+class BackpressureEnum(enum.StrEnum):
+    # Ждать места в очереди
+    BLOCK = enum.auto()
+    # Отбрасывать записи, отмеченные как необязательные (db.droppable()),
+    # остальные ждут места в очереди. Так отмечается вывод (OUT) задач,
+    # поэтому часть вывода запусков будет потеряна
+    DROP_TASK_OUTPUT = enum.auto()
+    # Складывать записи в память сверх очереди
+    SPILL = enum.auto()
+
+
+# Запросы, которые нельзя выполнять внутри общей транзакции
+NOT_GROUPED_SQL_PREFIXES: tuple[str, ...] = (
+    "pragma",
+    "vacuum",
+    "begin",
+    "commit",
+    "rollback",
+    "savepoint",
+    "release",
+    "attach",
+    "detach",
+)
+
+
+class QueuedCursor(AsyncCursor):
+    __slots__ = ("queued_time",)
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.queued_time: float = monotonic()
+
+
+class ResultCursor:
+    """
+    Результат запроса, прочитанный до фиксации транзакции
+    """
+
+    def __init__(
+        self,
+        rows: list[tuple] | None = None,
+        lastrowid: int | None = None,
+        rowcount: int = 0,
+        description: tuple | None = None,
+    ) -> None:
+        self.rows = rows or []
+        self.lastrowid = lastrowid
+        self.rowcount = rowcount
+        self.description = description
+
+    def fetchall(self) -> list[tuple]:
+        return self.rows
+
+    def close(self) -> None:
+        pass
+
+
+class DroppableWrites:
+    """
+    Записи блока db.droppable(): сколько из них было отброшено
+    """
+
+    __slots__ = ("number_of_dropped",)
+
+    def __init__(self) -> None:
+        self.number_of_dropped: int = 0
+
+
+class GroupCommitWriter(Writer):
+    """
+    Поток записи, который выполняет накопившиеся в очереди запросы в одной
+    транзакции, поэтому на пачку запросов приходится одна фиксация (и fsync).
+    Каждый запрос выполняется в своей точке сохранения, поэтому ошибка
+    запроса не отменяет остальные. Результаты запросов становятся доступны
+    после фиксации
+    """
+
+    __slots__ = ()
+
+    database: "GroupCommitQueueDatabase"
+
+    def loop(self, conn):
+        obj = self.database.get_write(timeout=None)
+        if not isinstance(obj, AsyncCursor):
+            return self.handle_control(conn, obj)
+
+        batch: list[AsyncCursor] = [obj]
+        control: Any = None
+
+        # Ожидание следующих запросов не дольше интервала фиксации
+        deadline: float = monotonic() + self.database.commit_interval_secs
+        while len(batch) < self.database.max_commit_size and self.is_grouped(batch[-1]):
+            try:
+                obj = self.database.get_write(timeout=max(deadline - monotonic(), 0))
+            except Empty:
+                break
+
+            if not isinstance(obj, AsyncCursor):
+                control = obj
+                break
+
+            if not self.is_grouped(obj):
+                self.execute_batch(batch)
+                batch = []
+
+            batch.append(obj)
+
+        self.execute_batch(batch)
+
+        if control is not None:
+            return self.handle_control(conn, control)
+
+        return conn
+
+    @staticmethod
+    def is_grouped(obj: AsyncCursor) -> bool:
+        return not obj.sql.lstrip().lower().startswith(NOT_GROUPED_SQL_PREFIXES)
+
+    def handle_control(self, conn, obj):
+        if obj is PAUSE:
+            logger.info("writer paused - closing database connection.")
+            self.database._close(conn)
+            self.database._state.reset()
+            return
+
+        if obj is SHUTDOWN:
+            # Записи, отложенные в память, выполняются до остановки
+            batch: list[AsyncCursor] = self.database.pop_spilled()
+            if batch:
+                self.execute_batch(batch)
+            raise ShutdownException()
+
+        if obj is UNPAUSE:
+            logger.error("writer received unpause, but is already running.")
+        else:
+            logger.error("writer received unsupported object: %s", obj)
+
+        return conn
+
+    def execute_batch(self, batch: list[QueuedCursor]) -> None:
+        if not batch:
+            return
+
+        start_time: float = monotonic()
+        for obj in batch:
+            self.database.add_wait_secs(start_time - obj.queued_time)
+
+        # Одиночный запрос выполняется без явной транзакции
+        if len(batch) == 1:
+            self.execute(batch[0])
+            self.database.add_commit(1, monotonic() - start_time)
+            return
+
+        results: list[tuple[AsyncCursor, ResultCursor | None, Exception | None]] = []
+        try:
+            self.database._execute("BEGIN IMMEDIATE")
+
+            for obj in batch:
+                self.database._execute("SAVEPOINT queued_write")
+                try:
+                    cursor = self.database._execute(obj.sql, obj.params)
+                    result = ResultCursor(
+                        rows=cursor.fetchall(),
+                        lastrowid=cursor.lastrowid,
+                        rowcount=cursor.rowcount,
+                        description=cursor.description,
+                    )
+                    cursor.close()
+                    self.database._execute("RELEASE queued_write")
+                    results.append((obj, result, None))
+
+                except Exception as e:
+                    self.database._execute("ROLLBACK TO queued_write")
+                    self.database._execute("RELEASE queued_write")
+                    results.append((obj, None, e))
+
+            self.database._execute("COMMIT")
+
+        except Exception as e:
+            logger.exception("error while committing a group of queued writes.")
+            try:
+                self.database._execute("ROLLBACK")
+            except Exception:
+                pass
+
+            for obj in batch:
+                obj.set_result(None, e)
+            return
+
+        self.database.add_commit(len(batch), monotonic() - start_time)
+
+        for obj, result, exc in results:
+            obj.set_result(result, exc)
+
+
+class GroupCommitQueueDatabase(SqliteQueueDatabase):
+    """
+    SqliteQueueDatabase, в которой записи из очереди фиксируются пачками
+    (см. GroupCommitWriter). Если очередь заполнена, то поведение задается
+    backpressure (см. BackpressureEnum).
+
+    Статистика: глубина очереди, время ожидания записи в очереди, размер
+    и длительность фиксаций, отброшенные и отложенные записи (get_stats)
+    """
+
+    def __init__(
+        self,
+        database,
+        commit_interval_secs: float = 0.0,
+        max_commit_size: int = 500,
+        backpressure: BackpressureEnum = BackpressureEnum.BLOCK,
+        *args,
+        **kwargs,
+    ) -> None:
+        self.commit_interval_secs = commit_interval_secs
+        self.max_commit_size = max_commit_size
+        self.backpressure = BackpressureEnum(backpressure)
+
+        # Записи сверх очереди при BackpressureEnum.SPILL
+        self._spill: deque[AsyncCursor] = deque()
+        self._is_spilling: bool = False
+        self._spill_lock = threading.Lock()
+
+        self._droppable = threading.local()
+
+        self._stats_lock = threading.Lock()
+        self.max_queue_depth: int = 0
+        self.number_of_writes: int = 0
+        self.number_of_commits: int = 0
+        self.last_commit_size: int = 0
+        self.largest_commit_size: int = 0
+        self.last_commit_secs: float = 0.0
+        self.max_commit_secs: float = 0.0
+        self.max_wait_secs: float = 0.0
+        self.number_of_blocked: int = 0
+        self.number_of_dropped: int = 0
+        self.number_of_spilled: int = 0
+        self._total_commit_secs: float = 0.0
+        self._total_wait_secs: float = 0.0
+        self._total_blocked_secs: float = 0.0
+
+        super().__init__(database, *args, **kwargs)
+
+    def start(self) -> bool:
+        with self._lock:
+            if not self._is_stopped:
+                return False
+
+            def run() -> None:
+                writer = GroupCommitWriter(self, self._write_queue)
+                writer.run()
+
+            self._writer = self._thread_helper.thread(run)
+            self._writer.start()
+            self._is_stopped = False
+            return True
+
+    def queue_size(self) -> int:
+        return self._write_queue.qsize() + len(self._spill)
+
+    @contextmanager
+    def droppable(self) -> Iterator[DroppableWrites]:
+        """
+        Записи внутри блока можно отбросить при заполненной очереди
+        (BackpressureEnum.DROP_TASK_OUTPUT). Количество отброшенных записей
+        блока доступно в возвращаемом объекте
+        """
+
+        prev: DroppableWrites | None = getattr(self._droppable, "value", None)
+        writes = DroppableWrites()
+        self._droppable.value = writes
+        try:
+            yield writes
+        finally:
+            self._droppable.value = prev
+
+    def execute_sql(self, sql, params=None, commit=None, timeout=None):
+        if sql.lower().startswith("select"):
+            return super().execute_sql(sql, params, commit=commit, timeout=timeout)
+
+        cursor = QueuedCursor(
+            event=self._thread_helper.event(),
+            sql=sql,
+            params=params,
+            timeout=self._results_timeout if timeout is None else timeout,
+        )
+        self._put_write(cursor)
+        return cursor
+
+    def _put_write(self, cursor: AsyncCursor) -> None:
+        if self.backpressure == BackpressureEnum.SPILL:
+            with self._spill_lock:
+                if not self._is_spilling:
+                    try:
+                        self._write_queue.put_nowait(cursor)
+                        self._update_queue_depth()
+                        return
+                    except Full:
+                        self._is_spilling = True
+
+                self._spill.append(cursor)
+
+            with self._stats_lock:
+                self.number_of_spilled += 1
+            self._update_queue_depth()
+            return
+
+        try:
+            self._write_queue.put_nowait(cursor)
+            self._update_queue_depth()
+            return
+        except Full:
+            pass
+
+        writes: DroppableWrites | None = getattr(self._droppable, "value", None)
+        if self.backpressure == BackpressureEnum.DROP_TASK_OUTPUT and writes:
+            writes.number_of_dropped += 1
+            with self._stats_lock:
+                self.number_of_dropped += 1
+            cursor.set_result(ResultCursor())
+            return
+
+        start_time: float = monotonic()
+        self._write_queue.put(cursor)
+        with self._stats_lock:
+            self.number_of_blocked += 1
+            self._total_blocked_secs += monotonic() - start_time
+        self._update_queue_depth()
+
+    def get_write(self, timeout: float | None) -> Any:
+        """
+        Функция возвращает следующую запись: сначала из очереди, затем
+        отложенные в память. Если записей нет, то ждет не дольше timeout
+        (None - без ограничения), после чего выбрасывает queue.Empty
+        """
+
+        try:
+            return self._write_queue.get_nowait()
+        except Empty:
+            pass
+
+        with self._spill_lock:
+            if self._spill:
+                return self._spill.popleft()
+
+            # Новые записи снова идут в очередь
+            self._is_spilling = False
+
+        if timeout is None:
+            return self._write_queue.get()
+
+        return self._write_queue.get(timeout=timeout)
+
+    def pop_spilled(self) -> list[AsyncCursor]:
+        with self._spill_lock:
+            items: list[AsyncCursor] = list(self._spill)
+            self._spill.clear()
+            self._is_spilling = False
+            return items
+
+    def _update_queue_depth(self) -> None:
+        depth: int = self.queue_size()
+        if depth > self.max_queue_depth:
+            with self._stats_lock:
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def add_wait_secs(self, wait_secs: float) -> None:
+        with self._stats_lock:
+            self.number_of_writes += 1
+            self._total_wait_secs += wait_secs
+            self.max_wait_secs = max(self.max_wait_secs, wait_secs)
+
+    def add_commit(self, size: int, commit_secs: float) -> None:
+        with self._stats_lock:
+            self.number_of_commits += 1
+            self.last_commit_size = size
+            self.largest_commit_size = max(self.largest_commit_size, size)
+            self.last_commit_secs = commit_secs
+            self.max_commit_secs = max(self.max_commit_secs, commit_secs)
+            self._total_commit_secs += commit_secs
+
+    def get_stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            return dict(
+                backpressure=self.backpressure.value,
+                queue_depth=self.queue_size(),
+                max_queue_depth=self.max_queue_depth,
+                number_of_writes=self.number_of_writes,
+                number_of_commits=self.number_of_commits,
+                last_commit_size=self.last_commit_size,
+                largest_commit_size=self.largest_commit_size,
+                avg_commit_size=(
+                    self.number_of_writes / self.number_of_commits
+                    if self.number_of_commits
+                    else 0.0
+                ),
+                last_commit_secs=self.last_commit_secs,
+                max_commit_secs=self.max_commit_secs,
+                avg_commit_secs=(
+                    self._total_commit_secs / self.number_of_commits
+                    if self.number_of_commits
+                    else 0.0
+                ),
+                max_wait_secs=self.max_wait_secs,
+                avg_wait_secs=(
+                    self._total_wait_secs / self.number_of_writes
+                    if self.number_of_writes
+                    else 0.0
+                ),
+                number_of_blocked=self.number_of_blocked,
+                blocked_secs=self._total_blocked_secs,
+                number_of_dropped=self.number_of_dropped,
+                number_of_spilled=self.number_of_spilled,
+            )
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import threading
+from typing import Callable
+
+
+class TaskEvents:
+    """
+    Оповещения внутри процесса о событиях задач (например, о появлении запуска),
+    чтобы ожидающие потоки просыпались сразу, а не опрашивали базу
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._events: dict[int, threading.Event] = dict()
+
+        # Событие любой задачи
+        self._any_event = threading.Event()
+
+        # Обработчики оповещений, получающие идентификатор задачи
+        self._listeners: list[Callable[[int], None]] = []
+
+    def _get_event(self, task_id: int) -> threading.Event:
+        with self._lock:
+            if task_id not in self._events:
+                self._events[task_id] = threading.Event()
+            return self._events[task_id]
+
+    def add_listener(self, listener: Callable[[int], None]) -> None:
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[int], None]) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def notify(self, task_id: int) -> None:
+        self._get_event(task_id).set()
+        self._any_event.set()
+
+        with self._lock:
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            listener(task_id)
+
+    def notify_any(self) -> None:
+        self._any_event.set()
+
+    def wait(self, task_id: int, timeout: float | None = None) -> bool:
+        """
+        Функция ожидает оповещения для задачи и возвращает True, если оно было.
+        Оповещения, пришедшие до вызова, не теряются
+        """
+
+        event = self._get_event(task_id)
+        result: bool = event.wait(timeout)
+
+        # Сброс до проверки состояния вызывающим, поэтому следующее оповещение
+        # снова разбудит ожидание
+        event.clear()
+
+        return result
+
+    def wait_any(self, timeout: float | None = None) -> bool:
+        """
+        Функция ожидает оповещения для любой задачи и возвращает True, если оно было
+        """
+
+        result: bool = self._any_event.wait(timeout)
+        self._any_event.clear()
+
+        return result
+
+
+class StopToken:
+    """
+    Признак остановки запуска в памяти процесса
+    """
+
+    def __init__(self, task_run_id: int, task_id: int) -> None:
+        self.task_run_id = task_run_id
+        self.task_id = task_id
+
+        self._event = threading.Event()
+
+    def set(self) -> None:
+        self._event.set()
+
+    def is_set(self) -> bool:
+        return self._event.is_set()
+
+
+class StopTokens:
+    """
+    Признаки остановки выполняемых запусков. Выставляются при остановке запуска
+    и отключении задачи, чтобы исполнитель узнавал об этом без запросов к базе
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tokens: dict[int, StopToken] = dict()
+
+    def register(self, task_run_id: int, task_id: int) -> StopToken:
+        with self._lock:
+            if task_run_id not in self._tokens:
+                self._tokens[task_run_id] = StopToken(task_run_id, task_id)
+            return self._tokens[task_run_id]
+
+    def unregister(self, task_run_id: int) -> None:
+        with self._lock:
+            self._tokens.pop(task_run_id, None)
+
+    def stop(self, task_run_id: int) -> None:
+        with self._lock:
+            token: StopToken | None = self._tokens.get(task_run_id)
+
+        if token:
+            token.set()
+
+    def stop_task(self, task_id: int) -> None:
+        with self._lock:
+            tokens: list[StopToken] = [
+                token for token in self._tokens.values() if token.task_id == task_id
+            ]
+
+        for token in tokens:
+            token.set()
+
+
+TASK_EVENTS = TaskEvents()
+STOP_TOKENS = StopTokens()
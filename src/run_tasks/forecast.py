@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import math
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any
+
+from peewee import fn
+
+from run_tasks.common import get_cron
+from run_tasks.db import Task, TaskRun, TaskRunStatusEnum
+
+# Длительность запуска для задач без истории запусков
+DEFAULT_DURATION_SECS: float = 60.0
+
+# Количество последних завершенных запусков для оценки длительности
+NUMBER_OF_LAST_RUNS: int = 10
+
+# Ограничение окна прогноза
+MAX_WINDOW: timedelta = timedelta(days=31)
+
+
+@dataclass
+class TaskForecast:
+    task_id: int
+    name: str
+    cron: str
+    duration_secs: float
+    dates: list[datetime] = field(default_factory=list)
+
+    def to_dict(self) -> dict[str, Any]:
+        return dict(
+            task_id=self.task_id,
+            name=self.name,
+            cron=self.cron,
+            duration_secs=self.duration_secs,
+            number_of_runs=len(self.dates),
+        )
+
+
+@dataclass
+class Forecast:
+    """
+    Прогноз нагрузки: сколько запусков будет выполняться одновременно
+    в каждую минуту окна
+    """
+
+    start_date: datetime
+    end_date: datetime
+    tasks: list[TaskForecast]
+
+    # Количество одновременных запусков по минутам, начиная с start_date
+    concurrency: list[int]
+
+    @property
+    def peak_concurrency(self) -> int:
+        return max(self.concurrency, default=0)
+
+    def get_peak_dates(self, limit: int = 10) -> list[datetime]:
+        peak: int = self.peak_concurrency
+        if not peak:
+            return []
+
+        return [
+            self.start_date + timedelta(minutes=i)
+            for i, number in enumerate(self.concurrency)
+            if number == peak
+        ][:limit]
+
+    def get_collisions(self, limit: int = 10) -> list[dict[str, Any]]:
+        """
+        Функция возвращает минуты, в которые стартуют несколько задач,
+        начиная с самых нагруженных
+        """
+
+        names_by_date: dict[datetime, list[str]] = dict()
+        for task in self.tasks:
+            for date in task.dates:
+                names_by_date.setdefault(date, []).append(task.name)
+
+        items: list[tuple[datetime, list[str]]] = sorted(
+            ((date, names) for date, names in names_by_date.items() if len(names) > 1),
+            key=lambda item: (-len(item[1]), item[0]),
+        )
+        return [dict(date=date, tasks=names) for date, names in items[:limit]]
+
+    def to_dict(self, limit: int = 10) -> dict[str, Any]:
+        return dict(
+            start_date=self.start_date,
+            end_date=self.end_date,
+            peak_concurrency=self.peak_concurrency,
+            peak_dates=self.get_peak_dates(limit),
+            collisions=self.get_collisions(limit),
+            tasks=[task.to_dict() for task in self.tasks],
+        )
+
+
+def get_durations(task_ids: list[int]) -> dict[int, float]:
+    """
+    Функция возвращает среднюю длительность последних завершенных запусков задач
+    """
+
+    duration = (
+        fn.julianday(TaskRun.finish_date) - fn.julianday(TaskRun.start_date)
+    ) * 86400
+
+    # Номер запуска с конца среди завершенных запусков задачи
+    number = (
+        fn.ROW_NUMBER()
+        .over(partition_by=[TaskRun.task], order_by=[TaskRun.id.desc()])
+        .alias("number")
+    )
+    last_runs = (
+        TaskRun.select(TaskRun.task, duration.alias("duration"), number)
+        .where(
+            TaskRun.task.in_(task_ids),
+            TaskRun.status == TaskRunStatusEnum.FINISHED,
+            TaskRun.start_date.is_null(False),
+            TaskRun.finish_date.is_null(False),
+        )
+        .alias("last_runs")
+    )
+
+    query = (
+        TaskRun.select(last_runs.c.task_id, fn.AVG(last_runs.c.duration))
+        .from_(last_runs)
+        .where(last_runs.c.number <= NUMBER_OF_LAST_RUNS)
+        .group_by(last_runs.c.task_id)
+        .tuples()
+    )
+    return {task_id: value for task_id, value in query}
+
+
+def get_forecast(start_date: datetime, end_date: datetime) -> Forecast:
+    if end_date <= start_date:
+        raise ValueError("Дата окончания должна быть больше даты начала")
+
+    if end_date - start_date > MAX_WINDOW:
+        raise ValueError(f"Окно прогноза не должно превышать {MAX_WINDOW.days} дней")
+
+    start_date = start_date.replace(second=0, microsecond=0)
+    number_of_minutes: int = math.ceil((end_date - start_date).total_seconds() / 60)
+
+    tasks: list[Task] = list(
+        Task.select().where(Task.is_enabled == True, Task.cron.is_null(False))
+    )
+    durations: dict[int, float] = get_durations([task.id for task in tasks])
+
+    # Изменения количества запусков по минутам (разностный массив)
+    deltas: list[int] = [0] * (number_of_minutes + 1)
+
+    items: list[TaskForecast] = []
+    for task in tasks:
+        item = TaskForecast(
+            task_id=task.id,
+            name=task.name,
+            cron=task.cron,
+            duration_secs=durations.get(task.id) or DEFAULT_DURATION_SECS,
+            # Окно без даты окончания
+            dates=[
+                date
+                for date in get_cron(task.cron, seed=task.name).get_dates(
+                    start_date=start_date,
+                    end_date=end_date,
+                )
+                if date < end_date
+            ],
+        )
+        items.append(item)
+
+        # Запуски задачи выполняются по очереди: запуск, пришедшийся на время
+        # выполнения предыдущего, начнется после его завершения
+        duration_minutes: int = max(math.ceil(item.duration_secs / 60), 1)
+        intervals: list[list[int]] = []
+        for date in item.dates:
+            minute: int = int((date - start_date).total_seconds() // 60)
+            if intervals and minute < intervals[-1][1]:
+                intervals[-1][1] += duration_minutes
+            else:
+                intervals.append([minute, minute + duration_minutes])
+
+        for start_minute, end_minute in intervals:
+            deltas[start_minute] += 1
+            deltas[min(end_minute, number_of_minutes)] -= 1
+
+    concurrency: list[int] = []
+    number: int = 0
+    for delta in deltas[:number_of_minutes]:
+        number += delta
+        concurrency.append(number)
+
+    return Forecast(
+        start_date=start_date,
+        end_date=end_date,
+        tasks=items,
+        concurrency=concurrency,
+    )
+
+
+def print_forecast(forecast: Forecast, limit: int = 10) -> None:
+    print(f"Прогноз с {forecast.start_date} по {forecast.end_date}")
+    print(f"Задач по расписанию: {len(forecast.tasks)}")
+    print(f"Пиковое количество одновременных запусков: {forecast.peak_concurrency}")
+
+    peak_dates: list[datetime] = forecast.get_peak_dates(limit)
+    if peak_dates:
+        print("Минуты пиковой нагрузки:")
+        for date in peak_dates:
+            print(f"    {date}")
+
+    collisions: list[dict[str, Any]] = forecast.get_collisions(limit)
+    if collisions:
+        print("Одновременные старты задач:")
+        for item in collisions:
+            print(f"    {item['date']}: {', '.join(item['tasks'])}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Прогноз одновременных запусков задач по расписанию"
+    )
+    parser.add_argument(
+        "--hours",
+        type=int,
+        default=24,
+        help="Окно прогноза от текущего времени в часах (по умолчанию: %(default)s)",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=10,
+        help="Количество выводимых минут и стартов (по умолчанию: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    start_date = datetime.now()
+    print_forecast(
+        get_forecast(start_date, start_date + timedelta(hours=args.hours)),
+        limit=args.limit,
+    )
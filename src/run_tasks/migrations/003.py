@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
+
+
+# NOTE: Пересоздание таблицы логов с AUTOINCREMENT, чтобы идентификаторы логов,
+#       упакованных в чанки (TaskRunLogChunk), не переиспользовались
+
+
+from playhouse.migrate import SqliteDatabase
+from run_tasks.db import DB_FILE_NAME, TaskRunLog
+
+db = SqliteDatabase(DB_FILE_NAME)
+
+table_name: str = TaskRunLog._meta.table_name
+old_table_name: str = f"{table_name}_old"
+columns: str = ", ".join(
+    f'"{field.column_name}"' for field in TaskRunLog._meta.sorted_fields
+)
+
+
+with db.bind_ctx([TaskRunLog]):
+    db.pragma("foreign_keys", 0)
+
+    with db.atomic():
+        db.execute_sql(f'ALTER TABLE "{table_name}" RENAME TO "{old_table_name}"')
+        TaskRunLog._schema.create_table(safe=False)
+        db.execute_sql(
+            f'INSERT INTO "{table_name}" ({columns}) '
+            f'SELECT {columns} FROM "{old_table_name}"'
+        )
+        db.execute_sql(f'DROP TABLE "{old_table_name}"')
+        TaskRunLog._schema.create_indexes(safe=True)
+
+    db.pragma("foreign_keys", 1)
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
+
+
+# NOTE: Составные и частичные индексы под запросы к запускам, логам и уведомлениям
+
+
+from playhouse.migrate import SqliteDatabase
+from run_tasks.db import DB_FILE_NAME, TaskRun, TaskRunLog, Notification
+
+db = SqliteDatabase(DB_FILE_NAME)
+
+models = [TaskRun, TaskRunLog, Notification]
+
+
+with db.bind_ctx(models):
+    with db.atomic():
+        for model in models:
+            model._schema.create_indexes(safe=True)
+
+    # Обновление статистики для планировщика запросов
+    db.execute_sql("ANALYZE")
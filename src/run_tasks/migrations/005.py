@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
+
+
+# NOTE: Полнотекстовый индекс логов (TaskRunLogSearch) с триггерами синхронизации
+#       и заполнением по уже сохраненным логам
+
+
+from playhouse.migrate import SqliteDatabase
+from run_tasks.db import DB_FILE_NAME, TaskRunLog, TaskRunLogSearch
+
+db = SqliteDatabase(DB_FILE_NAME)
+
+models = [TaskRunLog, TaskRunLogSearch]
+
+
+with db.bind_ctx(models):
+    with db.atomic():
+        TaskRunLogSearch.create_table(safe=True)
+        TaskRunLogSearch.rebuild()
+
+    TaskRunLogSearch.optimize()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
+
+
+# NOTE: Сводка по запускам задач (TaskSummary) с триггерами обновления
+#       и заполнением по уже сохраненным запускам
+
+
+from playhouse.migrate import SqliteDatabase
+from run_tasks.db import DB_FILE_NAME, Task, TaskRun, TaskSummary
+
+db = SqliteDatabase(DB_FILE_NAME)
+
+models = [Task, TaskRun, TaskSummary]
+
+
+with db.bind_ctx(models):
+    with db.atomic():
+        TaskSummary.create_table(safe=True)
+        TaskSummary.rebuild()
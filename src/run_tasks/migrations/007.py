@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
+
+
+from playhouse.migrate import SqliteDatabase, SqliteMigrator, migrate
+from run_tasks.db import (
+    DB_FILE_NAME,
+    Task,
+    TaskRun,
+    IntegerField,
+    EnumField,
+    LogsStorageEnum,
+)
+
+db = SqliteDatabase(DB_FILE_NAME)
+migrator = SqliteMigrator(db)
+
+
+with db.atomic():
+    migrate(
+        *[
+            migrator.add_column(
+                Task._meta.table_name,
+                name,
+                IntegerField(null=True),
+            )
+            for name in [
+                "logs_storage_days",
+                "archived_logs_storage_days",
+                "task_run_storage_days",
+            ]
+        ],
+        migrator.add_column(
+            TaskRun._meta.table_name,
+            "logs_storage",
+            EnumField(choices=LogsStorageEnum, default=LogsStorageEnum.DB),
+        ),
+    )
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
+
+
+# NOTE: Объединенные уведомления не считаются неотправленными, поэтому
+#       частичный индекс notification_unsent пересоздается с новым условием
+
+
+from playhouse.migrate import SqliteDatabase, SqliteMigrator, migrate
+from run_tasks.db import DB_FILE_NAME, Notification, ForeignKeyField
+
+db = SqliteDatabase(DB_FILE_NAME)
+migrator = SqliteMigrator(db)
+
+
+with db.bind_ctx([Notification]):
+    with db.atomic():
+        # NOTE: При импорте run_tasks.db индекс по полю мог быть создан до
+        #       появления самого столбца
+        db.execute_sql('DROP INDEX IF EXISTS "notification_merged_into"')
+
+        migrate(
+            migrator.add_column(
+                Notification._meta.table_name,
+                "merged_into_id",
+                ForeignKeyField(
+                    Notification,
+                    field=Notification.id,
+                    null=True,
+                    on_delete="SET NULL",
+                    index=False,
+                ),
+            ),
+            migrator.drop_index(
+                Notification._meta.table_name,
+                "notification_unsent",
+            ),
+        )
+        Notification._schema.create_indexes(safe=True)
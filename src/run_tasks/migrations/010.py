@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
+
+
+from playhouse.migrate import SqliteDatabase, SqliteMigrator, migrate
+from run_tasks.db import DB_FILE_NAME, Notification, TextField
+
+db = SqliteDatabase(DB_FILE_NAME)
+migrator = SqliteMigrator(db)
+
+
+with db.atomic():
+    migrate(
+        migrator.add_column(
+            Notification._meta.table_name,
+            "template_key",
+            TextField(null=True),
+        ),
+        migrator.drop_not_null(
+            Notification._meta.table_name,
+            "text",
+        ),
+    )
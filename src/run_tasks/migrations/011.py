@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
+
+
+# NOTE: Пересоздание триггеров TaskSummary: ближайший запланированный запуск
+#       выбирается по scheduled_date, а не по id
+
+
+from playhouse.migrate import SqliteDatabase
+from run_tasks.db import DB_FILE_NAME, Task, TaskRun, TaskSummary
+
+db = SqliteDatabase(DB_FILE_NAME)
+
+models = [Task, TaskRun, TaskSummary]
+
+run_table: str = TaskRun._meta.table_name
+
+
+with db.bind_ctx(models):
+    with db.atomic():
+        for suffix in ["insert", "update", "delete"]:
+            db.execute_sql(f'DROP TRIGGER IF EXISTS "{run_table}_summary_{suffix}"')
+
+        TaskSummary.create_triggers()
+        TaskSummary.rebuild()
@@ -14,7 +14,7 @@ PORT = 10016
 URL = f'http://{HOST}:{PORT}/add_notify'
 
 
-def add_notify(
+def get_notify_data(
         name: str,
         message: str,
         type: str = 'INFO',
@@ -24,8 +24,8 @@ def add_notify(
         group: str = None,
         group_max_number: int = None,
         need_html_escape_content: bool = True,
-):
-    data = {
+) -> dict:
+    return {
         'name': name,
         'message': message,
         'type': type,
@@ -37,12 +37,40 @@ def add_notify(
         'need_html_escape_content': need_html_escape_content,
     }
 
+
+def add_notify(
+        name: str,
+        message: str,
+        type: str = 'INFO',
+        url: str = None,
+        has_delete_button: bool = False,
+        show_type: bool = True,
+        group: str = None,
+        group_max_number: int = None,
+        need_html_escape_content: bool = True,
+        attempts_timeouts: list[int] = None,
+        timeout: float | tuple[float, float] = None,
+):
+    data = get_notify_data(
+        name=name,
+        message=message,
+        type=type,
+        url=url,
+        has_delete_button=has_delete_button,
+        show_type=show_type,
+        group=group,
+        group_max_number=group_max_number,
+        need_html_escape_content=need_html_escape_content,
+    )
+
     # Попытки
-    attempts_timeouts = [1, 5, 10, 30, 60]
+    if attempts_timeouts is None:
+        attempts_timeouts = [1, 5, 10, 30, 60]
+    attempts_timeouts = list(attempts_timeouts)
 
     while True:
         try:
-            rs = requests.post(URL, json=data)
+            rs = requests.post(URL, json=data, timeout=timeout)
             rs.raise_for_status()
             return
 
@@ -51,8 +79,7 @@ def add_notify(
             if not attempts_timeouts:
                 raise e
 
-            timeout = attempts_timeouts.pop(0)
-            time.sleep(timeout)
+            time.sleep(attempts_timeouts.pop(0))
 
 
 if __name__ == '__main__':
@@ -4,10 +4,37 @@
 __author__ = "ipetrash"
 
 
+import hashlib
 import re
 
+# Диапазоны значений частей расписания. Для дня месяца, как и в Jenkins,
+# берется 1-28, чтобы дата была в каждом месяце
+RANGES: list[tuple[int, int]] = [
+    (0, 59),  # Minute
+    (0, 23),  # Hour
+    (1, 28),  # Day (month)
+    (1, 12),  # Month
+    (0, 6),  # Day (week)
+]
+
+
+def get_hash(seed: str | None, index: int, size: int) -> int:
+    # Без seed используется начало диапазона
+    if not seed:
+        return 0
+
+    # NOTE: hash() для строк отличается между процессами, поэтому md5
+    digest: bytes = hashlib.md5(f"{seed}:{index}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % size
+
+
+def do_convert(cron: str, seed: str | None = None) -> str:
+    """
+    Функция преобразует расписание в формате Jenkins в обычный cron.
+    Значение H вычисляется по хэшу seed (например, названия задачи), чтобы
+    задачи с одинаковым расписанием срабатывали в разное время
+    """
 
-def do_convert(cron: str) -> str:
     match cron:
         case "@hourly":
             cron = "H * * * *"
@@ -24,30 +51,32 @@ def do_convert(cron: str) -> str:
         case "@yearly" | "@annually":
             cron = "0 0 1 1 *"
 
-    # NOTE: "H(0-29)/10 * * * *" -> "0-29/10 * * * *"
-    cron = re.sub(r"H\((.+?)\)", r"\1", cron)
-
     parts: list[str] = cron.split()
 
-    def _process(value: str, default_value: str = "0") -> str:
-        return value.replace("H/", "*/").replace("H", default_value)
-
-    # Minute
-    parts[0] = _process(parts[0])
+    def _process(index: int) -> str:
+        value: str = parts[index]
+        lo, hi = RANGES[index]
 
-    # Hour
-    parts[1] = _process(parts[1])
+        def _replace(m: re.Match) -> str:
+            # NOTE: "H(0-29)/10" -> "H(0-29)" с шагом 10
+            start, end = lo, hi
+            if m["start"] is not None:
+                start, end = int(m["start"]), int(m["end"])
 
-    # Day (month). Тут диапазон начинается с 1
-    parts[2] = _process(parts[2], default_value="1")
+            if m["step"] is not None:
+                step = int(m["step"])
+                offset = start + get_hash(seed, index, step)
+                return f"{offset}-{end}/{step}"
 
-    # Month. Тут диапазон начинается с 1
-    parts[3] = _process(parts[3], default_value="1")
+            return str(start + get_hash(seed, index, end - start + 1))
 
-    # Day (week)
-    parts[4] = _process(parts[4])
+        return re.sub(
+            r"H(?:\((?P<start>\d+)-(?P<end>\d+)\))?(?:/(?P<step>\d+))?",
+            _replace,
+            value,
+        )
 
-    cron = " ".join(parts)
+    cron = " ".join(_process(i) for i in range(len(parts)))
 
     return cron
 
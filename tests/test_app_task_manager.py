@@ -4,17 +4,44 @@
 __author__ = "ipetrash"
 
 
-from datetime import datetime
-from unittest import TestCase
+import asyncio
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import TestCase, mock
 
-from playhouse.sqlite_ext import SqliteExtDatabase
+from run_tasks.db import (
+    Task,
+    TaskRun,
+    TaskRunLog,
+    TaskRunLogChunk,
+    Notification,
+    NotificationKindEnum,
+    TaskRunStatusEnum,
+    LogKindEnum,
+    StopReasonEnum,
+    LogsStorageEnum,
+)
+from cron_converter import Cron
 
-from run_tasks.db import BaseModel, Task
+from run_tasks.common import get_cron
+from run_tasks.db_queue import BackpressureEnum
+from run_tasks.events import TaskEvents, TASK_EVENTS, STOP_TOKENS
+from run_tasks.app_task_manager.log_writer import TaskRunLogWriter
+from run_tasks.app_task_manager.retention import RetentionPurge
+from run_tasks.app_task_manager.utils import TaskThread, AsyncRunProcess
 from run_tasks.app_task_manager.units.scheduler_unit import SchedulerUnit
+from run_tasks.app_task_manager.units.pool_executor_unit import PoolExecutorUnit
+from run_tasks.app_task_manager.units.notification_unit import NotificationUnit
 from run_tasks.app_task_manager.external_task_storage.main import process
+from run_tasks.third_party.cron_converter__examples.from_jenkins import do_convert
+from tests.test_db import BaseTestCaseDb, BaseTestCaseQueueDb
 
 
-class TestSchedulerUnit(TestCase):
+class TestSchedulerUnit(BaseTestCaseDb):
     def test__get_scheduled_date(self) -> None:
         self.assertGreater(
             SchedulerUnit._get_scheduled_date("* * * * *"), datetime.now()
@@ -23,24 +50,886 @@ class TestSchedulerUnit(TestCase):
             SchedulerUnit._get_scheduled_date("0 * * * *"), datetime.now()
         )
 
+    def test_get_cron(self) -> None:
+        start_date = datetime(2026, 1, 1, 12, 30, 15)
 
-class TestRemoteUpdateCreateTasks(TestCase):
-    def setUp(self) -> None:
-        self.models = BaseModel.get_inherited_models()
-        self.test_db = SqliteExtDatabase(
-            ":memory:",
-            pragmas={
-                "foreign_keys": 1,
-            },
+        for cron in [
+            "* * * * *",
+            "0 * * * *",
+            "*/15 9-17 * * 1-5",
+            "H H * * H",
+            "5 4 * * 7",
+            "0 0 31 * *",
+            "@monthly",
+        ]:
+            with self.subTest(cron=cron):
+                self.assertIs(get_cron(cron), get_cron(cron))
+
+                schedule = Cron(do_convert(cron)).schedule(start_date.replace(second=0))
+                expected = [schedule.next() for _ in range(20)]
+                expected = [d for d in expected if d >= start_date][:10]
+
+                self.assertEqual(
+                    expected, get_cron(cron).get_dates(start_date, number=10)
+                )
+
+        with self.subTest(msg="Окно дат"):
+            self.assertEqual(
+                [
+                    datetime(2026, 1, 1, 13, 0),
+                    datetime(2026, 1, 1, 14, 0),
+                    datetime(2026, 1, 1, 15, 0),
+                ],
+                get_cron("0 * * * *").get_dates(
+                    start_date, end_date=datetime(2026, 1, 1, 15, 0)
+                ),
+            )
+
+    def test_do_convert(self) -> None:
+        with self.subTest(msg="Без seed"):
+            self.assertEqual("0 * * * *", do_convert("@hourly"))
+            self.assertEqual("0-59/15 * * * *", do_convert("H/15 * * * *"))
+            self.assertEqual("0-29/10 * * * *", do_convert("H(0-29)/10 * * * *"))
+            self.assertEqual("0 0 1 * *", do_convert("H H H * *"))
+
+        with self.subTest(msg="Значения H зависят от seed"):
+            self.assertEqual(
+                do_convert("H H * * *", seed="task_1"),
+                do_convert("H H * * *", seed="task_1"),
+            )
+
+            minutes: set[int] = set()
+            for i in range(20):
+                minute, hour, day, month, weekday = do_convert(
+                    "H H H H H", seed=f"task_{i}"
+                ).split()
+                minutes.add(int(minute))
+
+                self.assertTrue(0 <= int(minute) <= 59)
+                self.assertTrue(0 <= int(hour) <= 23)
+                self.assertTrue(1 <= int(day) <= 28)
+                self.assertTrue(1 <= int(month) <= 12)
+                self.assertTrue(0 <= int(weekday) <= 6)
+
+            # Задачи с одинаковым расписанием не срабатывают одновременно
+            self.assertGreater(len(minutes), 10)
+
+        with self.subTest(msg="Диапазон и шаг"):
+            for i in range(20):
+                minute, hour, *_ = do_convert(
+                    "H(0-29)/10 H(8-9) * * *", seed=f"task_{i}"
+                ).split()
+
+                start, step = minute.split("/")
+                self.assertEqual("10", step)
+                self.assertTrue(0 <= int(start.split("-")[0]) <= 9)
+                self.assertIn(hour, ["8", "9"])
+
+    def test_process(self) -> None:
+        task_cron = Task.add(name="task_cron", command="*", cron="0 0 * * *")
+        task_infinite = Task.add(name="task_infinite", command="*", is_infinite=True)
+        task_manual = Task.add(name="task_manual", command="*")
+
+        unit = SchedulerUnit(owner=mock.Mock())
+
+        with self.subTest(msg="Первая проверка"):
+            unit.process()
+
+            run_cron = task_cron.get_pending_run(has_scheduled_date=True)
+            self.assertIsNotNone(run_cron)
+            self.assertIsNotNone(task_infinite.get_pending_run())
+            self.assertEqual(0, task_manual.runs.count())
+
+            # Ближайшая проверка у бесконечной задачи, задача без расписания
+            # не проверяется
+            self.assertEqual({task_cron.id, task_infinite.id}, set(unit._next_dates))
+            self.assertEqual(run_cron.scheduled_date, unit._next_dates[task_cron.id])
+            self.assertLess(unit.get_next_date(), run_cron.scheduled_date)
+
+        with self.subTest(msg="Повторная проверка не добавляет запуски"):
+            with mock.patch.object(Task, "add_or_get_run") as add_or_get_run_mock:
+                unit._on_task_event(task_cron.id)
+                unit.process()
+                add_or_get_run_mock.assert_not_called()
+
+            self.assertEqual(1, task_cron.runs.count())
+
+        with self.subTest(msg="Изменение расписания"):
+            task_cron.cron = "30 0 * * *"
+            task_cron.save()
+            unit.refresh()
+
+            # Проверка задачи назначена сразу
+            self.assertEqual(
+                ("task_cron", "30 0 * * *", False), unit._tasks[task_cron.id]
+            )
+            self.assertLessEqual(unit.get_next_date(), datetime.now())
+
+        with self.subTest(msg="Отключение задачи"):
+            task_cron.set_enabled(False)
+            unit.refresh()
+
+            self.assertNotIn(task_cron.id, unit._next_dates)
+            self.assertNotIn(task_cron.id, unit._tasks)
+
+
+class TestTaskEvents(TestCase):
+    def test_wait(self) -> None:
+        events = TaskEvents()
+
+        with self.subTest(msg="Без оповещения"):
+            self.assertFalse(events.wait(1, timeout=0.01))
+
+        with self.subTest(msg="Оповещение до ожидания не теряется"):
+            events.notify(1)
+            self.assertTrue(events.wait(1, timeout=0.01))
+
+            # Оповещение срабатывает один раз
+            self.assertFalse(events.wait(1, timeout=0.01))
+
+        with self.subTest(msg="Оповещение другой задачи"):
+            events.notify(2)
+            self.assertFalse(events.wait(1, timeout=0.01))
+            self.assertTrue(events.wait(2, timeout=0.01))
+
+    def test_add_listener(self) -> None:
+        events = TaskEvents()
+        listener = mock.Mock()
+
+        events.add_listener(listener)
+        events.notify(1)
+        listener.assert_called_once_with(1)
+
+        events.remove_listener(listener)
+        events.notify(2)
+        listener.assert_called_once_with(1)
+
+
+class TestStopTokens(BaseTestCaseDb):
+    def test_set_stop(self) -> None:
+        task = Task.add(name="*", command="*")
+        run = task.add_or_get_run()
+        run.set_status(TaskRunStatusEnum.RUNNING)
+
+        token = STOP_TOKENS.register(run.id, task.id)
+        self.addCleanup(STOP_TOKENS.unregister, run.id)
+        self.assertFalse(token.is_set())
+
+        run.set_stop(StopReasonEnum.SERVER_API)
+        self.assertTrue(token.is_set())
+
+    def test_set_enabled(self) -> None:
+        task_1 = Task.add(name="task_1", command="*")
+        token_1 = STOP_TOKENS.register(task_1.add_or_get_run().id, task_1.id)
+        self.addCleanup(STOP_TOKENS.unregister, token_1.task_run_id)
+
+        task_2 = Task.add(name="task_2", command="*")
+        token_2 = STOP_TOKENS.register(task_2.add_or_get_run().id, task_2.id)
+        self.addCleanup(STOP_TOKENS.unregister, token_2.task_run_id)
+
+        task_1.set_enabled(False)
+        self.assertTrue(token_1.is_set())
+        self.assertFalse(token_2.is_set())
+
+
+class TestTaskThread(BaseTestCaseDb):
+    def test_notify(self) -> None:
+        task = Task.add(name="*", command="*")
+        TASK_EVENTS.wait(task.id, timeout=0)
+
+        with self.subTest(msg="Новый запуск"):
+            task.add_or_get_run()
+            self.assertTrue(TASK_EVENTS.wait(task.id, timeout=0))
+
+        with self.subTest(msg="Уже добавленный запуск"):
+            task.add_or_get_run()
+            self.assertFalse(TASK_EVENTS.wait(task.id, timeout=0))
+
+        with self.subTest(msg="Отключение задачи"):
+            task.set_enabled(False)
+            self.assertTrue(TASK_EVENTS.wait(task.id, timeout=0))
+
+    def test_find_run(self) -> None:
+        task = Task.add(name="*", command="*")
+        task_thread = TaskThread(name=task.name)
+
+        self.assertEqual((None, None), task_thread._find_run(task))
+
+        scheduled_date = datetime.now() + timedelta(hours=1)
+        run_scheduled = task.add_or_get_run(scheduled_date=scheduled_date)
+        self.assertEqual((None, scheduled_date), task_thread._find_run(task))
+
+        run = task.add_or_get_run()
+        self.assertEqual((run, None), task_thread._find_run(task))
+
+        run.delete_instance()
+        run_scheduled.scheduled_date = datetime.now()
+        run_scheduled.save()
+        self.assertEqual((run_scheduled, None), task_thread._find_run(task))
+
+
+class TestAsyncRunProcess(TestCase):
+    def _create(self, code: str) -> tuple[AsyncRunProcess, list[str], list[str]]:
+        stdout: list[str] = []
+        stderr: list[str] = []
+
+        process = AsyncRunProcess(
+            command=[sys.executable, "-c", code],
+            on_stdout_callback=stdout.append,
+            on_stderr_callback=stderr.append,
+            on_start_callback=lambda _: None,
+            encoding="utf-8",
+        )
+        return process, stdout, stderr
+
+    def test_run(self) -> None:
+        process, stdout, stderr = self._create(
+            "import sys\n"
+            "print('1')\n"
+            "print('Привет')\n"
+            "print('err', file=sys.stderr)\n"
+            "sys.exit(3)"
+        )
+        process.start()
+        process.join(timeout=30)
+
+        self.assertEqual(3, process.process_return_code)
+        self.assertEqual(["1\n", "Привет\n"], stdout)
+        self.assertEqual(["err\n"], stderr)
+
+    def test_stop(self) -> None:
+        process, stdout, _ = self._create(
+            "import time\nprint('start', flush=True)\ntime.sleep(60)"
+        )
+        process.start()
+
+        end_date = datetime.now() + timedelta(seconds=30)
+        while not stdout and datetime.now() < end_date:
+            time.sleep(0.01)
+
+        process.stop()
+        process.join(timeout=30)
+
+        self.assertEqual(["start\n"], stdout)
+        self.assertNotEqual(0, process.process_return_code)
+
+    def test_slow_callback(self) -> None:
+        # Обработка вывода одного процесса ждет, например, очередь базы
+        release_event = threading.Event()
+
+        process_slow = AsyncRunProcess(
+            command=[sys.executable, "-c", "print('slow')"],
+            on_stdout_callback=lambda _: release_event.wait(30),
+            on_stderr_callback=lambda _: None,
+            on_start_callback=lambda _: None,
+            encoding="utf-8",
+        )
+        process_slow.start()
+
+        try:
+            process, stdout, _ = self._create("print('1')\nprint('2')")
+            process.start()
+            process.join(timeout=10)
+
+            self.assertEqual(["1\n", "2\n"], stdout)
+            self.assertEqual(0, process.process_return_code)
+        finally:
+            release_event.set()
+
+        process_slow.join(timeout=30)
+        self.assertEqual(0, process_slow.process_return_code)
+
+    def test_many_lines(self) -> None:
+        number: int = 10_000
+        process, stdout, _ = self._create(
+            f"import sys\nsys.stdout.write(''.join(f'{{i}}\\n' for i in range({number})))"
+            "\nsys.stdout.write('tail')"
+        )
+
+        to_thread = asyncio.to_thread
+        callback_calls: list[int] = []
+
+        async def _to_thread(func, *args, **kwargs):
+            if func == AsyncRunProcess._call_for_each:
+                callback_calls.append(len(args[1]))
+            return await to_thread(func, *args, **kwargs)
+
+        with mock.patch.object(asyncio, "to_thread", _to_thread):
+            process.start()
+            process.join(timeout=30)
+
+        self.assertEqual([f"{i}\n" for i in range(number)] + ["tail"], stdout)
+
+        # Строки передаются в обработчик пачками, а не по одной
+        self.assertEqual(number + 1, sum(callback_calls))
+        self.assertLess(len(callback_calls), number // 10)
+
+
+class TestPoolExecutorUnit(BaseTestCaseDb):
+    def test_dispatch(self) -> None:
+        now = datetime.now()
+
+        task_1 = Task.add(name="task_1", command="*")
+        run_1 = task_1.add_or_get_run()
+        run_1_scheduled = task_1.add_or_get_run(
+            scheduled_date=now - timedelta(minutes=30)
         )
-        self.test_db.bind(self.models, bind_refs=False, bind_backrefs=False)
-        self.test_db.connect()
-        self.test_db.create_tables(self.models)
 
-    def tearDown(self) -> None:
-        self.test_db.drop_tables(self.models)
-        self.test_db.close()
+        task_2 = Task.add(name="task_2", command="*")
+        run_2_scheduled = task_2.add_or_get_run(scheduled_date=now - timedelta(hours=1))
+
+        # Запуск еще не готов
+        task_3 = Task.add(name="task_3", command="*")
+        task_3.add_or_get_run(scheduled_date=now + timedelta(hours=1))
+
+        # Задача отключена
+        task_4 = Task.add(name="task_4", command="*")
+        task_4.add_or_get_run()
+        task_4.set_enabled(False)
+
+        def _create_unit(max_workers: int, max_runs_per_task: int) -> PoolExecutorUnit:
+            unit = PoolExecutorUnit(
+                owner=mock.Mock(encoding="utf-8"),
+                max_workers=max_workers,
+                max_runs_per_task=max_runs_per_task,
+            )
+            unit._pool = mock.Mock()
+            return unit
+
+        with self.subTest(msg="Порядок очереди"):
+            unit = _create_unit(max_workers=10, max_runs_per_task=10)
+            self.assertEqual(
+                [run_2_scheduled, run_1_scheduled, run_1],
+                unit.get_ready_runs(),
+            )
+
+        with self.subTest(msg="Ограничение задачи"):
+            unit = _create_unit(max_workers=10, max_runs_per_task=1)
+            self.assertEqual([run_2_scheduled, run_1_scheduled], unit.dispatch())
+            self.assertEqual(2, unit._pool.submit.call_count)
+
+            # Уже отправленные запуски повторно не отправляются
+            self.assertEqual([], unit.dispatch())
+
+        with self.subTest(msg="Общее ограничение"):
+            unit = _create_unit(max_workers=2, max_runs_per_task=10)
+            self.assertEqual([run_2_scheduled, run_1_scheduled], unit.dispatch())
+            self.assertEqual([], unit.dispatch())
+
+            # После завершения запуска место освобождается
+            runner = unit.runners[run_2_scheduled.id]
+            with mock.patch.object(
+                runner,
+                "start_task_run",
+                side_effect=lambda _, run: run.set_status(TaskRunStatusEnum.RUNNING),
+            ):
+                unit._run(runner, task_2, run_2_scheduled)
+            self.assertEqual([run_1], unit.dispatch())
+
+
+class TestNotificationUnit(BaseTestCaseDb):
+    def test_dispatch(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+
+        notifications: dict[NotificationKindEnum, list[Notification]] = {
+            kind: [
+                Notification.add(task_run=run, name="*", text=f"{i}", kind=kind)
+                for i in range(3)
+            ]
+            for kind in NotificationKindEnum
+        }
+
+        unit = NotificationUnit(
+            owner=mock.Mock(),
+            workers_per_kind=1,
+            retry_base_delay_secs=10,
+            retry_max_delay_secs=60,
+        )
+        # Отправка в текущем потоке
+        for kind in unit._pools:
+            unit._pools[kind] = mock.Mock(
+                submit=lambda func, *args: func(*args),
+            )
+        unit.smtp_pool = mock.MagicMock()
+
+        def _send(notify: Notification, text: str, **kwargs) -> None:
+            if notify.kind == NotificationKindEnum.TELEGRAM:
+                raise Exception("Telegram недоступен")
+
+        with mock.patch.object(unit, "send", side_effect=_send):
+            with self.subTest(msg="Недоступный канал не задерживает другие"):
+                self.assertEqual(6, len(unit.dispatch()))
+
+                for notify in notifications[NotificationKindEnum.EMAIL]:
+                    notify = Notification.get_by_id(notify.id)
+                    self.assertIsNotNone(notify.sending_date)
+                    self.assertEqual(0, notify.attempts)
+
+                # Письма отправлены в одной сессии
+                self.assertEqual(1, unit.smtp_pool.session.call_count)
+
+                for notify in notifications[NotificationKindEnum.TELEGRAM]:
+                    notify = Notification.get_by_id(notify.id)
+                    self.assertTrue(notify.is_unsent)
+                    self.assertEqual(1, notify.attempts)
+                    self.assertIn("Telegram недоступен", notify.last_error)
+                    self.assertGreater(notify.next_attempt_date, datetime.now())
+
+                # Повторная попытка еще не наступила
+                self.assertEqual([], unit.dispatch())
+
+            with self.subTest(msg="Повторная попытка"):
+                Notification.update(
+                    next_attempt_date=datetime.now() - timedelta(seconds=1)
+                ).execute()
+                self.assertEqual(
+                    notifications[NotificationKindEnum.TELEGRAM], unit.dispatch()
+                )
+                for notify in notifications[NotificationKindEnum.TELEGRAM]:
+                    self.assertEqual(2, Notification.get_by_id(notify.id).attempts)
+
+            with self.subTest(msg="Почтовый сервер недоступен"):
+                items = [
+                    Notification.add(
+                        task_run=run,
+                        name="*",
+                        text="*",
+                        kind=NotificationKindEnum.EMAIL,
+                    )
+                    for _ in range(2)
+                ]
+                unit.smtp_pool.session.side_effect = ConnectionRefusedError()
+                self.assertEqual(items, unit.dispatch())
+                for notify in items:
+                    self.assertEqual(1, Notification.get_by_id(notify.id).attempts)
+
+            self.assertEqual(
+                {kind: set() for kind in NotificationKindEnum}, unit._in_progress
+            )
+
+    def test_send_telegrams(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        items: list[Notification] = [
+            Notification.add(
+                task_run=run, name="*", text=f"{i}", kind=NotificationKindEnum.TELEGRAM
+            )
+            for i in range(5)
+        ]
+
+        unit = NotificationUnit(
+            owner=mock.Mock(),
+            workers_per_kind=2,
+            telegram_batch_size=20,
+        )
+        unit._pools[NotificationKindEnum.TELEGRAM] = mock.Mock(
+            submit=lambda func, *args: func(*args),
+        )
+        unit.telegram_client = mock.Mock(batch_url="http://127.0.0.1/add_notifies")
+
+        with self.subTest(msg="Пачки распределяются по отправителям"):
+            unit.telegram_client.send_many.side_effect = Exception("Недоступен")
+            self.assertEqual(items, unit.dispatch())
+            self.assertEqual(
+                [3, 2],
+                [
+                    len(call.args[0])
+                    for call in unit.telegram_client.send_many.call_args_list
+                ],
+            )
+            for notify in items:
+                notify = Notification.get_by_id(notify.id)
+                self.assertTrue(notify.is_unsent)
+                self.assertEqual(1, notify.attempts)
+
+        with self.subTest(msg="Одним запросом"):
+            Notification.update(
+                next_attempt_date=datetime.now() - timedelta(seconds=1)
+            ).execute()
+            unit.telegram_client.send_many.reset_mock(side_effect=True)
+
+            self.assertEqual(items, unit.dispatch())
+            self.assertEqual(2, unit.telegram_client.send_many.call_count)
+            self.assertEqual(
+                ["0", "1", "2"],
+                [
+                    data["message"]
+                    for data in unit.telegram_client.send_many.call_args_list[0].args[0]
+                ],
+            )
+            self.assertEqual([], Notification.get_unsent())
+
+        self.assertEqual(
+            {kind: set() for kind in NotificationKindEnum}, unit._in_progress
+        )
+
+    def test_coalesce(self) -> None:
+        task = Task.add(name="*", command="*")
+
+        def _add_notification() -> Notification:
+            run = task.add_or_get_run()
+            run.set_status(TaskRunStatusEnum.RUNNING)
+            run.set_status(TaskRunStatusEnum.FINISHED)
+            return Notification.add(
+                task_run=run, name="*", text="*", kind=NotificationKindEnum.EMAIL
+            )
+
+        unit = NotificationUnit(owner=mock.Mock(), coalesce_window_secs=60)
+        unit._pools[NotificationKindEnum.EMAIL] = mock.Mock(
+            submit=lambda func, *args: func(*args),
+        )
+        unit.smtp_pool = mock.MagicMock()
+
+        with mock.patch.object(unit, "send"):
+            with self.subTest(msg="Первое уведомление отправляется сразу"):
+                notify = _add_notification()
+                self.assertEqual([], unit.coalesce())
+                self.assertEqual([notify], unit.dispatch())
+
+            with self.subTest(msg="Уведомления в окне откладываются"):
+                items = [_add_notification() for _ in range(3)]
+
+                now = datetime.now()
+                self.assertEqual([], unit.coalesce(now))
+                self.assertEqual([], unit.dispatch(now))
+
+            with self.subTest(msg="После окна отправляется сводное"):
+                now += timedelta(seconds=61)
+                digests = unit.coalesce(now)
+                self.assertEqual(1, len(digests))
+
+                digest = digests[0]
+                self.assertEqual(items[-1].task_run, digest.task_run)
+                self.assertIn("запусков: 3", digest.name)
+
+                for item in items:
+                    item = Notification.get_by_id(item.id)
+                    self.assertEqual(digest, item.merged_into)
+                    self.assertFalse(item.is_unsent)
+
+                self.assertEqual([digest], unit.dispatch(now))
+                self.assertEqual([], Notification.get_unsent())
+
+            with self.subTest(msg="Текст формируется при отправке"):
+                items = [_add_notification() for _ in range(2)]
+
+                now += timedelta(seconds=61)
+                with mock.patch(
+                    "run_tasks.app_task_manager.units.notification_unit.NOTIFICATION_LAZY_TEXT",
+                    True,
+                ):
+                    digest = unit.coalesce(now)[0]
+
+                self.assertIsNone(digest.text)
+                self.assertEqual("digest_template", digest.template_key)
+
+                text: str = digest.get_text()
+                for item in items:
+                    self.assertIn(item.task_run.get_url(), text)
+
+                self.assertEqual([digest], unit.dispatch(now))
+                self.assertEqual((digest, text), unit.send.call_args.args)
+                self.assertEqual(text, Notification.get_by_id(digest.id).text)
+
+    def test_get_retry_delay_secs(self) -> None:
+        unit = NotificationUnit(
+            owner=mock.Mock(),
+            retry_base_delay_secs=5,
+            retry_max_delay_secs=60,
+        )
+        self.assertEqual(
+            [5, 10, 20, 40, 60, 60],
+            [unit.get_retry_delay_secs(attempts) for attempts in range(1, 7)],
+        )
+
+
+class TestTaskRunLogWriter(BaseTestCaseDb):
+    def test_flush_by_max_lines(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        writer = TaskRunLogWriter(run, max_lines=3, max_bytes=999_999)
+
+        writer.write_out("1")
+        writer.write_err("2")
+        self.assertEqual(0, run.logs.count())
+        self.assertEqual(2, writer.queue_depth)
+
+        writer.write_out("3")
+        self.assertEqual(3, run.logs.count())
+        self.assertEqual(0, writer.queue_depth)
+
+    def test_flush_by_max_bytes(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        writer = TaskRunLogWriter(run, max_lines=999_999, max_bytes=10)
+
+        writer.write_out("1234")
+        self.assertEqual(0, run.logs.count())
+
+        writer.write_out("12345678")
+        self.assertEqual(2, run.logs.count())
+
+    def test_close(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        writer = TaskRunLogWriter(run, max_lines=999_999, max_bytes=999_999)
+
+        for i in range(5):
+            writer.write_out(f"{i}")
+        self.assertEqual(0, run.logs.count())
+
+        writer.close()
+        self.assertEqual(5, run.logs.count())
+
+    def test_order(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        writer = TaskRunLogWriter(run, max_lines=7, max_bytes=999_999)
+
+        expected = []
+        for i in range(50):
+            kind = LogKindEnum.OUT if i % 3 else LogKindEnum.ERR
+            writer.write(f"line {i}", kind=kind)
+            expected.append((f"line {i}\n", kind))
+        writer.flush()
+
+        self.assertEqual(
+            expected,
+            [(log.text, log.kind) for log in run.logs.order_by(TaskRunLog.id)],
+        )
+
+    def test_get_stats(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        writer = TaskRunLogWriter(run, max_lines=2, max_bytes=999_999)
+
+        for i in range(5):
+            writer.write_out(f"{i}")
+
+        stats = writer.get_stats()
+        self.assertEqual(1, stats["queue_depth"])
+        self.assertEqual(4, stats["number_of_lines"])
+        self.assertEqual(2, stats["number_of_flushes"])
+        self.assertGreaterEqual(
+            stats["max_flush_latency_secs"], stats["avg_flush_latency_secs"]
+        )
+
+
+class TestTaskRunLogWriterDropTaskOutput(BaseTestCaseQueueDb):
+    DB_OPTIONS = dict(
+        queue_max_size=1,
+        backpressure=BackpressureEnum.DROP_TASK_OUTPUT,
+    )
+
+    def test_flush(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        writer = TaskRunLogWriter(run, max_lines=999_999, max_bytes=999_999)
+
+        writer.write_err("err")
+        writer.flush()
+
+        # Очередь записи заполнена, пока поток записи остановлен
+        self.db.stop()
+        self.db.execute_sql(*TaskRun.update(command="*").sql())
+
+        for i in range(3):
+            writer.write_out(f"{i}")
+
+        thread = threading.Thread(target=writer.flush)
+        thread.start()
+
+        end_date = datetime.now() + timedelta(seconds=30)
+        while (
+            not self.db.get_stats()["number_of_dropped"] and datetime.now() < end_date
+        ):
+            time.sleep(0.01)
+
+        self.db.start()
+        thread.join(timeout=30)
+        self.assertFalse(thread.is_alive())
+
+        self.assertEqual(
+            [
+                "err\n",
+                "[Пропущено строк вывода: 3, очередь записи в базу переполнена]\n",
+            ],
+            [log.text for log in run.logs.order_by(TaskRunLog.id)],
+        )
+
+        stats = writer.get_stats()
+        self.assertEqual(1, stats["number_of_lines"])
+        self.assertEqual(3, stats["number_of_dropped_lines"])
+
+
+class TestRetentionPurge(BaseTestCaseDb):
+    def test_purge(self) -> None:
+        date = datetime.now()
+        old_date = date - timedelta(days=10)
+
+        task = Task.add(name="*", command="*")
+
+        old_runs: list[TaskRun] = []
+        for i in range(5):
+            run = task.add_or_get_run()
+            run.set_status(TaskRunStatusEnum.RUNNING)
+            run.add_logs(
+                [(f"line {j}", LogKindEnum.OUT, datetime.now()) for j in range(7)]
+            )
+            Notification.add(
+                task_run=run,
+                name="*",
+                text="*",
+                kind=NotificationKindEnum.EMAIL,
+            )
+            run.set_status(TaskRunStatusEnum.FINISHED)
+
+            run.finish_date = old_date
+            run.save()
+            old_runs.append(run)
+
+        old_runs[0].pack_logs(chunk_size=3)
+
+        # Не устаревшие и активные запуски не удаляются
+        run_new = task.add_or_get_run()
+        run_new.set_status(TaskRunStatusEnum.RUNNING)
+        run_new.add_log_out("*")
+        run_new.set_status(TaskRunStatusEnum.FINISHED)
+
+        run_pending = task.add_or_get_run()
+        run_pending.create_date = old_date
+        run_pending.save()
+
+        with self.subTest(msg="Ограничение по времени"):
+            purge = RetentionPurge(
+                task_run_in_days=5,
+                logs_in_days=None,
+                archived_logs_in_days=None,
+                run_batch_size=2,
+                log_batch_size=3,
+                time_budget_secs=0,
+                wal_checkpoint=False,
+            )
+            self.assertFalse(purge.purge(date))
+
+            # Удалена одна пачка логов, запуски остались
+            self.assertEqual(3, purge.number_of_logs)
+            self.assertEqual(0, purge.number_of_runs)
+            self.assertEqual(5, purge.number_of_remaining_runs)
+
+        with self.subTest(msg="Удаление всех"):
+            purge = RetentionPurge(
+                task_run_in_days=5,
+                logs_in_days=None,
+                archived_logs_in_days=None,
+                run_batch_size=2,
+                log_batch_size=3,
+                time_budget_secs=60,
+                wal_checkpoint=False,
+            )
+            self.assertTrue(purge.purge(date))
+
+            stats = purge.get_stats()
+            self.assertEqual(5, stats["number_of_runs"])
+            self.assertEqual(5 * 7 - 7 - 3, stats["number_of_logs"])
+            self.assertEqual(3, stats["number_of_log_chunks"])
+            self.assertEqual(5, stats["number_of_notifications"])
+            self.assertEqual(3, stats["number_of_batches"])
+            self.assertEqual(0, stats["number_of_remaining_runs"])
+
+            self.assertEqual(
+                [run_new.id, run_pending.id],
+                [run.id for run in TaskRun.select().order_by(TaskRun.id)],
+            )
+            self.assertEqual(1, TaskRunLog.select().count())
+            self.assertEqual(0, TaskRunLogChunk.select().count())
+            self.assertEqual(0, Notification.select().count())
+
+    def test_purge_tiers(self) -> None:
+        now = datetime.now()
+
+        def _add_run(task: Task, days: int) -> TaskRun:
+            run = task.add_or_get_run()
+            run.set_status(TaskRunStatusEnum.RUNNING)
+            run.add_logs([(f"line {j}", LogKindEnum.OUT, now) for j in range(3)])
+            run.set_status(TaskRunStatusEnum.FINISHED)
+
+            run.finish_date = now - timedelta(days=days)
+            run.save()
+            return run
+
+        task = Task.add(name="task", command="*")
+        # Свои сроки у задачи
+        task_override = Task.add(
+            name="task_override",
+            command="*",
+            logs_storage_days=1,
+            archived_logs_storage_days=3,
+            task_run_storage_days=10,
+        )
+
+        runs: dict[tuple[str, int], TaskRun] = {
+            (t.name, days): _add_run(t, days)
+            for t in [task, task_override]
+            for days in [0, 2, 5, 15, 25]
+        }
+
+        with (
+            tempfile.TemporaryDirectory() as dir_name,
+            mock.patch("run_tasks.db.DB_LOGS_ARCHIVE_DIR_NAME", Path(dir_name)),
+        ):
+            purge = RetentionPurge(
+                task_run_in_days=20,
+                logs_in_days=4,
+                archived_logs_in_days=10,
+                time_budget_secs=60,
+                wal_checkpoint=False,
+            )
+            self.assertTrue(purge.purge(now))
+
+            expected: dict[tuple[str, int], LogsStorageEnum | None] = {
+                ("task", 0): LogsStorageEnum.DB,
+                ("task", 2): LogsStorageEnum.DB,
+                ("task", 5): LogsStorageEnum.ARCHIVE,
+                ("task", 15): LogsStorageEnum.DELETED,
+                ("task", 25): None,
+                ("task_override", 0): LogsStorageEnum.DB,
+                ("task_override", 2): LogsStorageEnum.ARCHIVE,
+                ("task_override", 5): LogsStorageEnum.DELETED,
+                ("task_override", 15): None,
+                ("task_override", 25): None,
+            }
+            for key, logs_storage in expected.items():
+                with self.subTest(key=key):
+                    run: TaskRun | None = TaskRun.get_or_none(id=runs[key].id)
+                    if logs_storage is None:
+                        self.assertIsNone(run)
+                        self.assertFalse(runs[key].get_logs_archive_path().exists())
+                        continue
+
+                    self.assertEqual(logs_storage, run.logs_storage)
+                    self.assertEqual(
+                        logs_storage == LogsStorageEnum.ARCHIVE,
+                        run.get_logs_archive_path().exists(),
+                    )
+                    self.assertEqual(
+                        3 if logs_storage != LogsStorageEnum.DELETED else 0,
+                        run.get_number_of_logs(),
+                    )
+
+            # Логи в базе остались только у непросроченных запусков
+            self.assertEqual(3 * 3, TaskRunLog.select().count())
+
+            stats = purge.get_stats()
+            self.assertEqual(3, stats["number_of_runs"])
+            self.assertEqual(7, stats["number_of_archived_runs"])
+            self.assertEqual(5, stats["number_of_deleted_archives"])
+
+            # Повторно ничего не делается
+            self.assertTrue(purge.purge(now))
+            for name in [
+                "number_of_runs",
+                "number_of_archived_runs",
+                "number_of_deleted_archives",
+                "number_of_logs",
+            ]:
+                self.assertEqual(stats[name], purge.get_stats()[name])
+
 
+class TestRemoteUpdateCreateTasks(BaseTestCaseDb):
     def test_process(self) -> None:
         self.assertEqual(0, Task.count())
 
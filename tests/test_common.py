@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import json
+import smtplib
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+import requests
+
+from run_tasks.common import SmtpPool, TelegramClient, create_email
+
+
+class FakeSmtpServer:
+    """
+    Простой SMTP-сервер для тестов: принимает любой вход и письма
+    """
+
+    def __init__(self) -> None:
+        self._server = socket.create_server(("127.0.0.1", 0))
+        self.port: int = self._server.getsockname()[1]
+
+        self.number_of_connections: int = 0
+        self.messages: list[bytes] = []
+
+        self._connections: list[socket.socket] = []
+        self._lock = threading.Lock()
+
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+
+            with self._lock:
+                self.number_of_connections += 1
+                self._connections.append(conn)
+
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn: socket.socket) -> None:
+        with conn, conn.makefile("rb") as f:
+            try:
+                conn.sendall(b"220 localhost ESMTP\r\n")
+                for line in f:
+                    command: bytes = line.strip().upper()
+                    if command.startswith((b"EHLO", b"HELO")):
+                        conn.sendall(b"250-localhost\r\n250 AUTH PLAIN LOGIN\r\n")
+                    elif command.startswith(b"AUTH"):
+                        conn.sendall(b"235 OK\r\n")
+                    elif command == b"DATA":
+                        conn.sendall(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                        data: list[bytes] = []
+                        for data_line in f:
+                            if data_line == b".\r\n":
+                                break
+                            data.append(data_line)
+
+                        with self._lock:
+                            self.messages.append(b"".join(data))
+                        conn.sendall(b"250 OK\r\n")
+                    elif command == b"QUIT":
+                        conn.sendall(b"221 Bye\r\n")
+                        return
+                    else:
+                        conn.sendall(b"250 OK\r\n")
+            except OSError:
+                pass
+
+    def drop_connections(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self._server.close()
+        self.drop_connections()
+
+
+class FakeNotifyServer(ThreadingHTTPServer):
+    """
+    Сервер уведомлений в телеграм для тестов: принимает уведомление
+    или список уведомлений
+    """
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        self.number_of_connections: int = 0
+        self.number_of_requests: int = 0
+        self.messages: list[dict] = []
+        self.status: int = 200
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                super().setup()
+                with server._lock:
+                    server.number_of_connections += 1
+
+            def do_POST(self) -> None:
+                data = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.number_of_requests += 1
+                    if server.status == 200:
+                        server.messages += data if isinstance(data, list) else [data]
+
+                self.send_response(server.status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args) -> None:
+                pass
+
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.url: str = f"http://127.0.0.1:{self.server_address[1]}"
+
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class TestTelegramClient(TestCase):
+    def setUp(self) -> None:
+        self.server = FakeNotifyServer()
+        self.client = TelegramClient(
+            url=f"{self.server.url}/add_notify",
+            batch_url=None,
+            pool_size=4,
+            connect_timeout_secs=5,
+            read_timeout_secs=5,
+        )
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.server.close()
+
+    def test_send(self) -> None:
+        for i in range(10):
+            self.client.send(dict(name="*", message=f"{i}"))
+
+        self.assertEqual(10, len(self.server.messages))
+        self.assertEqual(1, self.server.number_of_connections)
+
+        with self.subTest(msg="Соединения переиспользуются отправителями"):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(
+                    pool.map(
+                        lambda i: self.client.send(dict(name="*", message=f"{i}")),
+                        range(400),
+                    )
+                )
+
+            self.assertEqual(410, len(self.server.messages))
+            self.assertLessEqual(self.server.number_of_connections, 4)
+
+        with self.subTest(msg="Ошибка сервера возвращается без повторов"):
+            self.server.status = 500
+            with self.assertRaises(requests.HTTPError):
+                self.client.send(dict(name="*", message="*"))
+            self.assertEqual(411, self.server.number_of_requests)
+
+        self.assertEqual(
+            dict(number_of_requests=410, number_of_messages=410),
+            self.client.get_stats(),
+        )
+
+    def test_send_many(self) -> None:
+        items: list[dict] = [dict(name="*", message=f"{i}") for i in range(5)]
+
+        with self.subTest(msg="Без пакетной отправки"):
+            self.client.send_many(items)
+            self.assertEqual(5, self.server.number_of_requests)
+
+        with self.subTest(msg="Одним запросом"):
+            self.client.batch_url = f"{self.server.url}/add_notifies"
+            self.client.send_many(items)
+            self.assertEqual(6, self.server.number_of_requests)
+            self.assertEqual(items * 2, self.server.messages)
+
+        self.client.send_many([])
+        self.assertEqual(6, self.server.number_of_requests)
+
+
+class TestSmtpPool(TestCase):
+    def setUp(self) -> None:
+        self.server = FakeSmtpServer()
+        self.pool = SmtpPool(
+            host="127.0.0.1",
+            port=self.server.port,
+            login="login",
+            password="password",
+            max_size=2,
+            idle_timeout_secs=60,
+            timeout_secs=5,
+            smtp_class=smtplib.SMTP,
+        )
+
+    def tearDown(self) -> None:
+        self.pool.close()
+        self.server.close()
+
+    def test_session(self) -> None:
+        with self.pool.session() as session:
+            for i in range(5):
+                session.send_message(create_email(f"Письмо {i}", "*", "a@b.c"))
+
+        self.assertEqual(5, len(self.server.messages))
+        self.assertEqual(1, self.server.number_of_connections)
+
+        with self.subTest(msg="Соединение переиспользуется"):
+            self.pool.send_message(create_email("*", "*", "a@b.c"))
+            self.assertEqual(6, len(self.server.messages))
+            self.assertEqual(1, self.server.number_of_connections)
+
+        with self.subTest(msg="Переподключение после закрытия сервером"):
+            self.server.drop_connections()
+            self.pool.send_message(create_email("*", "*", "a@b.c"))
+            self.assertEqual(7, len(self.server.messages))
+            self.assertEqual(2, self.server.number_of_connections)
+            self.assertEqual(1, self.pool.number_of_reconnects)
+
+        self.assertEqual(
+            dict(
+                number_of_idle=1,
+                number_of_connections=2,
+                number_of_reconnects=1,
+                number_of_messages=7,
+            ),
+            self.pool.get_stats(),
+        )
+
+    def test_idle_timeout(self) -> None:
+        self.pool.idle_timeout_secs = 0
+
+        for _ in range(3):
+            self.pool.send_message(create_email("*", "*", "a@b.c"))
+
+        self.assertEqual(3, len(self.server.messages))
+        self.assertEqual(3, self.server.number_of_connections)
+        self.assertEqual(1, self.pool.get_stats()["number_of_idle"])
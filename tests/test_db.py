@@ -4,25 +4,38 @@
 __author__ = "ipetrash"
 
 
+import sqlite3
+import tempfile
+import threading
 import time
 from datetime import datetime, timedelta
-from unittest import TestCase
+from pathlib import Path
+from typing import Any
+from unittest import TestCase, mock
 
 from playhouse.sqlite_ext import SqliteExtDatabase
 
+from peewee import IntegrityError, fn
+
 from run_tasks.db import (
     NotDefinedParameterException,
     BaseModel,
     Task,
     TaskRun,
     TaskRunLog,
+    TaskRunLogChunk,
+    TaskRunLogSearch,
+    TaskSummary,
     Notification,
     TaskRunStatusEnum,
     TaskRunWorkStatusEnum,
     StopReasonEnum,
     LogKindEnum,
     NotificationKindEnum,
+    LogsStorageEnum,
+    get_template,
 )
+from run_tasks.db_queue import BackpressureEnum, GroupCommitQueueDatabase
 from tests import DATETIME_DELAY_SECS
 
 
@@ -150,7 +163,9 @@ class TestTask(BaseTestCaseDb):
             self.assertEqual(task.description, description)
             self.assertFalse(task.is_infinite)
 
-        with self.subTest(msg="Создание команды с существующим названием вернет уже созданную задачу"):
+        with self.subTest(
+            msg="Создание команды с существующим названием вернет уже созданную задачу"
+        ):
             self.assertEqual(
                 task,
                 Task.add(
@@ -394,6 +409,63 @@ class TestTask(BaseTestCaseDb):
         # PENDING не считаются
         self.assertEqual(5, task.number_of_runs)
 
+    def test_select_with_stats(self) -> None:
+        task_1 = Task.add(name="1", command="*", cron="@hourly")
+        task_2 = Task.add(name="2", command="*")
+
+        run = task_1.add_or_get_run()
+        run.set_status(TaskRunStatusEnum.RUNNING)
+        run.set_status(TaskRunStatusEnum.FINISHED)
+        task_1.add_or_get_run(scheduled_date=datetime.now())
+        task_1.add_or_get_run()
+
+        with mock.patch.object(
+            self.test_db, "execute_sql", wraps=self.test_db.execute_sql
+        ) as mocked_execute_sql:
+            items = list(Task.select_with_stats().order_by(Task.id))
+            self.assertEqual(
+                [task_1.to_dict(), task_2.to_dict()],
+                [task.to_dict() for task in items],
+            )
+
+        # Один запрос для списка и по одному на Task.to_dict для задач без статистики
+        self.assertEqual(3, mocked_execute_sql.call_count)
+
+        data = items[0].to_dict()
+        self.assertEqual(1, data["number_of_runs"])
+        self.assertEqual(run.seq, data["last_started_run_seq"])
+        self.assertEqual(run.start_date, data["last_started_run_start_date"])
+        self.assertIsNotNone(data["next_scheduled_date"])
+        self.assertEqual(TaskRunWorkStatusEnum.FAILED, data["last_work_status"])
+
+    def test_get_with_stats(self) -> None:
+        task = Task.add(name="*", command="*")
+        run = task.add_or_get_run()
+        run.set_status(TaskRunStatusEnum.RUNNING)
+
+        task = Task.get_by_id(task.id)
+        with mock.patch.object(
+            self.test_db, "execute_sql", wraps=self.test_db.execute_sql
+        ) as mocked_execute_sql:
+            task.to_dict()
+            self.assertEqual(1, task.number_of_runs)
+            self.assertEqual(run.seq, task.last_started_run_seq)
+            self.assertEqual(TaskRunWorkStatusEnum.IN_PROCESSED, task.last_work_status)
+
+        # Статистика загружается один раз и запоминается в экземпляре
+        self.assertEqual(1, mocked_execute_sql.call_count)
+
+        run.set_status(TaskRunStatusEnum.STOPPED)
+        self.assertEqual(TaskRunWorkStatusEnum.IN_PROCESSED, task.last_work_status)
+
+        task.refresh_stats()
+        self.assertEqual(TaskRunWorkStatusEnum.STOPPED, task.last_work_status)
+
+        with self.subTest(msg="Задача из select_with_stats"):
+            task = Task.select_with_stats().where(Task.id == task.id).get()
+            task.add_or_get_run().set_status(TaskRunStatusEnum.RUNNING)
+            self.assertEqual(2, task.number_of_runs)
+
     def test_get_last_started_run(self) -> None:
         task = Task.add(name="*", command="*")
         self.assertIsNone(task.get_last_started_run())
@@ -480,13 +552,16 @@ class TestTask(BaseTestCaseDb):
         run.save()
         self.assertEqual(task.last_work_status, TaskRunWorkStatusEnum.FAILED)
 
+        # Запуски через другой экземпляр задачи, статистика которой сбрасывается явно
         run = Task.add(name="*", command="*").add_or_get_run()
         run.set_status(TaskRunStatusEnum.STOPPED)
+        task.refresh_stats()
         self.assertEqual(task.last_work_status, TaskRunWorkStatusEnum.STOPPED)
 
         run = Task.add(name="*", command="*").add_or_get_run()
         run.set_status(TaskRunStatusEnum.RUNNING)
         run.set_status(TaskRunStatusEnum.UNKNOWN)
+        task.refresh_stats()
         self.assertEqual(task.last_work_status, TaskRunWorkStatusEnum.FAILED)
 
     def test_get_all_logs(self) -> None:
@@ -1118,6 +1193,23 @@ class TestTaskRun(BaseTestCaseDb):
             log2 = run.add_log_err("1234", end="")
             self.assertEqual(log2.text, "1234")
 
+    def test_add_logs(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+
+        run.add_logs([])
+        self.assertEqual(0, run.logs.count())
+
+        items = []
+        for i in range(10):
+            kind = LogKindEnum.OUT if i % 2 == 0 else LogKindEnum.ERR
+            items.append((f"add_logs {i + 1}\n", kind, datetime.now()))
+
+        run.add_logs(items)
+        self.assertEqual(
+            [(text, kind) for text, kind, _ in items],
+            [(log.text, log.kind) for log in run.logs.order_by(TaskRunLog.id)],
+        )
+
     def test_send_notifications(self) -> None:
         run = Task.add(name="*", command="*").add_or_get_run()
         self.assertEqual(run.notifications.count(), 0)
@@ -1191,6 +1283,108 @@ class TestTaskRun(BaseTestCaseDb):
         self.assertEqual(run.work_status, TaskRunWorkStatusEnum.FAILED)
 
 
+class TestTaskSummary(BaseTestCaseDb):
+    def _get_summary(self, task: Task) -> tuple:
+        summary = TaskSummary.get_by_id(task.id)
+        return (
+            summary.last_started_run_id,
+            summary.nearest_scheduled_run_id,
+            summary.number_of_finished_runs,
+            summary.number_of_successful_runs,
+        )
+
+    def test_triggers(self) -> None:
+        task = Task.add(name="*", command="*")
+        self.assertEqual((None, None, 0, 0), self._get_summary(task))
+        self.assertIsNone(TaskSummary.get_by_id(task.id).success_rate)
+
+        run_1 = task.add_or_get_run()
+        self.assertEqual((None, None, 0, 0), self._get_summary(task))
+
+        run_1.set_status(TaskRunStatusEnum.RUNNING)
+        self.assertEqual((run_1.id, None, 0, 0), self._get_summary(task))
+
+        run_1.process_return_code = 0
+        run_1.set_status(TaskRunStatusEnum.FINISHED)
+        self.assertEqual((run_1.id, None, 1, 1), self._get_summary(task))
+
+        run_2 = task.add_or_get_run(scheduled_date=datetime.now() + timedelta(days=1))
+        self.assertEqual((run_1.id, run_2.id, 1, 1), self._get_summary(task))
+
+        run_2.set_status(TaskRunStatusEnum.RUNNING)
+        self.assertEqual((run_2.id, None, 1, 1), self._get_summary(task))
+
+        run_2.process_return_code = 1
+        run_2.set_status(TaskRunStatusEnum.FINISHED)
+        self.assertEqual((run_2.id, None, 2, 1), self._get_summary(task))
+        self.assertEqual(0.5, TaskSummary.get_by_id(task.id).success_rate)
+        self.assertEqual(
+            0.5,
+            TaskSummary.select(TaskSummary.success_rate)
+            .where(TaskSummary.task == task)
+            .scalar(),
+        )
+
+        # Исправление кода возврата учитывается в счетчиках
+        run_2.process_return_code = 0
+        run_2.save()
+        self.assertEqual((run_2.id, None, 2, 2), self._get_summary(task))
+
+        run_2.delete_instance()
+        self.assertEqual((run_1.id, None, 1, 1), self._get_summary(task))
+
+        task.delete_instance()
+        self.assertEqual(0, TaskSummary.select().count())
+
+    def test_nearest_scheduled_run(self) -> None:
+        task = Task.add(name="*", command="*")
+        now = datetime.now()
+
+        # Запуски запланированы не в порядке создания
+        run_1 = TaskRun.create(
+            task=task, seq=1, command="*", scheduled_date=now + timedelta(days=2)
+        )
+        run_2 = TaskRun.create(
+            task=task, seq=2, command="*", scheduled_date=now + timedelta(days=1)
+        )
+        run_3 = TaskRun.create(
+            task=task, seq=3, command="*", scheduled_date=now + timedelta(days=3)
+        )
+        self.assertEqual(run_2.id, self._get_summary(task)[1])
+
+        with self.subTest(msg="rebuild"):
+            TaskSummary.delete().execute()
+            TaskSummary.rebuild()
+            self.assertEqual(run_2.id, self._get_summary(task)[1])
+
+        run_2.scheduled_date = now + timedelta(days=4)
+        run_2.save()
+        self.assertEqual(run_1.id, self._get_summary(task)[1])
+
+        run_1.delete_instance()
+        self.assertEqual(run_3.id, self._get_summary(task)[1])
+
+    def test_rebuild(self) -> None:
+        for i in range(3):
+            task = Task.add(name=f"{i}", command="*")
+            for j in range(i + 2):
+                run = task.add_or_get_run()
+                run.set_status(TaskRunStatusEnum.RUNNING)
+                run.process_return_code = j % 2
+                run.set_status(TaskRunStatusEnum.FINISHED)
+
+            task.add_or_get_run(scheduled_date=datetime.now() + timedelta(days=1))
+
+        items: list[tuple] = [self._get_summary(task) for task in Task.select()]
+
+        TaskSummary.delete().execute()
+        TaskSummary.rebuild()
+        self.assertEqual(
+            items,
+            [self._get_summary(task) for task in Task.select()],
+        )
+
+
 class TestTaskRunLog(BaseTestCaseDb):
     def test_delete_cascade(self) -> None:
         run = Task.add(name="*", command="*").add_or_get_run()
@@ -1208,6 +1402,340 @@ class TestTaskRunLog(BaseTestCaseDb):
         run.delete_instance()
         self.assertEqual(0, run.logs.count())
 
+    def test_search(self) -> None:
+        task = Task.add(name="*", command="*")
+        run = task.add_or_get_run()
+        log_1 = run.add_log_out("Привет мир")
+        log_2 = run.add_log_err("Ошибка: ПРИВЕТ, привет")
+        run.add_log_out("hello world")
+
+        def search(value: str) -> list[int]:
+            return [
+                log.id
+                for log in TaskRunLog.select()
+                .where(TaskRunLog.search_text(value))
+                .order_by(TaskRunLog.id)
+            ]
+
+        with self.subTest(msg="Поиск подстроки без учета регистра"):
+            self.assertEqual([log_1.id, log_2.id], search("привет"))
+            self.assertEqual([log_2.id], search("ка: пр"))
+            self.assertEqual([], search("мир!"))
+
+        with self.subTest(msg="Короткая строка"):
+            self.assertEqual([log_1.id], search("ир"))
+
+        with self.subTest(msg="Релевантность и фрагменты"):
+            logs = TaskRunLogSearch.search("привет")
+            self.assertEqual([log_2.id, log_1.id], [log.id for log in logs])
+            self.assertEqual("\x02Привет\x03 мир\n", logs[1].search_snippet)
+
+        with self.subTest(msg="Изменение текста"):
+            log_1.text = "Пока"
+            log_1.save()
+            self.assertEqual([log_2.id], search("привет"))
+
+        with self.subTest(msg="Упаковка и удаление логов"):
+            run.pack_logs(chunk_size=10)
+            self.assertEqual([], search("привет"))
+
+            run_2 = task.add_or_get_run()
+            run_2.add_log_out("привет")
+            self.assertEqual(1, len(search("привет")))
+
+            run_2.delete_instance()
+            self.assertEqual([], search("привет"))
+
+
+class TestTaskRunLogChunk(BaseTestCaseDb):
+    def _add_logs(self, run: TaskRun, n: int) -> list[TaskRunLog]:
+        items = []
+        for i in range(n):
+            items.append(run.add_log_out(f"out {i + 1}"))
+            items.append(run.add_log_err(f"err {i + 1}"))
+        return items
+
+    def test_pack_logs(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        logs = self._add_logs(run, n=10)
+
+        self.assertEqual(len(logs), run.pack_logs(chunk_size=3))
+        self.assertEqual(0, run.logs.count())
+        self.assertEqual(7, run.log_chunks.count())
+        self.assertEqual(len(logs), run.get_number_of_logs())
+
+        self.assertEqual(
+            [log.to_dict() for log in logs],
+            [log.to_dict() for log in run.iter_logs()],
+        )
+
+        with self.subTest(msg="Повторная упаковка"):
+            self.assertEqual(0, run.pack_logs(chunk_size=3))
+            self.assertEqual(7, run.log_chunks.count())
+
+        with self.subTest(msg="Упаковка новых логов"):
+            logs += self._add_logs(run, n=2)
+            self.assertEqual(4, run.pack_logs(chunk_size=3))
+            self.assertEqual(
+                [log.to_dict() for log in logs],
+                [log.to_dict() for log in run.iter_logs()],
+            )
+
+    def test_get_logs_page(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        logs = self._add_logs(run, n=10)
+        run.pack_logs(chunk_size=4)
+        logs += self._add_logs(run, n=3)
+
+        expected = [log.to_dict() for log in logs]
+        for start, length in [(0, 5), (3, 4), (18, 5), (20, 10), (25, 10), (40, 5)]:
+            with self.subTest(start=start, length=length):
+                self.assertEqual(
+                    expected[start : start + length],
+                    [log.to_dict() for log in run.get_logs_page(start, length)],
+                )
+                self.assertEqual(
+                    expected[::-1][start : start + length],
+                    [
+                        log.to_dict()
+                        for log in run.get_logs_page(start, length, desc=True)
+                    ],
+                )
+
+    def test_get_logs_after(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        logs = self._add_logs(run, n=5)
+        run.pack_logs(chunk_size=4)
+        logs += self._add_logs(run, n=3)
+
+        expected = [log.to_dict() for log in logs]
+        for i, limit in [(0, 100), (0, 3), (5, 4), (9, 2), (10, 100), (15, 100)]:
+            last_id: int = logs[i - 1].id if i > 0 else 0
+            with self.subTest(last_id=last_id, limit=limit):
+                self.assertEqual(
+                    expected[i : i + limit],
+                    [log.to_dict() for log in run.get_logs_after(last_id, limit)],
+                )
+
+    def test_get_last_logs(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        logs = self._add_logs(run, n=10)
+        run.pack_logs(chunk_size=4)
+        logs += self._add_logs(run, n=3)
+
+        expected = [log.to_dict() for log in logs]
+        for number in [0, 1, 6, 7, 15, 26, 100]:
+            with self.subTest(number=number):
+                self.assertEqual(
+                    expected[-number:] if number else [],
+                    [log.to_dict() for log in run.get_last_logs(number)],
+                )
+
+    def test_get_logs_tail(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        logs = self._add_logs(run, n=5)
+        run.pack_logs(chunk_size=4)
+        logs += self._add_logs(run, n=5)
+
+        texts: list[str] = [log.text for log in logs]
+        self.assertEqual("".join(texts), run.get_logs_tail(max_lines=100))
+        self.assertEqual(
+            "".join(["...\n"] + texts[-3:]), run.get_logs_tail(max_lines=3)
+        )
+        self.assertEqual(
+            "".join(["...\n"] + texts[-2:]),
+            run.get_logs_tail(max_lines=100, max_bytes=13),
+        )
+
+    def test_archive_logs(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        run.set_status(TaskRunStatusEnum.RUNNING)
+        logs = self._add_logs(run, n=5)
+        run.pack_logs(chunk_size=4)
+        logs += self._add_logs(run, n=3)
+
+        with self.assertRaises(ValueError):
+            run.archive_logs()
+
+        run.set_status(TaskRunStatusEnum.FINISHED)
+
+        with (
+            tempfile.TemporaryDirectory() as dir_name,
+            mock.patch("run_tasks.db.DB_LOGS_ARCHIVE_DIR_NAME", Path(dir_name)),
+        ):
+            self.assertEqual(len(logs), run.archive_logs())
+            self.assertEqual(0, run.archive_logs())
+            self.assertTrue(run.get_logs_archive_path().exists())
+
+            # Строки в базе остаются до удаления, но уже не читаются
+            TaskRunLog.delete().where(TaskRunLog.task_run == run).execute()
+            TaskRunLogChunk.delete().where(TaskRunLogChunk.task_run == run).execute()
+
+            run = TaskRun.get_by_id(run.id)
+            self.assertEqual(LogsStorageEnum.ARCHIVE, run.logs_storage)
+            self.assertTrue(run.has_packed_logs)
+            self.assertEqual(len(logs), run.get_number_of_logs())
+
+            expected = [log.to_dict() for log in logs]
+            self.assertEqual(expected, [log.to_dict() for log in run.iter_logs()])
+            self.assertEqual(
+                expected[3:8], [log.to_dict() for log in run.get_logs_page(3, 5)]
+            )
+            self.assertEqual(
+                expected[::-1][:4],
+                [log.to_dict() for log in run.get_logs_page(0, 4, desc=True)],
+            )
+            self.assertEqual(
+                expected[10:12],
+                [log.to_dict() for log in run.get_logs_after(logs[9].id, 2)],
+            )
+            self.assertEqual(
+                expected[::-1][6:10],
+                [log.to_dict() for log in run.get_logs_page(6, 4, desc=True)],
+            )
+            self.assertEqual(
+                expected[-3:], [log.to_dict() for log in run.get_last_logs(3)]
+            )
+            self.assertEqual([], run.get_logs_after(logs[-1].id, 10))
+
+            with self.subTest(msg="Поврежденный архив"):
+                path: Path = run.get_logs_archive_path()
+                data: bytes = path.read_bytes()
+                path.write_bytes(data[: len(data) // 2])
+                try:
+                    with self.assertLogs("run_tasks.db", level="WARNING"):
+                        self.assertEqual(0, run.get_number_of_logs())
+                    with self.assertLogs("run_tasks.db", level="WARNING"):
+                        run.get_logs_page(0, 100)
+                finally:
+                    path.write_bytes(data)
+
+            with self.subTest(msg="Нет файла архива"):
+                path.rename(path.with_suffix(".bak"))
+                try:
+                    with self.assertLogs("run_tasks.db", level="WARNING"):
+                        self.assertEqual(0, run.get_number_of_logs())
+                    with self.assertLogs("run_tasks.db", level="WARNING"):
+                        self.assertEqual([], run.get_logs_page(0, 10))
+                    self.assertEqual([], run.get_logs_after(0, 10))
+                    self.assertEqual([], run.get_last_logs(10))
+                finally:
+                    path.with_suffix(".bak").rename(path)
+
+            with self.subTest(msg="Удаление архива"):
+                run.delete_logs_archive()
+                self.assertFalse(run.get_logs_archive_path().exists())
+                self.assertEqual(LogsStorageEnum.DELETED, run.logs_storage)
+                self.assertEqual(0, run.get_number_of_logs())
+                self.assertEqual([], list(run.iter_logs()))
+
+    def test_task_logs(self) -> None:
+        task = Task.add(name="*", command="*")
+
+        # Запуски выполняются по очереди
+        runs: list[TaskRun] = []
+        logs: list[TaskRunLog] = []
+        for _ in range(4):
+            run = task.add_or_get_run()
+            run.set_status(TaskRunStatusEnum.RUNNING)
+            logs += self._add_logs(run, n=5)
+            run.set_status(TaskRunStatusEnum.FINISHED)
+            runs.append(run)
+
+        with self.subTest(msg="Без упакованных логов"):
+            self.assertFalse(task.has_packed_logs)
+            self.assertEqual(
+                logs,
+                task.get_all_logs(order_by=TaskRunLog.id, items_per_page=len(logs)),
+            )
+
+        runs[0].pack_logs(chunk_size=3)
+        runs[2].pack_logs(chunk_size=3)
+        runs[3].pack_logs(chunk_size=4)
+        # Логи, добавленные после упаковки
+        logs += self._add_logs(runs[3], n=1)
+        self.assertTrue(task.has_packed_logs)
+
+        with (
+            tempfile.TemporaryDirectory() as dir_name,
+            mock.patch("run_tasks.db.DB_LOGS_ARCHIVE_DIR_NAME", Path(dir_name)),
+        ):
+            runs[1].archive_logs()
+            TaskRunLog.delete().where(TaskRunLog.task_run == runs[1]).execute()
+
+            self.assertEqual(
+                [run.id for run in runs],
+                [run.id for run, _ in task.get_runs_number_of_logs()],
+            )
+            self.assertEqual(
+                [10, 10, 10, 12],
+                [number for _, number in task.get_runs_number_of_logs()],
+            )
+            self.assertEqual(len(logs), task.get_number_of_logs())
+
+            expected = [log.to_dict() for log in logs]
+            self.assertEqual(expected, [log.to_dict() for log in task.iter_logs()])
+
+            for start, length in [(0, 5), (10, 7), (20, 12), (40, 10), (50, 5)]:
+                with self.subTest(msg="get_logs_page", start=start, length=length):
+                    self.assertEqual(
+                        expected[start : start + length],
+                        [log.to_dict() for log in task.get_logs_page(start, length)],
+                    )
+                    self.assertEqual(
+                        expected[::-1][start : start + length],
+                        [
+                            log.to_dict()
+                            for log in task.get_logs_page(start, length, desc=True)
+                        ],
+                    )
+
+            with self.subTest(msg="Распаковываются только чанки страницы"):
+                with mock.patch.object(
+                    TaskRunLogChunk,
+                    "get_logs",
+                    autospec=True,
+                    side_effect=TaskRunLogChunk.get_logs,
+                ) as mocked_get_logs:
+                    task.get_logs_page(34, 3)
+                self.assertEqual(
+                    [runs[3].id],
+                    [
+                        call.args[0].task_run_id
+                        for call in mocked_get_logs.call_args_list
+                    ],
+                )
+                self.assertEqual(1, mocked_get_logs.call_count)
+
+            with self.subTest(msg="get_all_logs"):
+                self.assertEqual(
+                    expected[5:10],
+                    [
+                        log.to_dict()
+                        for log in task.get_all_logs(page=2, items_per_page=5)
+                    ],
+                )
+                self.assertEqual(
+                    [log.to_dict() for log in logs if "err 2" in log.text][::-1][:3],
+                    [
+                        log.to_dict()
+                        for log in task.get_all_logs(
+                            filter_by_text="ERR 2",
+                            order_by=TaskRunLog.id.desc(),
+                            items_per_page=3,
+                        )
+                    ],
+                )
+
+    def test_delete_cascade(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        self._add_logs(run, n=10)
+        run.pack_logs(chunk_size=3)
+        self.assertNotEqual(0, run.log_chunks.count())
+
+        run.delete_instance()
+        self.assertEqual(0, TaskRunLogChunk.select().count())
+
 
 class TestNotification(BaseTestCaseDb):
     def test_add(self) -> None:
@@ -1319,6 +1847,133 @@ class TestNotification(BaseTestCaseDb):
         notification_email_2.cancel()
         self.assertEqual(Notification.get_unsent(), [notification_tg])
 
+    def test_get_ready_to_send(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        now = datetime.now()
+
+        notification_email = Notification.add(
+            task_run=run, name="*", text="*", kind=NotificationKindEnum.EMAIL
+        )
+        notification_tg = Notification.add(
+            task_run=run, name="*", text="*", kind=NotificationKindEnum.TELEGRAM
+        )
+        notification_tg_2 = Notification.add(
+            task_run=run, name="*", text="*", kind=NotificationKindEnum.TELEGRAM
+        )
+        self.assertEqual(
+            [notification_tg, notification_tg_2],
+            Notification.get_ready_to_send(NotificationKindEnum.TELEGRAM),
+        )
+        self.assertEqual(
+            [notification_tg_2],
+            Notification.get_ready_to_send(
+                NotificationKindEnum.TELEGRAM, exclude_ids=[notification_tg.id]
+            ),
+        )
+
+        notification_tg.set_as_failed(error="error", delay_secs=60)
+        self.assertEqual(1, notification_tg.attempts)
+        self.assertEqual("error", notification_tg.last_error)
+        self.assertEqual(
+            [notification_tg_2],
+            Notification.get_ready_to_send(NotificationKindEnum.TELEGRAM, now=now),
+        )
+        self.assertEqual(
+            [notification_tg, notification_tg_2],
+            Notification.get_ready_to_send(
+                NotificationKindEnum.TELEGRAM, now=now + timedelta(minutes=2)
+            ),
+        )
+        self.assertEqual(
+            [notification_tg],
+            Notification.get_ready_to_send(
+                NotificationKindEnum.TELEGRAM,
+                now=now + timedelta(minutes=2),
+                limit=1,
+            ),
+        )
+
+        notification_email.set_as_send()
+        self.assertEqual([], Notification.get_ready_to_send(NotificationKindEnum.EMAIL))
+
+    def test_send_notifications(self) -> None:
+        run = Task.add(name="*", command="*").add_or_get_run()
+        run.set_status(TaskRunStatusEnum.RUNNING)
+        run.add_logs(
+            [(f"line {i}\n", LogKindEnum.OUT, datetime.now()) for i in range(1000)]
+        )
+        run.set_status(TaskRunStatusEnum.FINISHED)
+
+        template: dict[str, str] = dict(
+            name="{{ run.task.name }}",
+            text="{{ run.get_logs_tail(max_lines=2) }}",
+        )
+        with mock.patch.dict(
+            "run_tasks.db.CONFIG_NOTIFICATION",
+            {kind.value: dict(template=template) for kind in NotificationKindEnum},
+        ):
+            run.send_notifications()
+
+        items = list(Notification.select().order_by(Notification.id))
+        self.assertEqual(len(NotificationKindEnum), len(items))
+        for item in items:
+            self.assertEqual("*", item.name)
+            self.assertEqual("...\nline 998\nline 999\n", item.text)
+
+        # Шаблон компилируется один раз
+        self.assertIs(get_template(template["text"]), get_template(template["text"]))
+
+        with self.subTest(msg="Текст формируется при отправке"):
+            Notification.delete().execute()
+            with (
+                mock.patch.dict(
+                    "run_tasks.db.CONFIG_NOTIFICATION",
+                    {
+                        kind.value: dict(template=template)
+                        for kind in NotificationKindEnum
+                    },
+                ),
+                mock.patch("run_tasks.db.NOTIFICATION_LAZY_TEXT", True),
+            ):
+                run.send_notifications()
+
+                for item in Notification.select():
+                    self.assertEqual("*", item.name)
+                    self.assertIsNone(item.text)
+                    self.assertEqual("template", item.template_key)
+                    self.assertEqual("...\nline 998\nline 999\n", item.get_text())
+
+                    item.set_as_send(text=item.get_text())
+                    self.assertEqual(
+                        "...\nline 998\nline 999\n",
+                        Notification.get_by_id(item.id).text,
+                    )
+
+        with self.assertRaises(ValueError):
+            Notification.add(
+                task_run=None, name="*", text=None, kind=NotificationKindEnum.EMAIL
+            )
+
+    def test_merge(self) -> None:
+        task = Task.add(name="*", command="*")
+        items = [
+            Notification.add(
+                task_run=task.add_or_get_run(),
+                name="*",
+                text="*",
+                kind=NotificationKindEnum.TELEGRAM,
+            )
+            for _ in range(3)
+        ]
+
+        digest = Notification.merge(items, name="name", text="text")
+        self.assertEqual(items[-1].task_run, digest.task_run)
+        self.assertEqual(NotificationKindEnum.TELEGRAM, digest.kind)
+        self.assertEqual([digest], Notification.get_unsent())
+        self.assertEqual(
+            [item.id for item in items], [item.id for item in digest.merged]
+        )
+
     def test_set_as_send(self) -> None:
         run = Task.add(name="*", command="*").add_or_get_run()
 
@@ -1401,3 +2056,341 @@ class TestNotification(BaseTestCaseDb):
             self.assertIsNone(notification.sending_date)
             self.assertIsNotNone(notification.canceling_date)
             self.assertFalse(notification.is_ready())
+
+
+class TestQueryPlan(BaseTestCaseDb):
+    """
+    Проверка, что частые запросы используют индексы, а не полный просмотр таблиц
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.task = Task.add(name="*", command="*")
+        for _ in range(10):
+            run = self.task.add_or_get_run()
+            run.set_status(TaskRunStatusEnum.RUNNING)
+            run.add_log_out("out")
+            run.set_status(TaskRunStatusEnum.FINISHED)
+
+            Notification.add(
+                task_run=run,
+                name="name",
+                text="text",
+                kind=NotificationKindEnum.EMAIL,
+            ).set_as_send()
+
+        self.run = self.task.add_or_get_run()
+        self.test_db.execute_sql("ANALYZE")
+
+    def assert_uses_index(self, query, index_name: str) -> None:
+        sql, params = query.sql()
+        plan: list[str] = [
+            row[3]
+            for row in self.test_db.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params)
+        ]
+
+        self.assertTrue(
+            any(f"USING INDEX {index_name} " in f"{line} " for line in plan), plan
+        )
+
+        # Полный просмотр таблицы и сортировка во временном дереве
+        self.assertNotIn("SCAN t1", plan)
+        self.assertFalse(any("TEMP B-TREE" in line for line in plan), plan)
+
+    def test_task_run(self) -> None:
+        self.assert_uses_index(
+            self.task.runs.where(
+                TaskRun.status.in_([TaskRunStatusEnum.PENDING])
+            ).order_by(TaskRun.create_date),
+            "taskrun_task_id_status_create_date",
+        )
+        self.assert_uses_index(
+            TaskRun.select().where(
+                TaskRun.status == TaskRunStatusEnum.RUNNING,
+                TaskRun.start_date < datetime.now(),
+            ),
+            "taskrun_status_start_date",
+        )
+        self.assert_uses_index(
+            TaskRun.select().where(
+                fn.COALESCE(TaskRun.finish_date, TaskRun.create_date) < datetime.now(),
+            ),
+            "taskrun_finish_or_create_date",
+        )
+        self.assert_uses_index(
+            TaskRun.select().where(TaskRun.is_active),
+            "taskrun_active",
+        )
+
+    def test_task_run_log(self) -> None:
+        self.assert_uses_index(
+            self.run.logs.where(TaskRunLog.id > 0).order_by(TaskRunLog.id),
+            "taskrunlog_task_run_id",
+        )
+        self.assert_uses_index(
+            self.run.logs.order_by(TaskRunLog.id.desc()),
+            "taskrunlog_task_run_id",
+        )
+
+    def test_notification(self) -> None:
+        self.assert_uses_index(
+            Notification.select()
+            .where(Notification.is_unsent)
+            .order_by(Notification.append_date),
+            "notification_unsent",
+        )
+
+
+class TestGroupCommitQueueDatabase(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / "db.sqlite"
+
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("PRAGMA journal_mode = wal")
+            conn.execute(
+                "CREATE TABLE item (id INTEGER PRIMARY KEY, value INTEGER UNIQUE)"
+            )
+        conn.close()
+
+        self.db: GroupCommitQueueDatabase | None = None
+
+    def tearDown(self) -> None:
+        if self.db:
+            self.db.stop()
+            self.db.close()
+        self.temp_dir.cleanup()
+
+    def _create_db(self, **kwargs) -> GroupCommitQueueDatabase:
+        self.db = GroupCommitQueueDatabase(
+            self.path,
+            autostart=False,
+            results_timeout=5.0,
+            **kwargs,
+        )
+        return self.db
+
+    def _insert(self, value: int):
+        return self.db.execute_sql("INSERT INTO item (value) VALUES (?)", (value,))
+
+    def _get_values(self) -> list[int]:
+        return [
+            value
+            for (value,) in self.db.execute_sql(
+                "SELECT value FROM item ORDER BY id"
+            ).fetchall()
+        ]
+
+    def test_group_commit(self) -> None:
+        db = self._create_db(queue_max_size=0, max_commit_size=4)
+
+        cursors = [self._insert(i) for i in range(10)]
+        cursor_duplicate = self._insert(0)
+        db.start()
+
+        self.assertEqual(list(range(1, 11)), [cursor.lastrowid for cursor in cursors])
+
+        with self.subTest(msg="Ошибка запроса не отменяет остальные"):
+            with self.assertRaises(IntegrityError):
+                cursor_duplicate.fetchall()
+            self.assertEqual(list(range(10)), self._get_values())
+
+        stats = db.get_stats()
+        self.assertEqual(11, stats["number_of_writes"])
+        self.assertEqual(3, stats["number_of_commits"])
+        self.assertEqual(4, stats["largest_commit_size"])
+        self.assertEqual(11, stats["max_queue_depth"])
+        self.assertEqual(0, stats["queue_depth"])
+
+    def test_spill(self) -> None:
+        db = self._create_db(queue_max_size=2, backpressure=BackpressureEnum.SPILL)
+
+        cursors = [self._insert(i) for i in range(10)]
+        self.assertEqual(10, db.queue_size())
+        self.assertEqual(8, db.get_stats()["number_of_spilled"])
+
+        db.start()
+        self.assertEqual(10, cursors[-1].lastrowid)
+        self.assertEqual(list(range(10)), self._get_values())
+
+        with self.subTest(msg="После разбора отложенных записи снова идут в очередь"):
+            self._insert(10).fetchall()
+            self.assertEqual(8, db.get_stats()["number_of_spilled"])
+
+    def test_drop_task_output(self) -> None:
+        db = self._create_db(
+            queue_max_size=1,
+            backpressure=BackpressureEnum.DROP_TASK_OUTPUT,
+        )
+
+        cursor = self._insert(0)
+        with db.droppable() as writes:
+            cursor_dropped = self._insert(1)
+        self.assertEqual([], cursor_dropped.fetchall())
+        self.assertEqual(1, writes.number_of_dropped)
+
+        db.start()
+        self.assertEqual(1, cursor.lastrowid)
+        self.assertEqual([0], self._get_values())
+        self.assertEqual(1, db.get_stats()["number_of_dropped"])
+
+
+class BaseTestCaseQueueDb(TestCase):
+    """
+    Модели на файловой базе GroupCommitQueueDatabase
+    """
+
+    # Дополнительные параметры GroupCommitQueueDatabase
+    DB_OPTIONS: dict[str, Any] = dict()
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+        self.models = BaseModel.get_inherited_models()
+        self.prev_db = BaseModel._meta.database
+
+        self.db = GroupCommitQueueDatabase(
+            Path(self.temp_dir.name) / "db.sqlite",
+            pragmas={
+                "foreign_keys": 1,
+                "journal_mode": "wal",
+            },
+            autostart=True,
+            results_timeout=5.0,
+            commit_interval_secs=0.01,
+            **self.DB_OPTIONS,
+        )
+        self.db.bind(self.models, bind_refs=False, bind_backrefs=False)
+        self.db.connect()
+        self.db.create_tables(self.models)
+
+        # Запросы создания таблиц и триггеров не ждут результата, поэтому
+        # ожидание выполнения записи, поставленной после них
+        self.db.execute_sql("PRAGMA user_version = 1").fetchall()
+
+    def tearDown(self) -> None:
+        self.db.stop()
+        self.db.close()
+        self.prev_db.bind(self.models, bind_refs=False, bind_backrefs=False)
+        self.temp_dir.cleanup()
+
+
+class TestGroupCommitQueueDatabaseModels(BaseTestCaseQueueDb):
+    """
+    Пачки записей GroupCommitQueueDatabase с моделями и триггерами
+    (полнотекстовый поиск, сводка TaskSummary)
+    """
+
+    def test_models(self) -> None:
+        task = Task.add(name="*", command="*")
+
+        def run_task() -> None:
+            run = task.add_or_get_run()
+            run.set_status(TaskRunStatusEnum.RUNNING)
+            run.add_logs(
+                [
+                    (f"run {run.id} line {i}", LogKindEnum.OUT, datetime.now())
+                    for i in range(10)
+                ]
+            )
+            run.process_return_code = 0
+            run.set_status(TaskRunStatusEnum.FINISHED)
+
+        # Запуски разных задач записываются одновременно и попадают в одни пачки
+        def run_other_task(i: int) -> None:
+            other_task = Task.add(name=f"task_{i}", command="*")
+            for _ in range(5):
+                run = other_task.add_or_get_run()
+                run.set_status(TaskRunStatusEnum.RUNNING)
+                run.add_log_out(f"task {i} run {run.id}")
+                run.set_status(TaskRunStatusEnum.STOPPED)
+
+        threads = [threading.Thread(target=run_other_task, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+
+        for _ in range(5):
+            run_task()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertGreater(self.db.get_stats()["largest_commit_size"], 1)
+
+        with self.subTest(msg="lastrowid"):
+            runs: list[TaskRun] = list(task.runs.order_by(TaskRun.seq))
+            self.assertEqual([1, 2, 3, 4, 5], [run.seq for run in runs])
+            for run in runs:
+                self.assertEqual(10, run.logs.count())
+                self.assertTrue(
+                    all(log.text.startswith(f"run {run.id} ") for log in run.logs)
+                )
+
+        with self.subTest(msg="rowcount"):
+            self.assertEqual(
+                5,
+                TaskRun.update(command="echo").where(TaskRun.task == task).execute(),
+            )
+
+        with self.subTest(msg="TaskSummary"):
+            summary = TaskSummary.get_by_id(task.id)
+            self.assertEqual(runs[-1].id, summary.last_started_run_id)
+            self.assertEqual(5, summary.number_of_finished_runs)
+            self.assertEqual(5, summary.number_of_successful_runs)
+
+            items: list[tuple] = list(
+                TaskSummary.select().order_by(TaskSummary.task).tuples()
+            )
+            TaskSummary.rebuild()
+            self.assertEqual(
+                items, list(TaskSummary.select().order_by(TaskSummary.task).tuples())
+            )
+
+        with self.subTest(msg="Полнотекстовый поиск"):
+            self.assertEqual(
+                TaskRunLog.select().where(TaskRunLog.text.contains("line 3")).count(),
+                TaskRunLog.select().where(TaskRunLog.search_text("line 3")).count(),
+            )
+
+    def test_failed_write(self) -> None:
+        task = Task.add(name="*", command="*")
+        run = task.add_or_get_run()
+
+        # Записи накапливаются в очереди и выполняются одной пачкой
+        self.db.stop()
+
+        def execute(query):
+            return self.db.execute_sql(*query.sql())
+
+        cursor_log = execute(
+            TaskRunLog.insert(task_run=run, text="before error", kind=LogKindEnum.OUT)
+        )
+        cursor_status = execute(
+            TaskRun.update(status=TaskRunStatusEnum.STOPPED).where(TaskRun.id == run.id)
+        )
+        cursor_duplicate = execute(TaskRun.insert(task=task, seq=run.seq, command="*"))
+        cursor_run = execute(TaskRun.insert(task=task, seq=run.seq + 1, command="*"))
+
+        self.db.start()
+
+        with self.assertRaises(IntegrityError):
+            cursor_duplicate.fetchall()
+
+        log: TaskRunLog = TaskRunLog.get(TaskRunLog.text == "before error")
+        self.assertEqual(log.id, cursor_log.lastrowid)
+        self.assertEqual(1, cursor_status.rowcount)
+        self.assertEqual(
+            TaskRun.get(TaskRun.seq == run.seq + 1).id, cursor_run.lastrowid
+        )
+        self.assertEqual(2, TaskRun.select().count())
+
+        stats = self.db.get_stats()
+        self.assertEqual(4, stats["last_commit_size"])
+
+        # Изменения от триггеров успешных записей тоже зафиксированы
+        self.assertEqual(TaskRunStatusEnum.STOPPED, TaskRun.get_by_id(run.id).status)
+        summary = TaskSummary.get_by_id(task.id)
+        self.assertEqual(run.id, summary.last_started_run_id)
+        self.assertEqual(1, summary.number_of_finished_runs)
+        self.assertEqual([log], TaskRunLogSearch.search("before"))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+from datetime import datetime, timedelta
+
+from run_tasks.db import Task, TaskRun, TaskRunStatusEnum
+from run_tasks.forecast import DEFAULT_DURATION_SECS, get_durations, get_forecast
+from tests.test_db import BaseTestCaseDb
+
+
+class TestForecast(BaseTestCaseDb):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.start_date = datetime(2026, 1, 1)
+
+    def _add_run(self, task: Task, duration: timedelta) -> TaskRun:
+        run = task.add_or_get_run()
+        run.set_status(TaskRunStatusEnum.RUNNING)
+        run.process_return_code = 0
+        run.set_status(TaskRunStatusEnum.FINISHED)
+
+        run.start_date = self.start_date
+        run.finish_date = self.start_date + duration
+        run.save()
+
+        return run
+
+    def test_get_durations(self) -> None:
+        task_1 = Task.add(name="task_1", command="*")
+        self._add_run(task_1, timedelta(minutes=1))
+        self._add_run(task_1, timedelta(minutes=3))
+
+        task_2 = Task.add(name="task_2", command="*")
+
+        durations = get_durations([task_1.id, task_2.id])
+        self.assertEqual([task_1.id], list(durations))
+        self.assertAlmostEqual(120, durations[task_1.id], places=3)
+
+    def test_get_forecast(self) -> None:
+        end_date = self.start_date + timedelta(hours=2)
+
+        # Каждые 15 минут, выполняется 20 минут, поэтому запуски идут подряд
+        task_long = Task.add(name="task_long", command="*", cron="*/15 * * * *")
+        self._add_run(task_long, timedelta(minutes=20))
+
+        task_hourly = Task.add(name="task_hourly", command="*", cron="0 * * * *")
+
+        # Не учитываются
+        Task.add(name="task_manual", command="*")
+        Task.add(name="task_disabled", command="*", cron="0 * * * *", is_enabled=False)
+
+        forecast = get_forecast(self.start_date, end_date)
+        self.assertEqual(
+            [task_long.id, task_hourly.id],
+            [item.task_id for item in forecast.tasks],
+        )
+        self.assertEqual(DEFAULT_DURATION_SECS, forecast.tasks[1].duration_secs)
+
+        self.assertEqual(120, len(forecast.concurrency))
+        self.assertEqual(2, forecast.peak_concurrency)
+        self.assertEqual(
+            [self.start_date, self.start_date + timedelta(hours=1)],
+            forecast.get_peak_dates(),
+        )
+        self.assertEqual(
+            [
+                dict(date=self.start_date, tasks=["task_long", "task_hourly"]),
+                dict(
+                    date=self.start_date + timedelta(hours=1),
+                    tasks=["task_long", "task_hourly"],
+                ),
+            ],
+            forecast.get_collisions(),
+        )
+
+        with self.subTest(msg="Неправильное окно"):
+            with self.assertRaises(ValueError):
+                get_forecast(end_date, self.start_date)
+
+            with self.assertRaises(ValueError):
+                get_forecast(self.start_date, self.start_date + timedelta(days=100))
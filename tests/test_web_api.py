@@ -4,11 +4,14 @@
 __author__ = "ipetrash"
 
 
+import json
 import time
 from datetime import datetime
 from enum import Enum
+from functools import partial
 from http import HTTPStatus
 from typing import Any, Callable
+from unittest import mock
 
 from playhouse.shortcuts import model_to_dict
 
@@ -22,9 +25,16 @@ from run_tasks.db import (
     NotificationKindEnum,
     StopReasonEnum,
     TaskRunLog,
+    LogKindEnum,
 )
 
-from run_tasks.app_web.config import API_PAGE_LENGTH_DEFAULT
+from run_tasks.app_web.api import api
+from run_tasks.app_web.change_feed import ChangeFeed
+from run_tasks.app_web.config import (
+    API_PAGE_LENGTH_DEFAULT,
+    API_CRON_NEXT_DATES_MAX_NUMBER,
+    API_FORECAST_MAX_LIMIT,
+)
 from tests import DATETIME_DELAY_SECS
 from tests.test_web_pages import TestBaseAppWeb
 
@@ -355,6 +365,24 @@ class TestBase(TestBaseAppWeb):
             self.assertEqual(rs.json["status"], "ok")
             self.assertEqual(rs.json["result"][0]["name"], data["name"])
 
+        with self.subTest("200 - Ok - Storage days"):
+            rs = self.client.post(
+                uri,
+                json=dict(logs_storage_days=7, archived_logs_storage_days=None),
+            )
+            self.assertEqual(rs.status_code, HTTPStatus.OK.value)
+
+            task = Task.get_by_id(task.id)
+            self.assertEqual(7, task.logs_storage_days)
+            self.assertIsNone(task.archived_logs_storage_days)
+
+        for value in ["7", -1, 0, 1.5, True]:
+            with self.subTest("400 - Bad Request - storage days", value=value):
+                rs = self.client.post(uri, json=dict(task_run_storage_days=value))
+                self.assertEqual(rs.status_code, HTTPStatus.BAD_REQUEST.value)
+                self.assertEqual(rs.json["status"], "error")
+                self.assertIsNone(Task.get_by_id(task.id).task_run_storage_days)
+
         with self.subTest("200 - Ok - Strip name"):
             task_name: str = "Ping"
             data["name"] = f" {task_name}\t "
@@ -526,6 +554,67 @@ class TestBase(TestBaseAppWeb):
                 get_common_view(run_1.to_dict()),
             )
 
+    def test_task_run_logs_tail(self) -> None:
+        task = Task.add(name="1", command="ping 127.0.0.1")
+
+        with self.subTest("404 - Not Found"):
+            rs = self.client.get(f"/api/task/{task.id}/run/99999/logs/tail")
+            self.assertEqual(rs.status_code, HTTPStatus.NOT_FOUND.value)
+            self.assertEqual(rs.json["status"], "error")
+
+        with self.subTest("No runs"):
+            rs = self.client.get(f"/api/task/{task.id}/run/last/logs/tail")
+            self.assertEqual(rs.status_code, HTTPStatus.OK.value)
+
+            result = rs.json["result"][0]
+            self.assertIsNone(result["task_run"])
+            self.assertEqual(result["logs"], [])
+            self.assertEqual(result["last_id"], 0)
+
+        run = task.add_or_get_run()
+        run.set_status(TaskRunStatusEnum.RUNNING)
+        logs: list[TaskRunLog] = [run.add_log_out(f"out {i}") for i in range(5)]
+
+        for uri in [
+            f"/api/task/{task.id}/run/{run.seq}/logs/tail",
+            f"/api/task/{task.id}/run/last/logs/tail",
+        ]:
+            with self.subTest(uri=uri):
+                rs = self.client.get(uri, query_string=dict(limit=3))
+                self.assertEqual(rs.status_code, HTTPStatus.OK.value)
+
+                result = rs.json["result"][0]
+                self.assertEqual(result["task_run"]["id"], run.id)
+                self.assertEqual(result["task_run"]["status"], run.status.value)
+                self.assertEqual(
+                    [log["id"] for log in result["logs"]], [log.id for log in logs[:3]]
+                )
+                self.assertEqual(result["last_id"], logs[2].id)
+                self.assertTrue(result["has_more"])
+
+                rs = self.client.get(
+                    uri, query_string=dict(last_id=result["last_id"], limit=3)
+                )
+                result = rs.json["result"][0]
+                self.assertEqual(
+                    [log["id"] for log in result["logs"]], [log.id for log in logs[3:]]
+                )
+                self.assertEqual(result["last_id"], logs[-1].id)
+                self.assertFalse(result["has_more"])
+
+                rs = self.client.get(uri, query_string=dict(last_id=logs[-1].id))
+                result = rs.json["result"][0]
+                self.assertEqual(result["logs"], [])
+                self.assertEqual(result["last_id"], logs[-1].id)
+
+        with self.subTest("400 - Bad Request"):
+            rs = self.client.get(
+                f"/api/task/{task.id}/run/{run.seq}/logs/tail",
+                query_string=dict(limit=0),
+            )
+            self.assertEqual(rs.status_code, HTTPStatus.BAD_REQUEST.value)
+            self.assertEqual(rs.json["status"], "error")
+
     def test_task_run_do_stop(self) -> None:
         with self.subTest("405 - Method Not Allowed"):
             uri: str = "/api/task/99999/run/99999/do-stop"
@@ -819,6 +908,97 @@ class TestBase(TestBaseAppWeb):
                 for obj in rs.json["result"]:
                     self.assertGreater(datetime.fromisoformat(obj["date"]), now)
 
+        with self.subTest(msg="Define dates window"):
+            rs = self.client.get(
+                uri,
+                query_string=dict(
+                    cron="0 * * * *",
+                    start_date="2026-01-01T00:00:00",
+                    end_date="2026-01-02T00:00:00",
+                ),
+            )
+            self.assertEqual(rs.status_code, HTTPStatus.OK.value)
+
+            dates = [datetime.fromisoformat(obj["date"]) for obj in rs.json["result"]]
+            self.assertEqual(len(dates), 25)
+            self.assertEqual(dates[0], datetime(2026, 1, 1))
+            self.assertEqual(dates[-1], datetime(2026, 1, 2))
+
+            rs = self.client.get(
+                uri,
+                query_string=dict(
+                    cron="0 * * * *",
+                    start_date="2026-01-01T00:00:00",
+                    end_date="2026-01-02T00:00:00",
+                    number=3,
+                ),
+            )
+            self.assertEqual(len(rs.json["result"]), 3)
+
+        with self.subTest(msg="Define seed"):
+            dates: list[list[str]] = []
+            for seed in ["task_1", "task_2"]:
+                rs = self.client.get(
+                    uri, query_string=dict(cron="@hourly", seed=seed, number=1)
+                )
+                self.assertEqual(rs.status_code, HTTPStatus.OK.value)
+                dates.append(rs.json["result"])
+
+            self.assertNotEqual(dates[0], dates[1])
+
+        with self.subTest(msg="Bad parameters"):
+            for query_string in [
+                dict(cron="* * * * *", number=0),
+                dict(cron="* * * * *", number=API_CRON_NEXT_DATES_MAX_NUMBER + 1),
+                dict(cron="* * * * *", start_date="FOO"),
+            ]:
+                rs = self.client.get(uri, query_string=query_string)
+                self.assertEqual(rs.status_code, HTTPStatus.BAD_REQUEST.value)
+
+    def test_forecast(self) -> None:
+        uri: str = "/api/forecast"
+
+        Task.add(name="task_1", command="*", cron="0 * * * *")
+        Task.add(name="task_2", command="*", cron="0 * * * *")
+
+        with self.subTest(msg="OK"):
+            rs = self.client.get(
+                uri,
+                query_string=dict(
+                    start_date="2026-01-01T00:00:00",
+                    end_date="2026-01-01T03:00:00",
+                ),
+            )
+            self.assertEqual(rs.status_code, HTTPStatus.OK.value)
+
+            result: dict[str, Any] = rs.json["result"][0]
+            self.assertEqual(2, result["peak_concurrency"])
+            self.assertEqual(3, len(result["peak_dates"]))
+            self.assertEqual(3, len(result["collisions"]))
+            self.assertEqual(["task_1", "task_2"], result["collisions"][0]["tasks"])
+            self.assertEqual(
+                [3, 3], [task["number_of_runs"] for task in result["tasks"]]
+            )
+
+        with self.subTest(msg="ERROR"):
+            rs = self.client.get(
+                uri,
+                query_string=dict(
+                    start_date="2026-01-01T00:00:00",
+                    end_date="2025-01-01T00:00:00",
+                ),
+            )
+            self.assertEqual(rs.status_code, HTTPStatus.BAD_REQUEST.value)
+
+        for limit in [0, -1, API_FORECAST_MAX_LIMIT + 1]:
+            with self.subTest(msg="Bad limit", limit=limit):
+                rs = self.client.get(uri, query_string=dict(limit=limit))
+                self.assertEqual(rs.status_code, HTTPStatus.BAD_REQUEST.value)
+
+        with self.subTest(msg="Max limit"):
+            rs = self.client.get(uri, query_string=dict(limit=API_FORECAST_MAX_LIMIT))
+            self.assertEqual(rs.status_code, HTTPStatus.OK.value)
+
 
 class TestTasks(TestBaseDatatablesMixin, TestBaseAppWeb):
     def setUp(self) -> None:
@@ -840,6 +1020,7 @@ class TestTasks(TestBaseDatatablesMixin, TestBaseAppWeb):
             "last_started_run_start_date": None,
             "next_scheduled_date": None,
             "last_work_status": TaskRunWorkStatusEnum.NONE.value,
+            "success_rate": None,
         }
         if overrides:
             base.update(overrides)
@@ -1317,7 +1498,7 @@ class TestTasks(TestBaseDatatablesMixin, TestBaseAppWeb):
                 "number_of_runs": 1,
                 "last_started_run_seq": 1,
                 "last_work_status": TaskRunWorkStatusEnum.IN_PROCESSED.value,
-                "last_started_run_start_date": run_1.start_date.isoformat(sep=" "),
+                "last_started_run_start_date": run_1.start_date.isoformat(),
             }
             self.assertEqual(TaskRunWorkStatusEnum.IN_PROCESSED, task.last_work_status)
             self.assertEqual(TaskRunWorkStatusEnum.IN_PROCESSED, run_1.work_status)
@@ -1330,7 +1511,8 @@ class TestTasks(TestBaseDatatablesMixin, TestBaseAppWeb):
                 "number_of_runs": 1,
                 "last_started_run_seq": 1,
                 "last_work_status": TaskRunWorkStatusEnum.SUCCESSFUL.value,
-                "last_started_run_start_date": run_1.start_date.isoformat(sep=" "),
+                "last_started_run_start_date": run_1.start_date.isoformat(),
+                "success_rate": 1.0,
             }
             self.assertEqual(TaskRunWorkStatusEnum.SUCCESSFUL, task.last_work_status)
             self.assertEqual(TaskRunWorkStatusEnum.SUCCESSFUL, run_1.work_status)
@@ -1342,7 +1524,8 @@ class TestTasks(TestBaseDatatablesMixin, TestBaseAppWeb):
                 "number_of_runs": 1,
                 "last_started_run_seq": 1,
                 "last_work_status": TaskRunWorkStatusEnum.SUCCESSFUL.value,
-                "last_started_run_start_date": run_1.start_date.isoformat(sep=" "),
+                "last_started_run_start_date": run_1.start_date.isoformat(),
+                "success_rate": 1.0,
             }
             self.assertEqual(TaskRunWorkStatusEnum.SUCCESSFUL, task.last_work_status)
             self.assertEqual(TaskRunWorkStatusEnum.NONE, run_2.work_status)
@@ -1354,7 +1537,8 @@ class TestTasks(TestBaseDatatablesMixin, TestBaseAppWeb):
                 "number_of_runs": 2,
                 "last_started_run_seq": 2,
                 "last_work_status": TaskRunWorkStatusEnum.IN_PROCESSED.value,
-                "last_started_run_start_date": run_2.start_date.isoformat(sep=" "),
+                "last_started_run_start_date": run_2.start_date.isoformat(),
+                "success_rate": 1.0,
             }
             self.assertEqual(TaskRunWorkStatusEnum.IN_PROCESSED, task.last_work_status)
             self.assertEqual(TaskRunWorkStatusEnum.IN_PROCESSED, run_2.work_status)
@@ -1367,7 +1551,8 @@ class TestTasks(TestBaseDatatablesMixin, TestBaseAppWeb):
                 "number_of_runs": 2,
                 "last_started_run_seq": 2,
                 "last_work_status": TaskRunWorkStatusEnum.FAILED.value,
-                "last_started_run_start_date": run_2.start_date.isoformat(sep=" "),
+                "last_started_run_start_date": run_2.start_date.isoformat(),
+                "success_rate": 0.5,
             }
             self.assertEqual(TaskRunWorkStatusEnum.FAILED, task.last_work_status)
             self.assertEqual(TaskRunWorkStatusEnum.FAILED, run_2.work_status)
@@ -1379,7 +1564,8 @@ class TestTasks(TestBaseDatatablesMixin, TestBaseAppWeb):
                 "number_of_runs": 2,
                 "last_started_run_seq": 2,
                 "last_work_status": TaskRunWorkStatusEnum.FAILED.value,
-                "last_started_run_start_date": run_2.start_date.isoformat(sep=" "),
+                "last_started_run_start_date": run_2.start_date.isoformat(),
+                "success_rate": 0.5,
             }
             self.assertEqual(TaskRunWorkStatusEnum.FAILED, task.last_work_status)
             self.assertEqual(TaskRunWorkStatusEnum.NONE, run_3.work_status)
@@ -1391,7 +1577,8 @@ class TestTasks(TestBaseDatatablesMixin, TestBaseAppWeb):
                 "number_of_runs": 3,
                 "last_started_run_seq": 3,
                 "last_work_status": TaskRunWorkStatusEnum.IN_PROCESSED.value,
-                "last_started_run_start_date": run_3.start_date.isoformat(sep=" "),
+                "last_started_run_start_date": run_3.start_date.isoformat(),
+                "success_rate": 0.5,
             }
             self.assertEqual(TaskRunWorkStatusEnum.IN_PROCESSED, task.last_work_status)
             self.assertEqual(TaskRunWorkStatusEnum.IN_PROCESSED, run_3.work_status)
@@ -1404,7 +1591,8 @@ class TestTasks(TestBaseDatatablesMixin, TestBaseAppWeb):
                 "number_of_runs": 3,
                 "last_started_run_seq": 3,
                 "last_work_status": TaskRunWorkStatusEnum.FAILED.value,
-                "last_started_run_start_date": run_3.start_date.isoformat(sep=" "),
+                "last_started_run_start_date": run_3.start_date.isoformat(),
+                "success_rate": 1 / 3,
             }
             self.assertEqual(TaskRunWorkStatusEnum.FAILED, task.last_work_status)
             self.assertEqual(TaskRunWorkStatusEnum.FAILED, run_3.work_status)
@@ -1672,7 +1860,7 @@ class TestTaskLogs(TestTaskMixin, TestBaseAppWeb):
         return logs
 
     def get_records_total(self) -> int:
-        return TaskRunLog.select().count()
+        return self.task.get_number_of_logs()
 
     def test_errors(self) -> None:
         super().test_errors()
@@ -1703,6 +1891,158 @@ class TestTaskLogs(TestTaskMixin, TestBaseAppWeb):
         with self.subTest("Смещение на вторую страницу"):
             self.assert_table(params={"start": 3, "length": 3}, expected=logs[3:6])
 
+    def test_packed_logs(self) -> None:
+        logs = self._create_runs_with_logs(n_runs=3, n_logs=4)
+
+        run: TaskRun = self.task.runs.order_by(TaskRun.id).first()
+        run.pack_logs(chunk_size=3)
+        self.assertEqual(0, run.logs.count())
+
+        with self.subTest("Все записи"):
+            self.assert_table(expected=logs, params=dict(length=999_999_999))
+
+        with self.subTest("Страница по убыванию"):
+            self.assert_table(
+                params={
+                    "start": 6,
+                    "length": 5,
+                    "order[0][name]": "id",
+                    "order[0][dir]": "desc",
+                },
+                expected=logs[::-1][6:11],
+            )
+
+        with self.subTest("Фильтр по запуску"):
+            self.assert_table(
+                params={
+                    "columns[0][name]": "task_run",
+                    "columns[0][search][value]": json.dumps(run.id),
+                    "length": 999_999_999,
+                },
+                expected=[log for log in logs if log.task_run_id == run.id],
+                records_filtered=8,
+            )
+
+        with self.subTest("Поиск с сортировкой"):
+            filtered = [log for log in logs if "err=" in log.text]
+            expected = sorted(filtered, key=lambda log: log.text, reverse=True)
+            self.assert_table(
+                params={
+                    "search[value]": "ERR=",
+                    "start": 2,
+                    "length": 4,
+                    "order[0][name]": "text",
+                    "order[0][dir]": "desc",
+                },
+                expected=expected[2:6],
+                records_filtered=len(filtered),
+            )
+
+    def test_keyset_pagination(self) -> None:
+        logs = self._create_runs_with_logs(n_runs=2, n_logs=4)
+
+        def get_pages(params: dict[str, Any]) -> list[list[int]]:
+            pages: list[list[int]] = []
+            after: str = ""
+            while True:
+                rs = self.client.get(
+                    self.uri,
+                    query_string=dict(params, length=5, after=after, count="cached"),
+                )
+                self.assertEqual(HTTPStatus.OK.value, rs.status_code)
+                self.assertEqual(len(logs), rs.json["recordsTotal"])
+
+                pages.append([obj["id"] for obj in rs.json["data"]])
+                if rs.json["next_after"] is None:
+                    return pages
+
+                after = json.dumps(rs.json["next_after"])
+
+        with self.subTest("Сортировка по умолчанию"):
+            pages = get_pages(dict())
+            self.assertEqual([5, 5, 5, 1], [len(page) for page in pages])
+            self.assertEqual([log.id for log in logs], sum(pages, []))
+
+        with self.subTest("Сортировка по дате по убыванию"):
+            pages = get_pages({"order[0][name]": "date", "order[0][dir]": "desc"})
+            expected = sorted(logs, key=lambda log: (log.date, log.id), reverse=True)
+            self.assertEqual([log.id for log in expected], sum(pages, []))
+
+        with self.subTest("Сортировка по разным направлениям - offset"):
+            rs = self.client.get(
+                self.uri,
+                query_string={
+                    "order[0][name]": "kind",
+                    "order[0][dir]": "desc",
+                    "order[1][name]": "id",
+                    "order[1][dir]": "asc",
+                    "after": "",
+                },
+            )
+            self.assertIsNone(rs.json["next_after"])
+
+        with self.subTest("Без подсчета"):
+            rs = self.client.get(self.uri, query_string=dict(after="", count="none"))
+            self.assertIsNone(rs.json["recordsTotal"])
+            self.assertIsNone(rs.json["recordsFiltered"])
+            self.assertEqual(API_PAGE_LENGTH_DEFAULT, len(rs.json["data"]))
+
+        with self.subTest("Ошибки"):
+            for params in [
+                dict(after="abc"),
+                dict(after="{}"),
+                dict(after="[1, 2]"),
+                dict(count="abc"),
+            ]:
+                rs = self.client.get(self.uri, query_string=params)
+                self.assertEqual(HTTPStatus.BAD_REQUEST.value, rs.status_code)
+
+    def test_logs_search(self) -> None:
+        run = self.task.add_or_get_run()
+        log_1 = run.add_log_out("<b>status</b> ok")
+        run.add_log_out("hello")
+
+        other_run = Task.add(name="other", command="*").add_or_get_run()
+        other_run.add_log_out("status ok")
+
+        for uri in [
+            f"/api/task/{self.task.id}/logs/search",
+            f"/api/task/{self.task.id}/run/{run.seq}/logs/search",
+        ]:
+            with self.subTest(uri=uri):
+                rs = self.client.get(uri, query_string=dict(q="STATUS"))
+                self.assertEqual(HTTPStatus.OK.value, rs.status_code)
+
+                result = rs.json["result"]
+                self.assertEqual([log_1.id], [obj["id"] for obj in result])
+                self.assertEqual(
+                    "&lt;b&gt;<mark>status</mark>&lt;/b&gt; ok\n",
+                    result[0]["snippet"],
+                )
+
+                for params in [dict(q="st"), dict(q="status", limit=0)]:
+                    rs = self.client.get(uri, query_string=params)
+                    self.assertEqual(HTTPStatus.BAD_REQUEST.value, rs.status_code)
+
+    def test_count_cache(self) -> None:
+        cache = api.CountCache(ttl_secs=60, max_size=2)
+        self._create_runs_with_logs(n_runs=1, n_logs=1)
+
+        query = TaskRunLog.select()
+        self.assertEqual(2, cache.get_count(query))
+
+        # Значение берется из кэша
+        self._create_runs_with_logs(n_runs=1, n_logs=1)
+        self.assertEqual(2, cache.get_count(query))
+
+        # Для другого фильтра свое значение
+        self.assertEqual(
+            2, cache.get_count(query.where(TaskRunLog.kind == LogKindEnum.OUT))
+        )
+
+        cache.clear()
+        self.assertEqual(4, cache.get_count(query))
+
     def test_search(self) -> None:
         """Проверка поиска по полям: text, kind"""
 
@@ -2096,6 +2436,53 @@ class TestTaskRunLogs(TestTaskMixin, TestBaseAppWeb):
         self.assert_table(params=params, expected=[l3, l1, l2])
 
 
+class TestTaskRunPackedLogs(TestTaskRunLogs):
+    """
+    Те же проверки, что и для TestTaskRunLogs, но с логами, упакованными в чанки
+    """
+
+    def get_records_total(self) -> int:
+        return self.run.get_number_of_logs()
+
+    def assert_table(self, *args, **kwargs) -> None:
+        # Маленький размер чанка, чтобы страницы попадали на границы чанков
+        self.run.pack_logs(chunk_size=3)
+        self.assertEqual(0, self.run.logs.count())
+
+        super().assert_table(*args, **kwargs)
+
+    def test_packed_and_not_packed(self) -> None:
+        logs = self._add_logs(self.run, n=5)
+        self.run.pack_logs(chunk_size=4)
+
+        # Логи, добавленные после упаковки
+        logs += self._add_logs(self.run, n=5)
+        self.assertEqual(10, self.run.logs.count())
+
+        with self.subTest("Все записи"):
+            TestBaseDatatablesMixin.assert_table(
+                self, expected=logs, params=dict(length=999_999_999)
+            )
+
+        with self.subTest("Страница на границе упакованных логов"):
+            TestBaseDatatablesMixin.assert_table(
+                self, params={"start": 8, "length": 5}, expected=logs[8:13]
+            )
+
+        with self.subTest("Страница на границе упакованных логов, по убыванию"):
+            TestBaseDatatablesMixin.assert_table(
+                self,
+                params={
+                    "start": 8,
+                    "length": 5,
+                    "order[0][column]": "0",
+                    "order[0][name]": "id",
+                    "order[0][dir]": "desc",
+                },
+                expected=logs[::-1][8:13],
+            )
+
+
 class TestTaskRunLastLogs(TestTaskRunLogs):
     def setUp(self) -> None:
         super().setUp()
@@ -2543,3 +2930,145 @@ class TestNotifications(TestBaseDatatablesMixin, TestBaseAppWeb):
         # 2. 'SameName' с текстом 'B' (имена одинаковые, сортировка по тексту DESC)
         # 3. 'SameName' с текстом 'A'
         self.assert_table(params=params, expected=[n3, n2, n1])
+
+
+class TestChangeFeed(TestBaseAppWeb):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.feed = ChangeFeed(
+            poll_interval_secs=0,
+            max_logs=3,
+            subscription_max_size=100,
+        )
+        self.task = Task.add(name="1", command="ping 127.0.0.1")
+
+    def get_events(self, subscription) -> list[tuple[str, dict[str, Any]]]:
+        items = []
+        while event := subscription.get(timeout=0):
+            items.append((event.name, event.data))
+        return items
+
+    def test_poll(self) -> None:
+        other_task = Task.add(name="2", command="ping 127.0.0.1")
+
+        sub_all = self.feed.subscribe(start=False)
+        sub_task = self.feed.subscribe(task_id=self.task.id, start=False)
+        sub_other_task = self.feed.subscribe(task_id=other_task.id, start=False)
+
+        with self.subTest("Первая проверка"):
+            self.feed.poll()
+            for sub in [sub_all, sub_task, sub_other_task]:
+                self.assertEqual(
+                    [("notifications", dict(number=0))], self.get_events(sub)
+                )
+
+        with self.subTest("Нет изменений"):
+            self.assertEqual([], self.feed.poll())
+
+        run = self.task.add_or_get_run()
+
+        with self.subTest("Новый запуск"):
+            self.feed.poll()
+            events = self.get_events(sub_all)
+            self.assertEqual(["task_run"], [name for name, _ in events])
+            self.assertEqual(run.id, events[0][1]["id"])
+            self.assertEqual(TaskRunStatusEnum.PENDING, events[0][1]["status"])
+
+            self.assertEqual(events, self.get_events(sub_task))
+            self.assertEqual([], self.get_events(sub_other_task))
+
+        run.set_status(TaskRunStatusEnum.RUNNING)
+        logs = [run.add_log_out(f"out {i}") for i in range(5)]
+
+        with self.subTest("Новые логи и смена статуса"):
+            self.feed.poll()
+            self.assertEqual(
+                ["task_run"], [name for name, _ in self.get_events(sub_all)]
+            )
+
+            events = self.get_events(sub_task)
+            self.assertEqual(["logs", "task_run"], [name for name, _ in events])
+            self.assertEqual(run.id, events[0][1]["task_run_id"])
+            self.assertEqual(logs[2].id, events[0][1]["last_id"])
+            self.assertEqual(
+                [log.id for log in logs[:3]],
+                [log["id"] for log in events[0][1]["logs"]],
+            )
+            self.assertEqual(TaskRunStatusEnum.RUNNING, events[1][1]["status"])
+
+            self.assertEqual([], self.get_events(sub_other_task))
+
+        with self.subTest("Оставшиеся логи"):
+            self.feed.poll()
+            events = self.get_events(sub_task)
+            self.assertEqual(["logs"], [name for name, _ in events])
+            self.assertEqual(
+                [log.id for log in logs[3:]],
+                [log["id"] for log in events[0][1]["logs"]],
+            )
+
+        run.set_status(TaskRunStatusEnum.FINISHED)
+        Notification.add(
+            task_run=run,
+            name="name",
+            text="text",
+            kind=NotificationKindEnum.EMAIL,
+        )
+
+        with self.subTest("Завершение запуска и уведомление"):
+            self.feed.poll()
+            events = self.get_events(sub_all)
+            self.assertEqual(
+                ["task_run", "notifications"], [name for name, _ in events]
+            )
+            self.assertEqual(TaskRunStatusEnum.FINISHED, events[0][1]["status"])
+            self.assertEqual(dict(number=1), events[1][1])
+
+            self.assertEqual([], self.feed.poll())
+
+        with self.subTest("Новый подписчик получает количество уведомлений"):
+            sub = self.feed.subscribe(start=False)
+            self.assertEqual([("notifications", dict(number=1))], self.get_events(sub))
+
+    def test_overflow(self) -> None:
+        self.feed.subscription_max_size = 1
+        sub = self.feed.subscribe(start=False)
+
+        self.feed.poll()
+        self.assertFalse(sub.is_closed)
+
+        self.task.add_or_get_run()
+        self.feed.poll()
+        self.assertTrue(sub.is_closed)
+
+        self.feed.unsubscribe(sub)
+        self.assertEqual(0, self.feed.number_of_subscriptions)
+
+    def test_events(self) -> None:
+        with (
+            mock.patch.object(api, "CHANGE_FEED", self.feed),
+            mock.patch.object(
+                self.feed, "subscribe", partial(self.feed.subscribe, start=False)
+            ),
+        ):
+            rs = self.client.get(
+                "/api/events",
+                query_string=dict(task_id=self.task.id),
+                buffered=False,
+            )
+            self.assertEqual(rs.status_code, HTTPStatus.OK.value)
+            self.assertEqual(rs.mimetype, "text/event-stream")
+            self.assertEqual(1, self.feed.number_of_subscriptions)
+
+            self.assertEqual("retry: 1000\n\n", next(rs.response).decode("utf-8"))
+
+            self.feed.poll()
+
+            self.assertEqual(
+                "event: notifications\ndata: " + json.dumps(dict(number=0)) + "\n\n",
+                next(rs.response).decode("utf-8"),
+            )
+
+            rs.close()
+            self.assertEqual(0, self.feed.number_of_subscriptions)